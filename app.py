@@ -1,4 +1,27 @@
-from flask import Flask
+from flask import Flask, Response, abort, jsonify, request
+
+from modules.database.keyword_index import SEARCH_MODES, search_keywords
+from modules.database.read_api import (
+    blog_detail,
+    blogs_page,
+    cached_read,
+    clamp_page_size,
+    keywords_page,
+    products_page,
+)
+from modules.ecommerce.shopify_webhook_sync_module import (
+    WEBHOOK_TOPICS,
+    enqueue_webhook_event,
+    start_webhook_worker,
+    verify_webhook_hmac,
+    webhook_store,
+)
+from modules.jobs.job_runner import JOB_TARGETS, JobAlreadyRunning, enqueue_job, get_job, list_jobs
+from modules.monitoring.log_config import configure_logging
+from modules.monitoring.metrics import render_prometheus
+
+# 日誌經隊列由後台線程寫出，請求處理線程不做日誌 I/O
+configure_logging()
 
 app = Flask(__name__)
 
@@ -6,7 +29,123 @@ app = Flask(__name__)
 def home():
     return "AutoContentify is running!"
 
+@app.route("/metrics")
+def metrics():
+    """以 Prometheus 文本格式導出本進程的調用指標"""
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/webhooks/shopify/<resource>/<action>", methods=["POST"])
+def shopify_webhook(resource, action):
+    """接收 Shopify webhook，驗證 HMAC 後寫入本地隊列並立即返回"""
+    topic = f"{resource}/{action}"
+    if topic not in WEBHOOK_TOPICS:
+        abort(404)
+    # 按店鋪域名找到配置中的店鋪，並用該店鋪的密鑰驗證
+    store = webhook_store(request.headers.get("X-Shopify-Shop-Domain"))
+    if store is None or not verify_webhook_hmac(request.get_data(), request.headers.get("X-Shopify-Hmac-Sha256"), store):
+        abort(401)
+
+    payload = request.get_json(silent=True)
+    if not payload or "id" not in payload:
+        abort(400)
+    enqueue_webhook_event(topic, payload, webhook_id=request.headers.get("X-Shopify-Webhook-Id"),
+                          store_id=store["STORE_ID"])
+    return "", 200
+
+@app.route("/jobs", methods=["GET"])
+def jobs():
+    """列出最近的後台任務"""
+    return jsonify(jobs=list_jobs(), available=sorted(JOB_TARGETS))
+
+@app.route("/jobs/<name>", methods=["POST"])
+def trigger_job(name):
+    """將流水線步驟加入後台隊列，立即返回任務記錄"""
+    if name not in JOB_TARGETS:
+        abort(404)
+    try:
+        job = enqueue_job(name)
+    except JobAlreadyRunning as e:
+        return jsonify(error="job already running", job_id=e.job_id), 409
+    return jsonify(job), 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """查詢任務狀態"""
+    job = get_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+@app.route("/jobs/<job_id>/progress", methods=["GET"])
+def job_progress(job_id):
+    """查詢任務進度"""
+    job = get_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(id=job["id"], status=job["status"], progress=job["progress"])
+
+def _cached_json(dataset, key, loader):
+    """
+    從讀緩存返回 JSON：ETag 匹配時返回 304，客戶端接受 gzip 時返回預先壓縮的響應體。
+    """
+    cached = cached_read(dataset, key, loader)
+    if cached is None:
+        abort(404)
+    if request.if_none_match.contains(cached.etag):
+        response = Response(status=304)
+    elif cached.gzipped is not None and request.accept_encodings["gzip"]:
+        response = Response(cached.gzipped, mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(cached.body, mimetype="application/json")
+    response.set_etag(cached.etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+def _page_args():
+    """解析分頁參數 ?after=<上一頁的 next_after>&limit=<條數>"""
+    try:
+        return int(request.args.get("after", 0)), clamp_page_size(request.args.get("limit"))
+    except ValueError:
+        abort(400)
+
+@app.route("/api/blogs", methods=["GET"])
+def api_blogs():
+    """按 id 分頁的博客列表（不含正文）"""
+    after, limit = _page_args()
+    return _cached_json("blogs", ("page", after, limit), lambda: blogs_page(after, limit))
+
+@app.route("/api/blogs/<int:blog_id>", methods=["GET"])
+def api_blog(blog_id):
+    """單篇博客（含正文）"""
+    return _cached_json("blogs", ("detail", blog_id), lambda: blog_detail(blog_id))
+
+@app.route("/api/products", methods=["GET"])
+def api_products():
+    """按 id 分頁的商品列表"""
+    after, limit = _page_args()
+    return _cached_json("products", ("page", after, limit), lambda: products_page(after, limit))
+
+@app.route("/api/keywords", methods=["GET"])
+def api_keywords():
+    """按機會分數排名分頁的關鍵詞"""
+    after, limit = _page_args()
+    return _cached_json("keywords", ("page", after, limit), lambda: keywords_page(after, limit))
+
+@app.route("/api/keywords/search", methods=["GET"])
+def api_keyword_search():
+    """按前綴、子串或模糊匹配查找關鍵詞：?q=<文本>&mode=prefix|contains|fuzzy&limit=<條數>"""
+    mode = request.args.get("mode", "prefix")
+    if mode not in SEARCH_MODES:
+        abort(400)
+    _, limit = _page_args()
+    results = search_keywords(request.args.get("q", ""), mode, limit)
+    return jsonify([{"keyword": keyword, "avg_monthly_searches": searches} for keyword, searches in results])
+
 if __name__ == "__main__":
+    # 後台線程批量應用 Shopify webhook 事件；用其他 WSGI 服務器運行時，
+    # 另起 `python -m modules.ecommerce.shopify_webhook_sync_module --follow`
+    start_webhook_worker()
     # 運行在 80 端口
     app.run(host="0.0.0.0", port=80)
-
@@ -0,0 +1,97 @@
+"""
+In-process stand-in for `modules.api.google_ads_api` keyword services.
+
+Installed into `sys.modules` before the keyword modules are imported, so they
+never load Google Ads credentials or open gRPC channels. Only functions that the
+real module defines, with the same parameters, can be faked: the real module is
+read with `ast` (importing it needs credentials) and `install` raises
+AttributeError for anything else, so the benchmark fails when the keyword
+modules call something the API module does not provide.
+"""
+import ast
+import inspect
+import os
+import sys
+import time
+import types
+
+API_MODULE_PATH = os.path.join(os.path.dirname(__file__), "..", "modules", "api", "google_ads_api.py")
+
+COMPETITION_LEVELS = ("LOW", "MEDIUM", "HIGH")
+
+
+def _real_signatures():
+    """Parameter names of the top-level functions in the real google_ads_api module."""
+    with open(API_MODULE_PATH) as f:
+        tree = ast.parse(f.read())
+    return {
+        node.name: [arg.arg for arg in node.args.args]
+        for node in tree.body if isinstance(node, ast.FunctionDef)
+    }
+
+
+def _patch(module, real, func):
+    if func.__name__ not in real:
+        raise AttributeError(f"modules.api.google_ads_api has no function {func.__name__!r} to fake")
+    params = list(inspect.signature(func).parameters)
+    if params != real[func.__name__]:
+        raise AttributeError(f"fake {func.__name__}{tuple(params)} does not match "
+                             f"the real signature {tuple(real[func.__name__])}")
+    setattr(module, func.__name__, func)
+
+
+class FakeGoogleAdsClient:
+    login_customer_id = "0000000000"
+
+
+def install(latency=0.0, ideas_per_keyword=3):
+    """Register the fake module; `latency` is slept once per API call."""
+    module = types.ModuleType("modules.api.google_ads_api")
+    module.calls = 0
+
+    def load_google_ads_client():
+        return FakeGoogleAdsClient()
+
+    def generate_keyword_ideas(client, customer_id, location_ids, language_id, keyword_texts, page_url=None):
+        module.calls += 1
+        if latency:
+            time.sleep(latency)
+        return [
+            {
+                "text": f"{keyword} idea {i}",
+                "avg_monthly_searches": (len(keyword) * 37 + i * 101) % 5000,
+                "competition": COMPETITION_LEVELS[(len(keyword) + i) % 3],
+            }
+            for keyword in keyword_texts
+            for i in range(ideas_per_keyword)
+        ]
+
+    def generate_keyword_historical_metrics(client, customer_id, keywords):
+        module.calls += 1
+        if latency:
+            time.sleep(latency)
+        return [
+            {
+                "keyword": keyword,
+                "avg_monthly_searches": (len(keyword) * 53) % 8000,
+                "competition": COMPETITION_LEVELS[len(keyword) % 3],
+                "competition_index": len(keyword) * 3 % 100,
+                "low_bid_range": 250000,
+                "high_bid_range": 2500000,
+                "low_top_of_page_bid_micros": 300000,
+                "high_top_of_page_bid_micros": 2200000,
+                "low_top_of_page_bid_percentile": 20,
+                "high_top_of_page_bid_percentile": 80,
+                "monthly_search_volumes": [
+                    {"year": 2024, "month": month, "monthly_searches": (len(keyword) * 53 + month * 17) % 8000}
+                    for month in range(1, 13)
+                ],
+            }
+            for keyword in keywords
+        ]
+
+    real = _real_signatures()
+    for func in (load_google_ads_client, generate_keyword_ideas, generate_keyword_historical_metrics):
+        _patch(module, real, func)
+    sys.modules["modules.api.google_ads_api"] = module
+    return module
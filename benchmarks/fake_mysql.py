@@ -0,0 +1,282 @@
+"""
+Throwaway MySQL stand-in for benchmarks: a SQLite file behind a PyMySQL-like API.
+
+Only the MySQL dialect used by the pipeline modules is translated
+(`%s` placeholders, ON DUPLICATE KEY UPDATE, INSERT IGNORE, NOW(), schema
+prefixes, locking clauses, the information_schema column check, and the
+`CREATE TABLE ... LIKE` / `RENAME TABLE` pair used to swap in a staging table).
+"""
+import re
+import sqlite3
+import threading
+
+from modules.monitoring.metrics import timed
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS keywords (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        keyword TEXT NOT NULL UNIQUE,
+        avg_monthly_searches INTEGER DEFAULT 0,
+        competition_level TEXT,
+        competition_index INTEGER DEFAULT 0,
+        low_bid_range REAL DEFAULT 0,
+        high_bid_range REAL DEFAULT 0,
+        low_top_of_page_bid_micros INTEGER DEFAULT 0,
+        high_top_of_page_bid_micros INTEGER DEFAULT 0,
+        low_top_of_page_bid_percentile REAL DEFAULT 0,
+        high_top_of_page_bid_percentile REAL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS keyword_monthly_volumes (
+        keyword TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        searches INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (keyword, year, month)
+    );
+    CREATE TABLE IF NOT EXISTS keyword_scores (
+        keyword TEXT NOT NULL PRIMARY KEY,
+        opportunity_score REAL NOT NULL,
+        opportunity_rank INTEGER NOT NULL,
+        trend_slope REAL NOT NULL DEFAULT 0,
+        scored_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_keyword_scores_score ON keyword_scores (opportunity_score);
+    CREATE TABLE IF NOT EXISTS google_ads_mirror (
+        customer_id TEXT NOT NULL,
+        resource_name TEXT NOT NULL,
+        entity_type TEXT NOT NULL,
+        parent_resource_name TEXT NOT NULL DEFAULT '',
+        name TEXT NOT NULL,
+        status TEXT NOT NULL,
+        detail TEXT,
+        PRIMARY KEY (customer_id, resource_name)
+    );
+    CREATE TABLE IF NOT EXISTS google_ads_mirror_state (
+        customer_id TEXT NOT NULL PRIMARY KEY,
+        refreshed_at TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS blogs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        shopify_article_id INTEGER UNIQUE,
+        title TEXT,
+        content TEXT,
+        content_hash TEXT,
+        last_updated_at TEXT,
+        store_id TEXT,
+        synced_to_shopify INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        shopify_product_id INTEGER NOT NULL UNIQUE,
+        name TEXT,
+        description TEXT,
+        price REAL,
+        stock INTEGER,
+        category_id TEXT,
+        created_at TEXT,
+        updated_at TEXT,
+        vendor TEXT,
+        weight REAL,
+        images TEXT,
+        inventory_policy TEXT,
+        status TEXT,
+        weight_unit TEXT,
+        content_hash TEXT,
+        store_id TEXT,
+        handle TEXT,
+        last_updated_at TEXT
+    );
+    CREATE TABLE IF NOT EXISTS product_images (
+        image_id INTEGER PRIMARY KEY,
+        shopify_product_id INTEGER NOT NULL,
+        position INTEGER NOT NULL DEFAULT 1,
+        src TEXT NOT NULL,
+        alt TEXT,
+        variant_ids TEXT,
+        image_hash TEXT NOT NULL,
+        last_updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_product_images_product ON product_images (shopify_product_id, position, src);
+    CREATE TABLE IF NOT EXISTS variant_snapshots (
+        variant_id INTEGER NOT NULL,
+        captured_at TEXT NOT NULL,
+        price REAL,
+        inventory_quantity INTEGER,
+        PRIMARY KEY (variant_id, captured_at)
+    );
+    CREATE TABLE IF NOT EXISTS product_variants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER,
+        variant_id INTEGER NOT NULL UNIQUE,
+        variant_title TEXT,
+        price REAL,
+        sku TEXT,
+        inventory_quantity INTEGER,
+        variant_weight REAL,
+        variant_weight_unit TEXT,
+        created_at TEXT,
+        last_updated_at TEXT
+    );
+"""
+
+# (pattern, replacement) applied in order to every statement
+_REWRITES = [
+    (re.compile(r"\becommerce_data_db\."), ""),
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"\bVALUES\s*\(\s*(\w+)\s*\)", re.IGNORECASE), r"excluded.\1"),
+    (re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.IGNORECASE), "ON CONFLICT DO UPDATE SET"),
+    (re.compile(r"\bINSERT\s+IGNORE\b", re.IGNORECASE), "INSERT OR IGNORE"),
+    (re.compile(r"\b(CURRENT_TIMESTAMP|NOW)\s*\(\s*\d*\s*\)", re.IGNORECASE), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\bFOR\s+UPDATE(\s+SKIP\s+LOCKED)?\b", re.IGNORECASE), ""),
+    (re.compile(r"\bIF\s*\(", re.IGNORECASE), "IIF("),
+    (re.compile(r";\s*$"), ""),
+]
+
+_COLUMN_CHECK = re.compile(r"information_schema\.COLUMNS", re.IGNORECASE)
+# SCHEMA already creates every table, so MySQL DDL from the modules is skipped
+_DDL = re.compile(r"^\s*(CREATE\s+TABLE\s+IF\s+NOT\s+EXISTS|ALTER\s+TABLE)\b", re.IGNORECASE)
+# Rewritten by hand into the SQLite equivalents; CREATE TABLE ... LIKE copies the columns but not the indexes
+_CREATE_LIKE = re.compile(r"^\s*CREATE\s+TABLE\s+(\w+)\s+LIKE\s+(\w+)\s*$", re.IGNORECASE)
+_RENAME = re.compile(r"^\s*RENAME\s+TABLE\s+(.+?)\s*$", re.IGNORECASE | re.DOTALL)
+_RENAME_PAIR = re.compile(r"^(\w+)\s+TO\s+(\w+)$", re.IGNORECASE)
+# SQLite has no partitions; reporting none is enough for the partition maintenance
+_PARTITION_CHECK = re.compile(r"information_schema\.PARTITIONS", re.IGNORECASE)
+
+
+def _operation(query):
+    return query.lstrip().split(None, 1)[0].lower()
+
+
+def translate(query):
+    """Rewrite a MySQL statement into the SQLite dialect."""
+    for pattern, replacement in _REWRITES:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        rows, self.rows = self.rows, []
+        return iter(rows)
+
+    def _run(self, query, args):
+        if _COLUMN_CHECK.search(query):
+            table_name, column_name = args
+            columns = self.connection.sqlite.execute(f"PRAGMA table_info({table_name})").fetchall()
+            return [{"column_count": int(any(column[1] == column_name for column in columns))}], 0, None
+        if _DDL.match(query) or _PARTITION_CHECK.search(query):
+            return [], 0, None
+        if _CREATE_LIKE.match(query) or _RENAME.match(query):
+            with self.connection.lock:
+                for statement in self._table_ddl(query):
+                    self.connection.sqlite.execute(statement)
+            return [], 0, None
+
+        sql = translate(query)
+        is_upsert = sql.lstrip().upper().startswith("INSERT") and "ON CONFLICT" in sql.upper()
+        if is_upsert:
+            # SQLite keeps lastrowid unchanged on the update path; MySQL reports the row id
+            sql += " RETURNING rowid AS id"
+        with timed("mysql", _operation(query)), self.connection.lock:
+            cursor = self.connection.sqlite.execute(sql, tuple(args or ()))
+            rows = [dict(row) for row in cursor.fetchall()] if cursor.description else []
+        if is_upsert:
+            return [], 1, rows[0]["id"] if rows else None
+        return rows, cursor.rowcount, cursor.lastrowid
+
+    def _table_ddl(self, query):
+        match = _CREATE_LIKE.match(query)
+        if match:
+            new_table, source_table = match.groups()
+            (source_sql,) = self.connection.sqlite.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (source_table,)
+            ).fetchone()
+            return [re.sub(r"^CREATE TABLE\s+(IF NOT EXISTS\s+)?(\"?)\w+\2", f"CREATE TABLE {new_table}",
+                           source_sql, flags=re.IGNORECASE)]
+        pairs = [_RENAME_PAIR.match(pair.strip()).groups() for pair in _RENAME.match(query).group(1).split(",")]
+        return [f"ALTER TABLE {old} RENAME TO {new}" for old, new in pairs]
+
+    def execute(self, query, args=None):
+        self.rows, self.rowcount, self.lastrowid = self._run(query, args)
+        return self.rowcount
+
+    def executemany(self, query, seq_of_args):
+        sql = translate(query)
+        with timed("mysql", _operation(query)), self.connection.lock:
+            cursor = self.connection.sqlite.executemany(sql, [tuple(args) for args in seq_of_args])
+        self.rows, self.rowcount = [], cursor.rowcount
+        return self.rowcount
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        self.rows = []
+
+
+class FakeConnection:
+    """One PyMySQL-style connection; every connection opens the same SQLite file."""
+
+    def __init__(self, path, lock):
+        self.sqlite = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level="DEFERRED")
+        self.sqlite.row_factory = sqlite3.Row
+        self.lock = lock
+
+    def cursor(self, cursorclass=None):
+        return FakeCursor(self)
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        with self.lock:
+            self.sqlite.commit()
+
+    def rollback(self):
+        with self.lock:
+            self.sqlite.rollback()
+
+    def close(self):
+        self.sqlite.close()
+
+
+class FakeMySQLStore:
+    """A throwaway database file plus a `connect_db` replacement bound to it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        setup = sqlite3.connect(path)
+        setup.execute("PRAGMA journal_mode=WAL")
+        setup.executescript(SCHEMA)
+        setup.close()
+
+    def connect_db(self):
+        return FakeConnection(self.path, self.lock)
+
+    def count(self, table_name):
+        connection = self.connect_db()
+        try:
+            return connection.sqlite.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        finally:
+            connection.close()
@@ -0,0 +1,95 @@
+"""
+Local OpenAI chat-completions stub with configurable latency.
+
+Replies are shaped after the pipeline prompts: a JSON array of titles for the
+blog title prompt, an RSA JSON object when headlines are requested, and a long
+HTML article otherwise.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BLOG_HTML = "<p>Introduction paragraph.</p>" + "".join(
+    f"<h2>Section {i}</h2><p>" + "Detailed synthetic content for benchmarking. " * 12 + "</p>" for i in range(6)
+)
+
+
+def fake_reply(prompt):
+    if "headlines" in prompt:
+        return json.dumps({
+            "headlines": [f"Eco Packaging Deal {i}" for i in range(15)],
+            "descriptions": [f"Durable, recyclable packaging shipped fast. Offer {i}." for i in range(4)],
+        })
+    if "博客標題" in prompt:
+        return json.dumps([{"title": f"Synthetic blog title {i}"} for i in range(5)])
+    return BLOG_HTML
+
+
+class FakeOpenAI:
+    """Run the stub on a random local port; point OPENAI_BASE_URL at `base_url`."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; Nagle would add ~40 ms per call
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if stub.latency:
+                    time.sleep(stub.latency)
+                with stub.lock:
+                    stub.requests += 1
+                    request_id = stub.requests
+                prompt = request.get("messages", [{}])[-1].get("content", "")
+                content = fake_reply(prompt)
+                body = json.dumps({
+                    "id": f"chatcmpl-{request_id}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "fake"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": len(prompt) // 4,
+                        "completion_tokens": len(content) // 4,
+                        "total_tokens": (len(prompt) + len(content)) // 4,
+                    },
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -0,0 +1,250 @@
+"""
+Local Shopify Admin REST stub serving N synthetic products and articles.
+
+The GraphQL endpoint only understands aliased `articleCreate` / `articleUpdate`
+mutations, as sent by `publish_shopify_articles`.
+
+Pagination follows Shopify: `limit` plus opaque `page_info` cursors in the
+`Link` response header. Products honour `fields=` (top-level keys only, as on Shopify). Every response carries `X-Shopify-Shop-Api-Call-Limit`
+from a leaky bucket, and calls over the bucket get a 429 with `Retry-After`.
+"""
+import base64
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+API_PREFIX = "/admin/api/2023-10"
+GRAPHQL_PATH = "/admin/api/2024-10/graphql.json"
+GRAPHQL_MUTATION = re.compile(r"(a\d+): (articleCreate|articleUpdate)\((?:id: \$(\w+), )?article: \$(\w+)\)")
+ARTICLE_BODY = "<p>" + "Synthetic article paragraph about eco-friendly packaging. " * 40 + "</p>"
+
+
+def synthetic_product(index):
+    """A product with every field the 2023-10 REST API returns, not just the ones the sync stores."""
+    product_id = 1_000_000 + index
+    timestamps = {"created_at": "2024-01-01T00:00:00-00:00", "updated_at": "2024-06-01T00:00:00-00:00"}
+    variants = [
+        {
+            "id": product_id * 10 + v,
+            "product_id": product_id,
+            "title": f"Size {v}",
+            "price": f"{10 + index % 50}.{v}9",
+            "sku": f"SKU-{index}-{v}",
+            "position": v + 1,
+            "inventory_policy": "deny",
+            "compare_at_price": None,
+            "fulfillment_service": "manual",
+            "inventory_management": "shopify",
+            "option1": f"Size {v}",
+            "option2": None,
+            "option3": None,
+            **timestamps,
+            "taxable": True,
+            "barcode": f"0{product_id * 10 + v:012d}",
+            "grams": 500 + 1000 * v,
+            "image_id": None,
+            "weight": 0.5 + v,
+            "weight_unit": "kg",
+            "inventory_item_id": 40_000_000 + product_id * 10 + v,
+            "inventory_quantity": (index * 7 + v) % 500,
+            "old_inventory_quantity": (index * 7 + v) % 500,
+            "requires_shipping": True,
+            "admin_graphql_api_id": f"gid://shopify/ProductVariant/{product_id * 10 + v}",
+        }
+        for v in range(2)
+    ]
+    images = [
+        {"id": product_id * 10 + i, "alt": None, "position": i + 1, "product_id": product_id, **timestamps,
+         "admin_graphql_api_id": f"gid://shopify/ProductImage/{product_id * 10 + i}",
+         "width": 2048, "height": 2048, "src": f"https://cdn.example.com/p/{index}/{i}.jpg", "variant_ids": []}
+        for i in range(2)
+    ]
+    return {
+        "id": product_id,
+        "title": f"Product {index}",
+        "body_html": f"<p>Description of product {index}</p>",
+        "vendor": "Bench Vendor",
+        "product_type": "Packaging",
+        **timestamps,
+        "handle": f"product-{index}",
+        "published_at": "2024-01-01T00:00:00-00:00",
+        "template_suffix": None,
+        "published_scope": "global",
+        "tags": "eco, packaging, recyclable",
+        "status": "active",
+        "admin_graphql_api_id": f"gid://shopify/Product/{product_id}",
+        "variants": variants,
+        "options": [{"id": product_id * 10, "product_id": product_id, "name": "Size", "position": 1,
+                     "values": [variant["option1"] for variant in variants]}],
+        "images": images,
+        "image": images[0],
+    }
+
+
+def synthetic_article(index, blog_id):
+    return {
+        "id": 5_000_000 + index,
+        "blog_id": blog_id,
+        "title": f"Article {index}",
+        "body_html": ARTICLE_BODY,
+        "handle": f"article-{index}",
+        "created_at": "2024-01-01T00:00:00-00:00",
+        "updated_at": "2024-06-01T00:00:00-00:00",
+    }
+
+
+class LeakyBucket:
+    def __init__(self, size, leak_rate):
+        self.size = size
+        self.leak_rate = leak_rate
+        self.used = 0.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Returns `(allowed, used)`."""
+        with self.lock:
+            now = time.monotonic()
+            self.used = max(0.0, self.used - (now - self.updated_at) * self.leak_rate)
+            self.updated_at = now
+            if self.used + 1 > self.size:
+                return False, int(self.used)
+            self.used += 1
+            return True, int(self.used)
+
+
+class FakeShopify:
+    """Run the stub on a random local port in a background thread."""
+
+    def __init__(self, product_count=0, article_count=0, blog_id=1, bucket_size=40, leak_rate=1000.0, latency=0.0):
+        self.product_count = product_count
+        self.article_count = article_count
+        self.blog_id = blog_id
+        self.bucket = LeakyBucket(bucket_size, leak_rate)
+        self.latency = latency
+        self.created_articles = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _page(self, path, query, total, make_item):
+        params = parse_qs(query)
+        limit = min(int(params.get("limit", ["50"])[0]), 250)
+        offset = int(base64.urlsafe_b64decode(params["page_info"][0]).decode()) if "page_info" in params else 0
+        items = [make_item(index) for index in range(offset, min(offset + limit, total))]
+        if "fields" in params:
+            fields = params["fields"][0].split(",")
+            items = [{field: item[field] for field in fields if field in item} for item in items]
+        link = None
+        if offset + limit < total:
+            cursor = base64.urlsafe_b64encode(str(offset + limit).encode()).decode()
+            link = f'<{self.url}{path}?{urlencode({"limit": limit, "page_info": cursor})}>; rel="next"'
+        return items, link
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; Nagle would add ~40 ms per call
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, link=None, used=0, retry_after=None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.send_header("X-Shopify-Shop-Api-Call-Limit", f"{used}/{stub.bucket.size}")
+                if link:
+                    self.send_header("Link", link)
+                if retry_after is not None:
+                    self.send_header("Retry-After", str(retry_after))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _admit(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                allowed, used = stub.bucket.take()
+                if not allowed:
+                    self._send(429, {"errors": "Exceeded 2 calls per second for api client."},
+                               used=used, retry_after=1.0 / stub.bucket.leak_rate)
+                return allowed, used
+
+            def do_GET(self):
+                allowed, used = self._admit()
+                if not allowed:
+                    return
+                parsed = urlparse(self.path)
+                if parsed.path == f"{API_PREFIX}/products.json":
+                    items, link = stub._page(parsed.path, parsed.query, stub.product_count, synthetic_product)
+                    self._send(200, {"products": items}, link, used)
+                elif parsed.path == f"{API_PREFIX}/blogs/{stub.blog_id}/articles.json":
+                    items, link = stub._page(parsed.path, parsed.query, stub.article_count,
+                                             lambda index: synthetic_article(index, stub.blog_id))
+                    self._send(200, {"articles": items}, link, used)
+                else:
+                    self._send(404, {"errors": "Not Found"}, used=used)
+
+            def _graphql(self, request, used):
+                data = {}
+                variables = request.get("variables", {})
+                for alias, mutation, id_variable, article_variable in GRAPHQL_MUTATION.findall(request["query"]):
+                    if mutation == "articleCreate":
+                        with stub.lock:
+                            stub.created_articles += 1
+                            article_id = f"gid://shopify/Article/{9_000_000 + stub.created_articles}"
+                    else:
+                        article_id = variables[id_variable]
+                    data[alias] = {"article": {"id": article_id}, "userErrors": []}
+                cost = 10 * len(data)
+                self._send(200, {"data": data, "extensions": {"cost": {
+                    "requestedQueryCost": cost, "actualQueryCost": cost,
+                    "throttleStatus": {"maximumAvailable": 2000.0, "currentlyAvailable": 2000 - cost,
+                                       "restoreRate": 100.0},
+                }}}, used=used)
+
+            def _write_article(self):
+                # Read the body first so a 429 leaves the keep-alive connection clean
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                article = request.get("article", {})
+                allowed, used = self._admit()
+                if not allowed:
+                    return
+                if self.path == GRAPHQL_PATH:
+                    self._graphql(request, used)
+                    return
+                match = re.match(rf"{API_PREFIX}/blogs/{stub.blog_id}/articles(?:/(\d+))?\.json$", self.path)
+                if not match:
+                    self._send(404, {"errors": "Not Found"}, used=used)
+                    return
+                if not match.group(1):
+                    with stub.lock:
+                        stub.created_articles += 1
+                        article["id"] = 9_000_000 + stub.created_articles
+                self._send(200 if match.group(1) else 201, {"article": article}, used=used)
+
+            do_POST = _write_article
+            do_PUT = _write_article
+
+        return Handler
@@ -0,0 +1,272 @@
+"""
+Offline end-to-end benchmarks for the ecommerce pipeline modules.
+
+Every scenario runs in a fresh subprocess against local fakes (Shopify REST stub,
+OpenAI stub, in-process Google Ads keyword service and a throwaway SQLite-backed
+MySQL stand-in) and reports rows/sec, p50/p99 call latency and peak RSS.
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --scenarios product_sync blog_pull --scales 1000 10000
+    python -m benchmarks.run_benchmarks --baseline logs/benchmarks/previous.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+REPORT_DIR = os.path.join(PROJECT_ROOT, "logs", "benchmarks")
+
+DEFAULT_SCALES = (1000, 10000, 100000)
+# Regressions beyond this fraction of the baseline rows/sec are reported
+REGRESSION_THRESHOLD = 0.10
+
+
+def _seed_keywords(store, count, min_searches=0):
+    connection = store.connect_db()
+    connection.sqlite.executemany(
+        "INSERT INTO keywords (keyword, avg_monthly_searches) VALUES (?, ?)",
+        ((f"keyword {i}", min_searches + i % 1000) for i in range(count)),
+    )
+    connection.sqlite.commit()
+    connection.close()
+
+
+def _seed_unsynced_blogs(store, count):
+    from benchmarks.fake_shopify import ARTICLE_BODY
+    connection = store.connect_db()
+    connection.sqlite.executemany(
+        "INSERT INTO blogs (title, content, synced_to_shopify) VALUES (?, ?, 0)",
+        ((f"Generated blog {i}", ARTICLE_BODY) for i in range(count)),
+    )
+    connection.sqlite.commit()
+    connection.close()
+
+
+def scenario_product_sync(scale, fakes, store):
+    fakes["shopify"].product_count = scale
+    from modules.ecommerce.product_sync_db_with_shopify_module import sync_products_with_shopify
+    return lambda: sync_products_with_shopify()
+
+
+def scenario_product_sync_unchanged(scale, fakes, store):
+    fakes["shopify"].product_count = scale
+    from modules.ecommerce.product_sync_db_with_shopify_module import sync_products_with_shopify
+    sync_products_with_shopify()  # first pass fills the store, the timed pass finds nothing changed
+    return lambda: sync_products_with_shopify()
+
+
+def scenario_blog_pull(scale, fakes, store):
+    fakes["shopify"].article_count = scale
+    from modules.ecommerce.blog_sync_db_with_shopify_module import sync_shopify_to_db
+    return lambda: sync_shopify_to_db()
+
+
+def scenario_blog_push(scale, fakes, store):
+    _seed_unsynced_blogs(store, scale)
+    from modules.ecommerce.blog_sync_db_with_shopify_module import sync_db_to_shopify
+    return lambda: sync_db_to_shopify()
+
+
+def scenario_blog_pull_async(scale, fakes, store):
+    fakes["shopify"].article_count = scale
+    from modules.ecommerce.blog_sync_db_with_shopify_module import sync_shopify_to_db_async
+    return lambda: asyncio.run(sync_shopify_to_db_async())
+
+
+def scenario_blog_push_async(scale, fakes, store):
+    _seed_unsynced_blogs(store, scale)
+    from modules.ecommerce.blog_sync_db_with_shopify_module import sync_db_to_shopify_async
+    return lambda: asyncio.run(sync_db_to_shopify_async())
+
+
+def scenario_keyword_plan(scale, fakes, store):
+    _seed_keywords(store, scale)
+    from modules.ecommerce.google_ads_keyword_plan import main
+    return main
+
+
+def scenario_keyword_historical(scale, fakes, store):
+    _seed_keywords(store, scale)
+    from modules.ecommerce.google_ads_keyword_historical import main
+    return main
+
+
+def scenario_keyword_scoring(scale, fakes, store):
+    _seed_keywords(store, scale)
+    from modules.ecommerce.google_ads_keyword_historical import process_keyword_chunk
+    keywords = [f"keyword {i}" for i in range(scale)]
+    for start in range(0, len(keywords), 1000):
+        process_keyword_chunk(keywords[start:start + 1000])
+    from modules.ecommerce.google_ads_keyword_scoring import score_keywords
+    return score_keywords
+
+
+def scenario_blog_generator(scale, fakes, store):
+    _seed_keywords(store, scale, min_searches=100)
+    from modules.ecommerce.blog_generator_db_with_openai_module import process_keyword_chunk
+    keywords = [f"keyword {i}" for i in range(scale)]
+
+    def run():
+        # Same chunking the distributed workers use
+        for start in range(0, len(keywords), 20):
+            process_keyword_chunk(keywords[start:start + 20])
+    return run
+
+
+SCENARIOS = {
+    "product_sync": scenario_product_sync,
+    "product_sync_unchanged": scenario_product_sync_unchanged,
+    "blog_pull": scenario_blog_pull,
+    "blog_push": scenario_blog_push,
+    "blog_pull_async": scenario_blog_pull_async,
+    "blog_push_async": scenario_blog_push_async,
+    "keyword_plan": scenario_keyword_plan,
+    "keyword_historical": scenario_keyword_historical,
+    "keyword_scoring": scenario_keyword_scoring,
+    "blog_generator": scenario_blog_generator,
+}
+
+
+def run_child(scenario, scale, shopify_latency, openai_latency, google_ads_latency):
+    """Set up the fakes, run one scenario in this process and return its measurements."""
+    workdir = tempfile.mkdtemp(prefix="autocontentify-bench-")
+    sys.path.insert(0, PROJECT_ROOT)
+
+    from benchmarks import fake_google_ads
+    from benchmarks.fake_mysql import FakeMySQLStore
+    from benchmarks.fake_openai import FakeOpenAI
+    from benchmarks.fake_shopify import FakeShopify
+
+    shopify = FakeShopify(latency=shopify_latency).start()
+    openai_stub = FakeOpenAI(latency=openai_latency).start()
+    config_path = os.path.join(workdir, "shopify_config.json")
+    with open(config_path, "w") as f:
+        json.dump({"SHOPIFY_STORE_URL": shopify.url, "ACCESS_TOKEN": "bench", "BLOG_ID": shopify.blog_id}, f)
+
+    os.environ.update({
+        "SHOPIFY_CONFIG_PATH": config_path,
+        "OPENAI_BASE_URL": openai_stub.base_url,
+        "OPENAI_API_KEY": "bench",
+        "RATE_LIMIT_STATE_DIR": os.path.join(workdir, "ratelimits"),
+        # The stubs enforce their own limits; the shared buckets must not dominate the numbers
+        "RATE_LIMIT_SHOPIFY": "100000/100000",
+        "RATE_LIMIT_OPENAI": "100000/100000",
+        "RATE_LIMIT_GOOGLE_ADS": "100000/100000",
+        "AUTOCONTENTIFY_JOBS_DIR": os.path.join(workdir, "jobs"),
+        "AUTOCONTENTIFY_LINK_INDEX_DIR": os.path.join(workdir, "link_index"),
+        "AUTOCONTENTIFY_CACHE_VERSION_DIR": os.path.join(workdir, "cache_versions"),
+        "AUTOCONTENTIFY_KEYWORD_INDEX_DIR": os.path.join(workdir, "keyword_index"),
+    })
+    fake_google_ads.install(latency=google_ads_latency)
+
+    store = FakeMySQLStore(os.path.join(workdir, "bench.db"))
+    import modules.database.db_connection as db_connection
+    db_connection.connect_db = store.connect_db
+
+    logging.disable(logging.WARNING)
+    from modules.monitoring import metrics
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        run = SCENARIOS[scenario](scale, {"shopify": shopify, "openai": openai_stub}, store)
+        metrics.reset()
+        started = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - started
+
+    shopify.stop()
+    openai_stub.stop()
+    return {
+        "scenario": scenario,
+        "scale": scale,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(scale / seconds, 1) if seconds else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "calls": metrics.summarize()["calls"],
+    }
+
+
+def _call_percentiles(calls):
+    """p50/p99 of the slowest call type, the one that usually bounds throughput."""
+    if not calls:
+        return None, None
+    busiest = max(calls, key=lambda call: call["total_seconds"])
+    return busiest["p50_ms"], busiest["p99_ms"]
+
+
+def _compare(results, baseline_path):
+    with open(baseline_path, "r") as f:
+        baseline = {(r["scenario"], r["scale"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["scenario"], result["scale"]))
+        if not previous or not previous.get("rows_per_sec") or not result.get("rows_per_sec"):
+            continue
+        change = result["rows_per_sec"] / previous["rows_per_sec"] - 1
+        if change < -REGRESSION_THRESHOLD:
+            regressions.append((result["scenario"], result["scale"], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run offline pipeline benchmarks against local fakes.")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--scales", nargs="+", type=int, default=list(DEFAULT_SCALES))
+    parser.add_argument("--shopify-latency", type=float, default=0.0, help="seconds added to each Shopify call")
+    parser.add_argument("--openai-latency", type=float, default=0.0, help="seconds added to each OpenAI call")
+    parser.add_argument("--google-ads-latency", type=float, default=0.0, help="seconds added to each Ads call")
+    parser.add_argument("--baseline", help="previous report to compare rows/sec against")
+    parser.add_argument("--child", nargs=2, metavar=("SCENARIO", "SCALE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    latencies = (args.shopify_latency, args.openai_latency, args.google_ads_latency)
+    if args.child:
+        print(json.dumps(run_child(args.child[0], int(args.child[1]), *latencies)))
+        return
+
+    results = []
+    for scenario in args.scenarios:
+        for scale in args.scales:
+            command = [
+                sys.executable, "-m", "benchmarks.run_benchmarks", "--child", scenario, str(scale),
+                "--shopify-latency", str(args.shopify_latency),
+                "--openai-latency", str(args.openai_latency),
+                "--google-ads-latency", str(args.google_ads_latency),
+            ]
+            completed = subprocess.run(command, cwd=PROJECT_ROOT, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"{scenario:<24} {scale:>8}  FAILED\n{completed.stderr.strip()}")
+                results.append({"scenario": scenario, "scale": scale, "error": completed.stderr.strip()[-2000:]})
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append(result)
+            p50, p99 = _call_percentiles(result["calls"])
+            print(f"{scenario:<24} {scale:>8}  {result['rows_per_sec']:>10} rows/s  "
+                  f"p50 {p50} ms  p99 {p99} ms  peak RSS {result['peak_rss_mb']} MB")
+
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    report_path = os.path.join(REPORT_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(report_path, "w") as f:
+        json.dump({"latencies": dict(zip(("shopify", "openai", "google_ads"), latencies)), "results": results}, f,
+                  indent=2)
+    print(f"Report written to {report_path}")
+
+    if args.baseline:
+        regressions = _compare([r for r in results if "error" not in r], args.baseline)
+        for scenario, scale, change in regressions:
+            print(f"REGRESSION {scenario} @ {scale}: rows/sec {change:+.1%}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
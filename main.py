@@ -1,60 +1,104 @@
+import argparse
 import subprocess
 import logging
+import json
 import os
+import sys
+from datetime import datetime
+
+from modules.monitoring.log_config import configure_logging
+from modules.monitoring.metrics import write_run_summary
+from modules.monitoring.profiling import PROFILE_MODES, format_profile_summary, summarize_profiles
 
 # 確保日誌目錄存在
 log_directory = "AutoContentify/logs"
 if not os.path.exists(log_directory):
     os.makedirs(log_directory)
 
-# 配置全局日誌
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(filename)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    filename=os.path.join(log_directory, "sync_logs.log")
-)
+# 配置全局日誌：JSON 行由後台線程寫入 sync_logs.log，各步驟子進程寫入同一文件
+log_file = os.path.abspath(os.path.join(log_directory, "sync_logs.log"))
+configure_logging(log_file=log_file, console=False)
 
 logging.info("✅ 全局日誌已配置，輸出到 sync_logs.log")
 
 
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 每次運行的指標快照目錄，各步驟進程退出時寫入，最後匯總為 summary.json
+RUN_ID = datetime.now().strftime("%Y%m%d-%H%M%S")
+metrics_directory = os.path.join(log_directory, "metrics", RUN_ID)
+# 開啟性能分析時，各步驟的 pstats / 火焰圖 / 熱點報告寫到這裡
+profile_directory = os.path.join(log_directory, "profiles", RUN_ID)
+
+
+def run_step(step, module):
+    """Run one pipeline module in a subprocess, collecting its metrics for the run summary."""
+    env = dict(os.environ, AUTOCONTENTIFY_METRICS_DIR=os.path.abspath(metrics_directory), AUTOCONTENTIFY_STEP=step,
+               AUTOCONTENTIFY_LOG_FILE=log_file, AUTOCONTENTIFY_PROFILE_DIR=os.path.abspath(profile_directory))
+    subprocess.run([sys.executable, "-m", module], cwd=PROJECT_ROOT, env=env)
+
 def run_google_ads_keyword_plan():
     """Run the Google Ads Keyword Plan script."""
     print("Running Google Ads Keyword Plan...")
-    script_path = os.path.join(os.path.dirname(__file__), "google_ads_keyword_plan.py")
-    subprocess.run(["python", script_path])
+    run_step("keyword_plan", "modules.ecommerce.google_ads_keyword_plan")
 
 def run_google_ads_keyword_historical():
     """Run the Google Ads Keyword Historical script."""
     print("Running Google Ads Keyword Historical...")
-    script_path = os.path.join(os.path.dirname(__file__), "google_ads_keyword_historical.py")
-    subprocess.run(["python", script_path])
+    run_step("keyword_historical", "modules.ecommerce.google_ads_keyword_historical")
+
+def run_keyword_scoring():
+    """Score keywords by opportunity so blog generation and the read API rank fresh data."""
+    print("Running Keyword Scoring...")
+    run_step("keyword_scoring", "modules.ecommerce.google_ads_keyword_scoring")
 
 def run_blog_generator():
     """Run the Blog Generator script."""
     print("Running Blog Generator with OpenAI...")
-    script_path = os.path.join(os.path.dirname(__file__), "blog_generator_db_with_openai_module.py")
-    subprocess.run(["python", script_path])
-
-def run_blog_sync_with_shopify():
-    """Run the Blog Sync script to Shopify."""
-    print("Running Blog Sync with Shopify...")
-    script_path = os.path.join(os.path.dirname(__file__), "blog_sync_db_with_shopify_module.py")
-    subprocess.run(["python", script_path])
-
-def run_product_sync_with_shopify():
-    """Run the Product Sync script to sync products from Shopify to the local database."""
-    print("Running Product Sync with Shopify...")
-    script_path = os.path.join(os.path.dirname(__file__), "product_sync_db_with_shopify_module.py")
-    subprocess.run(["python", script_path])
+    run_step("blog_generator", "modules.ecommerce.blog_generator_db_with_openai_module")
+
+def run_store_sync():
+    """Run blog and product sync for every configured Shopify store in a process pool."""
+    print("Running Shopify Store Sync...")
+    run_step("store_sync", "modules.jobs.store_sync")
+
+def write_metrics_summary():
+    """Merge the metrics of every step into summary.json and log it."""
+    if not os.path.isdir(metrics_directory):
+        logging.warning("⚠️ 本次運行沒有收集到指標")
+        return
+    summary = write_run_summary(metrics_directory)
+    logging.info(f"📊 運行指標匯總: {json.dumps(summary, ensure_ascii=False)}")
+    print(f"Metrics summary written to {os.path.join(metrics_directory, 'summary.json')}")
+
+def write_profile_summary():
+    """Merge the profile reports of every step into summary.json and print the top hotspots."""
+    if not os.path.isdir(profile_directory):
+        return
+    summary = summarize_profiles(profile_directory)
+    with open(os.path.join(profile_directory, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    logging.info(f"🔥 性能分析匯總: {json.dumps(summary, ensure_ascii=False)}")
+    print(format_profile_summary(summary))
+    print(f"Profiles written to {profile_directory}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Run the AutoContentify pipeline.")
+    parser.add_argument("--profile", choices=PROFILE_MODES, default=os.environ.get("AUTOCONTENTIFY_PROFILE") or None,
+                        help="profile every step: 'sample' (low overhead) or 'cprofile' (also writes pstats)")
+    args = parser.parse_args()
+    if args.profile:
+        # 各步驟子進程從環境變量讀取
+        os.environ["AUTOCONTENTIFY_PROFILE"] = args.profile
+
     # Example flow, you can customize the order or conditions
     run_google_ads_keyword_plan()
     run_google_ads_keyword_historical()
+    run_keyword_scoring()
     run_blog_generator()
-    run_blog_sync_with_shopify()
-    run_product_sync_with_shopify()  # Added product sync step
+    run_store_sync()  # Blog and product sync, one process per store and step
+    write_metrics_summary()
+    write_profile_summary()
 
 
 if __name__ == "__main__":
@@ -5,16 +5,32 @@ for path in sys.path:
     print(path)
 import json
 import datetime
+import itertools
 from openai import OpenAI
 from config.common import BASE_DIR, CONFIG_DIR, setup_logger
-from modules.api.openai_api import generate_rsa_text
-from modules.database.db_connection import fetch_keywords_from_database
+from modules.api.openai_api import generate_rsa_text, validate_rsa_text
+from modules.api.rate_limiter import get_shared_limiter
+from modules.database.db_connection import iter_keywords
+from modules.database.google_ads_mirror import load_account_mirror, rsa_content_hash
+from modules.database.keyword_scores import fetch_top_keywords
+from modules.monitoring.metrics import timed
 from google.ads.googleads.client import GoogleAdsClient
 from google.ads.googleads.errors import GoogleAdsException
+from google.api_core import protobuf_helpers
 
 # 日誌初始化
 logger = setup_logger(script_name="google_ads_api")
 
+# 所有進程共享的 Google Ads API 配額
+google_ads_limiter = get_shared_limiter("google_ads")
+
+# 固定名稱：重複運行時按名稱在賬戶鏡像中找到已有的實體，而不是每次新建
+DEFAULT_CAMPAIGN_NAME = "AutoContentify Search Campaign"
+DEFAULT_AD_GROUP_NAME = "AutoContentify Ad Group"
+DEFAULT_BUDGET_MICROS = 10000000
+DEFAULT_CPC_BID_MICROS = 1000000
+FINAL_URL = "https://www.greenewrap.com"
+
 # 全局配置文件路徑
 CREDENTIALS_PATH = os.path.join(CONFIG_DIR, "google_ads_credentials.json")
 CONFIG_PATH = os.path.join(CONFIG_DIR, "google_ads.yaml")
@@ -66,13 +82,102 @@ def generate_name(prefix, entity_type):
     now = datetime.datetime.now()
     return f"{prefix} {entity_type} - {now.strftime('%Y-%m-%d-%H%M%S')}"
 
-def create_campaign(client, customer_id, campaign_type="SEARCH", budget=10000000, locations=None, languages=None):
+def generate_keyword_ideas(client, customer_id, location_ids, language_id, keyword_texts, page_url=None):
+    """
+    用 KeywordPlanIdeaService 根據種子關鍵字（和可選的網頁 URL）生成關鍵字建議。
+
+    Returns:
+        list[dict]: 每條建議為 {"text", "avg_monthly_searches", "competition"}，competition 為枚舉名（LOW/MEDIUM/HIGH）
+    """
+    try:
+        keyword_plan_idea_service = client.get_service("KeywordPlanIdeaService")
+        google_ads_service = client.get_service("GoogleAdsService")
+        geo_target_constant_service = client.get_service("GeoTargetConstantService")
+        request = client.get_type("GenerateKeywordIdeasRequest")
+        request.customer_id = customer_id
+        request.language = google_ads_service.language_constant_path(language_id)
+        request.geo_target_constants.extend(
+            geo_target_constant_service.geo_target_constant_path(location_id) for location_id in location_ids
+        )
+        request.include_adult_keywords = False
+        request.keyword_plan_network = client.enums.KeywordPlanNetworkEnum.GOOGLE_SEARCH_AND_PARTNERS
+        # 種子可以是關鍵字、網頁或兩者同時提供
+        if keyword_texts and page_url:
+            request.keyword_and_url_seed.url = page_url
+            request.keyword_and_url_seed.keywords.extend(keyword_texts)
+        elif keyword_texts:
+            request.keyword_seed.keywords.extend(keyword_texts)
+        else:
+            request.url_seed.url = page_url
+        google_ads_limiter.acquire()
+        with timed("google_ads", "generate_keyword_ideas"):
+            # 結果分頁返回，迭代時才逐頁請求
+            ideas = [
+                {
+                    "text": idea.text,
+                    "avg_monthly_searches": idea.keyword_idea_metrics.avg_monthly_searches,
+                    "competition": idea.keyword_idea_metrics.competition.name,
+                }
+                for idea in keyword_plan_idea_service.generate_keyword_ideas(request=request)
+            ]
+        logger.info(f"✅ 為 {len(keyword_texts or [])} 個種子關鍵字生成了 {len(ideas)} 條建議")
+        return ideas
+    except GoogleAdsException as e:
+        logger.error(f"❌ 生成關鍵字建議失敗: {e.failure}")
+        raise
+
+def generate_keyword_historical_metrics(client, customer_id, keywords):
+    """
+    用 KeywordPlanIdeaService 獲取關鍵字的歷史指標（單次最多 10000 個關鍵字）。
+
+    Returns:
+        list[dict]: 每個關鍵字的 {"keyword", "avg_monthly_searches", "competition", "competition_index",
+        "low_bid_range", "high_bid_range", "low_top_of_page_bid_micros", "high_top_of_page_bid_micros",
+        "monthly_search_volumes"}；出價均為 micros，API 沒有返回出價分位數
+    """
+    try:
+        keyword_plan_idea_service = client.get_service("KeywordPlanIdeaService")
+        request = client.get_type("GenerateKeywordHistoricalMetricsRequest")
+        request.customer_id = customer_id
+        request.keywords.extend(keywords)
+        request.keyword_plan_network = client.enums.KeywordPlanNetworkEnum.GOOGLE_SEARCH
+        google_ads_limiter.acquire()
+        with timed("google_ads", "generate_keyword_historical_metrics"):
+            response = keyword_plan_idea_service.generate_keyword_historical_metrics(request=request)
+        results = []
+        for result in response.results:
+            metrics = result.keyword_metrics
+            results.append({
+                "keyword": result.text,
+                "avg_monthly_searches": metrics.avg_monthly_searches,
+                "competition": metrics.competition.name,
+                "competition_index": metrics.competition_index,
+                # 出價區間即首頁頂部出價的高低值
+                "low_bid_range": metrics.low_top_of_page_bid_micros,
+                "high_bid_range": metrics.high_top_of_page_bid_micros,
+                "low_top_of_page_bid_micros": metrics.low_top_of_page_bid_micros,
+                "high_top_of_page_bid_micros": metrics.high_top_of_page_bid_micros,
+                "monthly_search_volumes": [
+                    {"year": volume.year, "month": volume.month.name, "monthly_searches": volume.monthly_searches}
+                    for volume in metrics.monthly_search_volumes
+                ],
+            })
+        logger.info(f"✅ 獲取了 {len(results)} 個關鍵字的歷史指標")
+        return results
+    except GoogleAdsException as e:
+        logger.error(f"❌ 獲取關鍵字歷史指標失敗: {e.failure}")
+        raise
+
+def create_campaign(client, customer_id, campaign_type="SEARCH", budget=DEFAULT_BUDGET_MICROS, locations=None,
+                    languages=None, campaign_name=None, mirror=None):
     """
     創建廣告系列，包含地理位置和語言設置。
+
+    未指定 `campaign_name` 時使用帶時間戳的名稱；傳入 `mirror` 時把新建的廣告系列記錄到賬戶鏡像。
     """
     try:
         if budget is None:
-            budget = 10000000
+            budget = DEFAULT_BUDGET_MICROS
         if locations is None:
             locations = ["2840"]  # 美国
         if languages is None:
@@ -84,45 +189,60 @@ def create_campaign(client, customer_id, campaign_type="SEARCH", budget=10000000
         campaign_budget.name = generate_name(campaign_type, "Budget")
         campaign_budget.delivery_method = client.enums.BudgetDeliveryMethodEnum.STANDARD
         campaign_budget.amount_micros = budget
-        budget_response = campaign_budget_service.mutate_campaign_budgets(
-            customer_id=customer_id, operations=[campaign_budget_operation]
-        )
+        google_ads_limiter.acquire()
+        with timed("google_ads", "mutate_campaign_budgets"):
+            budget_response = campaign_budget_service.mutate_campaign_budgets(
+                customer_id=customer_id, operations=[campaign_budget_operation]
+            )
         budget_resource_name = budget_response.results[0].resource_name
         campaign_operation = client.get_type("CampaignOperation")
         campaign = campaign_operation.create
-        campaign.name = generate_name(campaign_type, "Campaign")
+        campaign.name = campaign_name or generate_name(campaign_type, "Campaign")
         campaign.status = client.enums.CampaignStatusEnum.PAUSED
         campaign.campaign_budget = budget_resource_name
         campaign.advertising_channel_type = client.enums.AdvertisingChannelTypeEnum.SEARCH
         campaign.manual_cpc.enhanced_cpc_enabled = False
-        campaign_response = campaign_service.mutate_campaigns(
-            customer_id=customer_id, operations=[campaign_operation]
-        )
+        google_ads_limiter.acquire()
+        with timed("google_ads", "mutate_campaigns"):
+            campaign_response = campaign_service.mutate_campaigns(
+                customer_id=customer_id, operations=[campaign_operation]
+            )
         campaign_resource_name = campaign_response.results[0].resource_name
         logger.info(f"✅ 廣告系列已創建: {campaign.name}")
+        if mirror is not None:
+            mirror.record("campaign", campaign_resource_name, campaign.name, "PAUSED",
+                          budget=budget_resource_name, budget_amount_micros=budget)
         return campaign_resource_name
     except Exception as e:
         logger.error(f"❌ 無法創建廣告系列: {e}")
         raise
 
-def create_ad_group(client, customer_id, campaign_id):
+def create_ad_group(client, customer_id, campaign_id, ad_group_name=None, cpc_bid_micros=DEFAULT_CPC_BID_MICROS,
+                    mirror=None):
     """
     创建广告组。
+
+    未指定 `ad_group_name` 时使用带时间戳的名称；传入 `mirror` 时把新建的广告组记录到账户镜像。
     """
     try:
         ad_group_service = client.get_service("AdGroupService")
         ad_group_operation = client.get_type("AdGroupOperation")
         ad_group = ad_group_operation.create
-        ad_group.name = generate_name("", "Ad Group")
+        ad_group.name = ad_group_name or generate_name("", "Ad Group")
         ad_group.campaign = campaign_id
         ad_group.status = client.enums.AdGroupStatusEnum.ENABLED
-        ad_group.cpc_bid_micros = 1000000
+        ad_group.cpc_bid_micros = cpc_bid_micros
 
-        ad_group_response = ad_group_service.mutate_ad_groups(
-            customer_id=customer_id, operations=[ad_group_operation]
-        )
+        google_ads_limiter.acquire()
+        with timed("google_ads", "mutate_ad_groups"):
+            ad_group_response = ad_group_service.mutate_ad_groups(
+                customer_id=customer_id, operations=[ad_group_operation]
+            )
         ad_group_resource_name = ad_group_response.results[0].resource_name
         logger.info(f"✅ 广告组已创建: {ad_group.name}")
+        if mirror is not None:
+            mirror.record("ad_group", ad_group_resource_name, ad_group.name, "ENABLED", parent=campaign_id,
+                          cpc_bid_micros=cpc_bid_micros)
         return ad_group_resource_name
     except GoogleAdsException as ex:
         logger.error(f"❌ Google Ads API 错误：{ex.failure}")
@@ -131,22 +251,37 @@ def create_ad_group(client, customer_id, campaign_id):
         logger.error(f"❌ 创建广告组失败：{e}")
         raise
 
-def create_google_ads_rsa_workflow(client, openai_client, customer_id, ad_group_id):
-    try:
-        logger.info("Fetching keywords from the database...")
-        keywords = fetch_keywords_from_database()
-        if not keywords:
-            raise ValueError("No keywords found in the database.")
+def _generate_workflow_rsa_text(openai_client):
+    """按關鍵詞分數取關鍵詞並生成 RSA 文案。"""
+    logger.info("Fetching keywords from the database...")
+    # 按機會分數取前 15 個關鍵詞；還沒有評分結果時退回搜索量篩選，只讀 15 行
+    keywords = (fetch_top_keywords(limit=15)
+                or list(itertools.islice(iter_keywords(min_searches=100, fetch_size=15), 15)))
+    if not keywords:
+        raise ValueError("No keywords found in the database.")
 
-        logger.info(f"Fetched keywords: {keywords}")
+    logger.info(f"Fetched keywords: {keywords}")
 
-        logger.info("Generating RSA text using OpenAI...")
-        rsa_text = generate_rsa_text(client=openai_client, keywords=keywords[:15])
-        if not rsa_text.get("headlines") or not rsa_text.get("descriptions"):
-            raise ValueError("OpenAI failed to generate RSA text.")
+    logger.info("Generating RSA text using OpenAI...")
+    rsa_text = generate_rsa_text(client=openai_client, keywords=keywords)
+    if not rsa_text.get("headlines") or not rsa_text.get("descriptions"):
+        raise ValueError("OpenAI failed to generate RSA text.")
 
-        logger.info(f"Generated RSA text: {rsa_text}")
+    logger.info(f"Generated RSA text: {rsa_text}")
+    return rsa_text
 
+def create_google_ads_rsa_workflow(client, openai_client, customer_id, ad_group_id, mirror=None):
+    """
+    生成 RSA 文案并在广告组中创建广告。
+
+    传入 `mirror` 时，已有 RSA 广告的广告组直接复用现有广告，不再调用 OpenAI 和 Google Ads（见 ensure_rsa_ad）。
+    """
+    try:
+        if mirror is not None:
+            return ensure_rsa_ad(client, customer_id, mirror, ad_group_id,
+                                 lambda: _generate_workflow_rsa_text(openai_client))
+
+        rsa_text = _generate_workflow_rsa_text(openai_client)
         logger.info("Creating RSA ad...")
         ad_resource_name = _create_rsa_ad(client, customer_id, ad_group_id, rsa_text)
         logger.info(f"RSA ad created successfully: {ad_resource_name}")
@@ -156,11 +291,17 @@ def create_google_ads_rsa_workflow(client, openai_client, customer_id, ad_group_
         logger.error(f"Workflow failed: {e}")
         raise
 
-def _create_rsa_ad(client, customer_id: str, ad_group_id: str, rsa_text: dict):
+def _create_rsa_ad(client, customer_id: str, ad_group_id: str, rsa_text: dict, final_url: str = FINAL_URL,
+                   mirror=None):
     try:
         if not rsa_text.get("headlines") or not rsa_text.get("descriptions"):
             logger.error(f"Incomplete RSA text data: {rsa_text}")
             raise ValueError("Incomplete RSA text data.")
+        # Reject locally what the API would reject, without a failed mutate round trip
+        issues = validate_rsa_text(rsa_text)
+        if any(issues.values()):
+            logger.error(f"Invalid RSA assets: {issues}")
+            raise ValueError(f"Invalid RSA assets: {issues}")
 
         ad_group_ad_service = client.get_service("AdGroupAdService")
         ad_group_ad_operation = client.get_type("AdGroupAdOperation")
@@ -168,29 +309,42 @@ def _create_rsa_ad(client, customer_id: str, ad_group_id: str, rsa_text: dict):
         ad_group_ad.ad_group = ad_group_id
         ad_group_ad.status = client.enums.AdGroupAdStatusEnum.ENABLED
 
-        # Add headlines and descriptions
+        # Add headlines and descriptions, pinned where rsa_text asks for it
         rsa_info = ad_group_ad.ad.responsive_search_ad
-        for headline in rsa_text["headlines"]:
+        headline_pins = rsa_text.get("headline_pins") or []
+        for index, headline in enumerate(rsa_text["headlines"]):
             headline_part = client.get_type("AdTextAsset")
             headline_part.text = headline
+            if index < len(headline_pins) and headline_pins[index]:
+                headline_part.pinned_field = client.enums.ServedAssetFieldTypeEnum[f"HEADLINE_{headline_pins[index]}"]
             rsa_info.headlines.append(headline_part)
 
-        for description in rsa_text["descriptions"]:
+        description_pins = rsa_text.get("description_pins") or []
+        for index, description in enumerate(rsa_text["descriptions"]):
             description_part = client.get_type("AdTextAsset")
             description_part.text = description
+            if index < len(description_pins) and description_pins[index]:
+                description_part.pinned_field = client.enums.ServedAssetFieldTypeEnum[
+                    f"DESCRIPTION_{description_pins[index]}"
+                ]
             rsa_info.descriptions.append(description_part)
 
         # Add final URL
-        final_url = "https://www.greenewrap.com"
         ad_group_ad.ad.final_urls.append(final_url)
         logger.info(f"Final URL set: {final_url}")
 
         # Send request
-        response = ad_group_ad_service.mutate_ad_group_ads(
-            customer_id=customer_id, operations=[ad_group_ad_operation]
-        )
+        google_ads_limiter.acquire()
+        with timed("google_ads", "mutate_ad_group_ads"):
+            response = ad_group_ad_service.mutate_ad_group_ads(
+                customer_id=customer_id, operations=[ad_group_ad_operation]
+            )
         ad_resource_name = response.results[0].resource_name
         logger.info(f"Ad created successfully: {ad_resource_name}")
+        if mirror is not None:
+            mirror.record("ad", ad_resource_name,
+                          rsa_content_hash(rsa_text["headlines"], rsa_text["descriptions"], [final_url]),
+                          "ENABLED", parent=ad_group_id)
         return ad_resource_name
 
     except GoogleAdsException as e:
@@ -200,6 +354,98 @@ def _create_rsa_ad(client, customer_id: str, ad_group_id: str, rsa_text: dict):
         logger.error(f"Failed to create RSA ad: {e}")
         raise
 
+def _update_fields(client, operation, entity):
+    """把 `entity` 中設置過的字段寫入更新操作的 update_mask。"""
+    client.copy_from(operation.update_mask, protobuf_helpers.field_mask(None, entity._pb))
+
+def ensure_campaign(client, customer_id, mirror, campaign_name=DEFAULT_CAMPAIGN_NAME, budget=DEFAULT_BUDGET_MICROS):
+    """
+    確保賬戶中有名為 `campaign_name` 的廣告系列。
+
+    已存在時只在預算金額不同時更新預算，否則不發送任何請求；不存在時創建預算和廣告系列。
+
+    Returns:
+        str: 廣告系列的 resource name
+    """
+    existing = mirror.find("campaign", campaign_name)
+    if existing is None:
+        return create_campaign(client, customer_id, budget=budget, campaign_name=campaign_name, mirror=mirror)
+
+    detail = existing["detail"]
+    if detail.get("budget") and detail.get("budget_amount_micros") != budget:
+        operation = client.get_type("CampaignBudgetOperation")
+        campaign_budget = operation.update
+        campaign_budget.resource_name = detail["budget"]
+        campaign_budget.amount_micros = budget
+        _update_fields(client, operation, campaign_budget)
+        google_ads_limiter.acquire()
+        with timed("google_ads", "mutate_campaign_budgets"):
+            client.get_service("CampaignBudgetService").mutate_campaign_budgets(
+                customer_id=customer_id, operations=[operation]
+            )
+        mirror.record("campaign", existing["resource_name"], campaign_name, existing["status"],
+                      budget=detail["budget"], budget_amount_micros=budget)
+        logger.info(f"✅ 已更新廣告系列預算: {campaign_name}")
+    else:
+        logger.info(f"廣告系列已存在，無需修改: {campaign_name}")
+    return existing["resource_name"]
+
+def ensure_ad_group(client, customer_id, mirror, campaign_id, ad_group_name=DEFAULT_AD_GROUP_NAME,
+                    cpc_bid_micros=DEFAULT_CPC_BID_MICROS):
+    """
+    確保廣告系列 `campaign_id` 下有名為 `ad_group_name` 的廣告組，只在出價不同時發送更新。
+
+    Returns:
+        str: 廣告組的 resource name
+    """
+    existing = mirror.find("ad_group", ad_group_name, parent=campaign_id)
+    if existing is None:
+        return create_ad_group(client, customer_id, campaign_id, ad_group_name=ad_group_name,
+                               cpc_bid_micros=cpc_bid_micros, mirror=mirror)
+
+    if existing["detail"].get("cpc_bid_micros") != cpc_bid_micros:
+        operation = client.get_type("AdGroupOperation")
+        ad_group = operation.update
+        ad_group.resource_name = existing["resource_name"]
+        ad_group.cpc_bid_micros = cpc_bid_micros
+        _update_fields(client, operation, ad_group)
+        google_ads_limiter.acquire()
+        with timed("google_ads", "mutate_ad_groups"):
+            client.get_service("AdGroupService").mutate_ad_groups(customer_id=customer_id, operations=[operation])
+        mirror.record("ad_group", existing["resource_name"], ad_group_name, existing["status"], parent=campaign_id,
+                      cpc_bid_micros=cpc_bid_micros)
+        logger.info(f"✅ 已更新廣告組出價: {ad_group_name}")
+    else:
+        logger.info(f"廣告組已存在，無需修改: {ad_group_name}")
+    return existing["resource_name"]
+
+def ensure_rsa_ad(client, customer_id, mirror, ad_group_id, build_rsa_text, final_url=FINAL_URL):
+    """
+    確保廣告組中有 RSA 廣告；已有廣告時直接複用，不發送請求。
+
+    生成的文案每次都不同，按文案比較只會讓廣告越積越多，所以只看廣告組裡有沒有廣告。
+    `build_rsa_text` 是無參數的函數，只在需要創建廣告時才調用，避免多餘的 OpenAI 請求。
+    """
+    existing_ads = mirror.children("ad", ad_group_id)
+    if existing_ads:
+        logger.info(f"廣告組已有 {len(existing_ads)} 個 RSA 廣告，不再創建: {existing_ads[0]['resource_name']}")
+        return existing_ads[0]["resource_name"]
+    return _create_rsa_ad(client, customer_id, ad_group_id, build_rsa_text(), final_url=final_url, mirror=mirror)
+
+def provision_search_campaign(client, openai_client, customer_id, campaign_name=DEFAULT_CAMPAIGN_NAME,
+                              ad_group_name=DEFAULT_AD_GROUP_NAME, budget=DEFAULT_BUDGET_MICROS, mirror=None):
+    """
+    按賬戶鏡像對比後創建或更新廣告系列、廣告組和 RSA 廣告，只發送實際需要的 mutate 請求。
+
+    Returns:
+        tuple: (廣告系列, 廣告組, RSA 廣告) 的 resource name
+    """
+    mirror = mirror or load_account_mirror(client, customer_id)
+    campaign_id = ensure_campaign(client, customer_id, mirror, campaign_name, budget)
+    ad_group_id = ensure_ad_group(client, customer_id, mirror, campaign_id, ad_group_name)
+    ad_id = create_google_ads_rsa_workflow(client, openai_client, customer_id, ad_group_id, mirror=mirror)
+    return campaign_id, ad_group_id, ad_id
+
 if __name__ == "__main__":
     logger.info("启动程序，开始测试 Google Ads API 日志功能")
     print("启动程序，开始测试 Google Ads API 日志功能")
@@ -213,11 +459,14 @@ if __name__ == "__main__":
         # Google Ads 客户 ID
         customer_id = "5141511711"
 
+        # 读取账户结构镜像（过期时用 search_stream 刷新），已有的实体不会重复创建
+        mirror = load_account_mirror(client, customer_id)
+
         # Step 1: 创建广告系列
         try:
             logger.info("开始创建广告系列...")
             print("开始创建广告系列...")
-            campaign_id = create_campaign(client, customer_id, campaign_type="SEARCH")
+            campaign_id = ensure_campaign(client, customer_id, mirror)
             logger.info(f"✅ 广告系列已创建，ID: {campaign_id}")
             print(f"✅ 广告系列已创建，ID: {campaign_id}")
         except Exception as e:
@@ -229,7 +478,7 @@ if __name__ == "__main__":
         try:
             logger.info("开始创建广告组...")
             print("开始创建广告组...")
-            ad_group_id = create_ad_group(client, customer_id, campaign_id)
+            ad_group_id = ensure_ad_group(client, customer_id, mirror, campaign_id)
             logger.info(f"✅ 广告组已创建，ID: {ad_group_id}")
             print(f"✅ 广告组已创建，ID: {ad_group_id}")
         except Exception as e:
@@ -243,7 +492,7 @@ if __name__ == "__main__":
             print("开始整合 RSA 广告创建流程...")
 
             # 使用整合的工作流函数创建广告
-            rsa_ad_id = create_google_ads_rsa_workflow(client, openai_client, customer_id, ad_group_id)
+            rsa_ad_id = create_google_ads_rsa_workflow(client, openai_client, customer_id, ad_group_id, mirror=mirror)
 
             logger.info(f"✅ 创建的 RSA 广告 ID: {rsa_ad_id}")
             print(f"✅ 创建的 RSA 广告 ID: {rsa_ad_id}")
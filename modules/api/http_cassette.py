@@ -0,0 +1,240 @@
+"""
+Record/replay layer for the HTTP clients used by shopify_api (requests) and openai_api (httpx).
+
+Set HTTP_CASSETTE_MODE=record to save every response (status, headers, body,
+elapsed time) to gzip-compressed JSON lines under HTTP_CASSETTE_DIR, one
+directory per client and one file per recording process
+(`<client>/<AUTOCONTENTIFY_STEP>-<pid>.jsonl.gz`), so the pipeline's step
+processes never overwrite or interleave each other's recordings. With
+HTTP_CASSETTE_MODE=replay the same requests are answered from all of a client's
+files, merged in recording order, without touching the network, either with the
+recorded latency (HTTP_CASSETTE_LATENCY=original, the default) or instantly
+(HTTP_CASSETTE_LATENCY=zero).
+
+Requests are matched on method, URL and a hash of the body; repeated identical
+requests replay their responses in recorded order. Request headers are never
+stored, so access tokens stay out of the cassettes.
+"""
+import asyncio
+import atexit
+import base64
+import datetime
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+MODE = os.environ.get("HTTP_CASSETTE_MODE", "").lower()  # "", "record" or "replay"
+CASSETTE_DIR = os.environ.get(
+    "HTTP_CASSETTE_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/cassettes"))
+)
+LATENCY = os.environ.get("HTTP_CASSETTE_LATENCY", "original").lower()
+
+# Hop-by-hop and encoding headers would not match the decoded body we store
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+class CassetteMiss(Exception):
+    """No recorded response left for a request in replay mode."""
+
+
+def _request_key(method, url, body):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return f"{method.upper()} {url} {hashlib.sha256(body or b'').hexdigest()[:16]}"
+
+
+class Cassette:
+    """The recorded interactions of one client: gzip JSON-lines files, one per recording process."""
+
+    def __init__(self, name, mode=None, directory=None, latency=None):
+        self.mode = mode if mode is not None else MODE
+        self.latency = latency or LATENCY
+        self.directory = os.path.join(directory or CASSETTE_DIR, name)
+        step = os.environ.get("AUTOCONTENTIFY_STEP", "process").replace(os.sep, "_")
+        self.path = os.path.join(self.directory, f"{step}-{os.getpid()}.jsonl.gz")
+        self.lock = threading.Lock()
+        self.responses = defaultdict(deque)
+        self.file = None
+        if self.mode == "replay":
+            self._load()
+        elif self.mode == "record":
+            atexit.register(self.close)
+
+    def _load(self):
+        # Cassettes recorded before per-process files are still read
+        paths = glob.glob(os.path.join(self.directory, "*.jsonl.gz")) + glob.glob(f"{self.directory}.jsonl.gz")
+        entries = []
+        for path in sorted(paths):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entries.extend(json.loads(line) for line in f)
+        # Identical requests from several processes replay in the order they were recorded
+        entries.sort(key=lambda entry: entry.get("recorded_at", 0))
+        for entry in entries:
+            self.responses[entry["key"]].append(entry["response"])
+        logging.info(f"Loaded {len(entries)} responses from {len(paths)} file(s) under {self.directory}")
+
+    def record(self, method, url, body, status, headers, content, elapsed):
+        entry = {
+            "key": _request_key(method, url, body),
+            "recorded_at": time.time(),
+            "response": {
+                "status": status,
+                "headers": [[k, v] for k, v in headers if k.lower() not in _DROPPED_HEADERS],
+                "body": base64.b64encode(content).decode("ascii"),
+                "elapsed": elapsed,
+            },
+        }
+        with self.lock:
+            # Opened on first use: processes that import a client without calling it leave no file
+            if self.file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.file = gzip.open(self.path, "at", encoding="utf-8")
+            self.file.write(json.dumps(entry) + "\n")
+
+    def play(self, method, url, body):
+        """Return `(status, headers, content, elapsed)` for the next recorded response of this request."""
+        key = _request_key(method, url, body)
+        with self.lock:
+            queue = self.responses.get(key)
+            if not queue:
+                raise CassetteMiss(f"No recorded response for {method} {url}")
+            response = queue.popleft()
+        if self.latency == "original":
+            time.sleep(response["elapsed"])
+        return response["status"], response["headers"], base64.b64decode(response["body"]), response["elapsed"]
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+class CassetteAdapter(HTTPAdapter):
+    """requests transport adapter that records through to the network or replays from a cassette."""
+
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        if self.cassette.mode == "replay":
+            try:
+                status, headers, content, elapsed = self.cassette.play(request.method, request.url, request.body)
+            except CassetteMiss as e:
+                raise requests.exceptions.ConnectionError(str(e), request=request)
+            response = requests.Response()
+            response.status_code = status
+            response.headers = requests.structures.CaseInsensitiveDict(headers)
+            response._content = content
+            response.url = request.url
+            response.request = request
+            response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+            response.elapsed = datetime.timedelta(seconds=elapsed)
+            return response
+
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        content = response.content
+        self.cassette.record(request.method, request.url, request.body, response.status_code,
+                             response.headers.items(), content, time.perf_counter() - started)
+        return response
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """httpx transport that records through to `wrapped` or replays from a cassette."""
+
+    def __init__(self, cassette, wrapped=None):
+        self.cassette = cassette
+        self.wrapped = wrapped or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        body = request.read()
+        if self.cassette.mode == "replay":
+            try:
+                status, headers, content, _ = self.cassette.play(request.method, str(request.url), body)
+            except CassetteMiss as e:
+                raise httpx.ConnectError(str(e), request=request)
+            return httpx.Response(status, headers=headers, content=content, request=request)
+
+        started = time.perf_counter()
+        response = self.wrapped.handle_request(request)
+        content = response.read()
+        self.cassette.record(request.method, str(request.url), body, response.status_code,
+                             response.headers.multi_items(), content, time.perf_counter() - started)
+        return httpx.Response(response.status_code, headers=[
+            (k, v) for k, v in response.headers.multi_items() if k.lower() not in _DROPPED_HEADERS
+        ], content=content, request=request)
+
+    def close(self):
+        self.wrapped.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """Async counterpart of CassetteTransport for httpx.AsyncClient."""
+
+    def __init__(self, cassette, wrapped=None):
+        self.cassette = cassette
+        self.wrapped = wrapped or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        body = await request.aread()
+        if self.cassette.mode == "replay":
+            try:
+                # play() sleeps for the recorded latency, keep it off the event loop
+                status, headers, content, _ = await asyncio.to_thread(
+                    self.cassette.play, request.method, str(request.url), body
+                )
+            except CassetteMiss as e:
+                raise httpx.ConnectError(str(e), request=request)
+            return httpx.Response(status, headers=headers, content=content, request=request)
+
+        started = time.perf_counter()
+        response = await self.wrapped.handle_async_request(request)
+        content = await response.aread()
+        self.cassette.record(request.method, str(request.url), body, response.status_code,
+                             response.headers.multi_items(), content, time.perf_counter() - started)
+        return httpx.Response(response.status_code, headers=[
+            (k, v) for k, v in response.headers.multi_items() if k.lower() not in _DROPPED_HEADERS
+        ], content=content, request=request)
+
+    async def aclose(self):
+        await self.wrapped.aclose()
+
+
+def install_requests_cassette(session, name):
+    """Mount a cassette on a requests session when HTTP_CASSETTE_MODE is set."""
+    if not MODE:
+        return None
+    adapter = CassetteAdapter(Cassette(name))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    logging.info(f"HTTP cassette '{name}' active in {MODE} mode.")
+    return adapter
+
+
+def cassette_http_client(name):
+    """Return an httpx.Client backed by a cassette when HTTP_CASSETTE_MODE is set, else None."""
+    if not MODE:
+        return None
+    logging.info(f"HTTP cassette '{name}' active in {MODE} mode.")
+    return httpx.Client(transport=CassetteTransport(Cassette(name)))
+
+
+def cassette_async_transport(name, wrapped=None):
+    """Return an httpx async transport backed by a cassette when HTTP_CASSETTE_MODE is set, else `wrapped`."""
+    if not MODE:
+        return wrapped
+    logging.info(f"HTTP cassette '{name}' active in {MODE} mode.")
+    return AsyncCassetteTransport(Cassette(name), wrapped)
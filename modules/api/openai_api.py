@@ -1,262 +1,229 @@
 import os
-import sys
 import json
-import datetime
+import re
 from openai import OpenAI
-from config.common import BASE_DIR, CONFIG_DIR, setup_logger
-from modules.api.openai_api import generate_rsa_text
-from modules.database.db_connection import fetch_keywords_from_database
-from google.ads.googleads.client import GoogleAdsClient
-from google.ads.googleads.errors import GoogleAdsException
+from config.common import setup_logger
+from modules.api.http_cassette import cassette_http_client
+from modules.api.rate_limiter import get_shared_limiter
+from modules.monitoring.metrics import record_tokens, timed
 
 # 日記初始化
-logger = setup_logger(script_name="google_ads_api")
-
-# 全局配置文件路徑
-CREDENTIALS_PATH = os.path.join(CONFIG_DIR, "google_ads_credentials.json")
-CONFIG_PATH = os.path.join(CONFIG_DIR, "google_ads.yaml")
-
-# 工具函數：校驗文件是否存在
-def check_file_exists(file_path, description):
-    logger.debug(f"Checking if file exists: {file_path}")
-    if not os.path.exists(file_path):
-        logger.error(f"❌ {description} 不存在: {file_path}")
-        sys.exit(1)
-
-# 校驗所需的配置文件是否存在
-check_file_exists(CREDENTIALS_PATH, "Google Ads 憑據文件")
-check_file_exists(CONFIG_PATH, "Google Ads 配置文件")
-
-# 工具函數：校驗 JSON 文件內容
-def validate_json_file(file_path, required_keys):
-    logger.debug(f"Validating JSON file: {file_path}")
-    try:
-        with open(file_path, "r") as file:
-            data = json.load(file)
-        
-        # 確保 "installed" 鍵存在於 JSON 文件中
-        if "installed" not in data:
-            raise ValueError("❌ 配置文件中缺少 'installed' 鍵")
-
-        nested_data = data["installed"]
-        missing_keys = [key for key in required_keys if key not in nested_data]
-        if missing_keys:
-            logger.warning(f"Missing keys: {missing_keys}")
-            raise ValueError(f"缺少必要字段: {missing_keys}")
-        
-        return nested_data  # 返回嵌套的內容
-    except Exception as e:
-        logger.error(f"❌ 配置文件校驗失敗: {file_path} -> {e}")
-        sys.exit(1)
-
-# 加載 Google Ads 客戶端
-def load_google_ads_client():
-    logger.debug("Loading Google Ads client")
-    try:
-        credentials = validate_json_file(CREDENTIALS_PATH, ["login_customer_id"])
-        google_ads_client = GoogleAdsClient.load_from_storage(CONFIG_PATH)
-        google_ads_client.login_customer_id = credentials["login_customer_id"]
-        logger.info(f"✅ 成功加載 Google Ads 客戶端, Login Customer ID: {google_ads_client.login_customer_id}")
-        return google_ads_client
-    except Exception as e:
-        logger.error(f"❌ 加載 Google Ads 客戶端失敗: {e}")
-        raise
-
-def generate_name(prefix, entity_type):
-    logger.debug(f"Generating name with prefix: {prefix}, entity_type: {entity_type}")
-    now = datetime.datetime.now()
-    return f"{prefix} {entity_type} - {now.strftime('%Y-%m-%d-%H%M%S')}"
-
-def create_campaign(client, customer_id, campaign_type="SEARCH", budget=10000000, locations=None, languages=None):
-    logger.debug("Creating campaign")
+logger = setup_logger(script_name="openai_api")
+
+DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+# 所有進程共享的 OpenAI 請求配額
+openai_limiter = get_shared_limiter("openai")
+
+_client = None
+
+# Google Ads 對響應式搜索廣告的限制
+RSA_LIMITS = {
+    # 類型: (每條最大長度, 最少條數, 最多條數, 可固定的位置數)
+    "headlines": (30, 3, 15, 3),
+    "descriptions": (90, 2, 4, 2),
+}
+# 同一位置最多固定的素材數，固定太多會讓廣告失去輪播組合
+MAX_PINS_PER_POSITION = 2
+# Google Ads 編輯政策不允許的字符：表情和裝飾符號、尖括號等
+DISALLOWED_CHARACTERS = re.compile(r"[\u2190-\u21FF\u2600-\u27BF\U0001F000-\U0001FAFF<>{}\[\]|\\^~*•]")
+REPEATED_PUNCTUATION = re.compile(r"([!?.,])\1")
+# 修復無效素材的最多輪數，每輪只發送一個小請求
+MAX_RSA_REPAIR_ROUNDS = 2
+
+def get_openai_client():
+    """返回進程內共享的 OpenAI 客戶端"""
+    global _client
+    if _client is None:
+        # 設置 HTTP_CASSETTE_MODE 時錄製或回放 OpenAI 響應
+        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=cassette_http_client("openai"))
+    return _client
+
+def chat_with_openai(prompt, client=None, model=DEFAULT_MODEL, system_prompt=None, **kwargs):
+    """
+    發送單輪對話請求並返回回覆文本。
+
+    Args:
+        prompt (str): 用戶提示詞。
+        client (OpenAI, optional): OpenAI 客戶端，默認使用共享客戶端。
+        model (str, optional): 模型名稱。
+        system_prompt (str, optional): 系統提示詞。
+        **kwargs: 傳給 chat.completions.create 的其他參數。
+
+    Returns:
+        str: 回覆文本，失敗時為空字符串
+    """
+    client = client or get_openai_client()
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
     try:
-        if budget is None:
-            budget = 10000000
-        if locations is None:
-            locations = ["2840"]  # 美國
-        if languages is None:
-            languages = ["1000"]  # 英語
-        campaign_service = client.get_service("CampaignService")
-        campaign_budget_service = client.get_service("CampaignBudgetService")
-        campaign_budget_operation = client.get_type("CampaignBudgetOperation")
-        campaign_budget = campaign_budget_operation.create
-        campaign_budget.name = generate_name(campaign_type, "Budget")
-        campaign_budget.delivery_method = client.enums.BudgetDeliveryMethodEnum.STANDARD
-        campaign_budget.amount_micros = budget
-        logger.debug("Creating campaign budget")
-        budget_response = campaign_budget_service.mutate_campaign_budgets(
-            customer_id=customer_id, operations=[campaign_budget_operation]
-        )
-        budget_resource_name = budget_response.results[0].resource_name
-        campaign_operation = client.get_type("CampaignOperation")
-        campaign = campaign_operation.create
-        campaign.name = generate_name(campaign_type, "Campaign")
-        campaign.status = client.enums.CampaignStatusEnum.PAUSED
-        campaign.campaign_budget = budget_resource_name
-        campaign.advertising_channel_type = client.enums.AdvertisingChannelTypeEnum.SEARCH
-        campaign.manual_cpc.enhanced_cpc_enabled = False
-        logger.debug("Creating campaign")
-        campaign_response = campaign_service.mutate_campaigns(
-            customer_id=customer_id, operations=[campaign_operation]
-        )
-        campaign_resource_name = campaign_response.results[0].resource_name
-        logger.info(f"✅ 廣告系列已創建: {campaign.name}")
-        return campaign_resource_name
-    except Exception as e:
-        logger.error(f"❌ 無法創建廣告系列: {e}")
-        raise
-
-def create_ad_group(client, customer_id, campaign_id):
-    logger.debug("Creating ad group")
-    try:
-        ad_group_service = client.get_service("AdGroupService")
-        ad_group_operation = client.get_type("AdGroupOperation")
-        ad_group = ad_group_operation.create
-        ad_group.name = generate_name("", "Ad Group")
-        ad_group.campaign = campaign_id
-        ad_group.status = client.enums.AdGroupStatusEnum.ENABLED
-        ad_group.cpc_bid_micros = 1000000
-
-        logger.debug("Sending request to create ad group")
-        ad_group_response = ad_group_service.mutate_ad_groups(
-            customer_id=customer_id, operations=[ad_group_operation]
-        )
-        ad_group_resource_name = ad_group_response.results[0].resource_name
-        logger.info(f"✅ 廣告組已創建: {ad_group.name}")
-        return ad_group_resource_name
-    except GoogleAdsException as ex:
-        logger.error(f"❌ Google Ads API 錯誤：{ex.failure}")
-        raise
-    except Exception as e:
-        logger.error(f"❌ 創建廣告組失敗：{e}")
-        raise
-
-def create_google_ads_rsa_workflow(client, openai_client, customer_id, ad_group_id):
-    logger.debug("Starting RSA workflow")
-    try:
-        logger.info("Fetching keywords from the database...")
-        keywords = fetch_keywords_from_database()
-        if not keywords:
-            raise ValueError("No keywords found in the database.")
-
-        logger.info(f"Fetched keywords: {keywords}")
-
-        logger.info("Generating RSA text using OpenAI...")
-        rsa_text = generate_rsa_text(client=openai_client, keywords=keywords[:15])
-        if not rsa_text.get("headlines") or not rsa_text.get("descriptions"):
-            raise ValueError("OpenAI failed to generate RSA text.")
-
-        logger.info(f"Generated RSA text: {rsa_text}")
-
-        logger.info("Creating RSA ad...")
-        ad_resource_name = _create_rsa_ad(client, customer_id, ad_group_id, rsa_text)
-        logger.info(f"RSA ad created successfully: {ad_resource_name}")
-        return ad_resource_name
-
+        openai_limiter.acquire()
+        with timed("openai", "chat.completions"):
+            response = client.chat.completions.create(model=model, messages=messages, **kwargs)
+        if response.usage:
+            record_tokens("openai", response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response.choices[0].message.content or ""
     except Exception as e:
-        logger.error(f"Workflow failed: {e}")
-        raise
-
-def _create_rsa_ad(client, customer_id: str, ad_group_id: str, rsa_text: dict):
-    logger.debug("Creating RSA ad")
+        logger.error(f"❌ OpenAI 請求失敗: {e}")
+        return ""
+
+def validate_rsa_text(rsa_text):
+    """
+    在本地按 Google Ads 的規則檢查 RSA 文案，不發送任何請求。
+
+    檢查空文案、長度、重複（忽略大小寫）、不允許的字符、重複標點、標題中的感歎號，
+    以及固定位置（`headline_pins` / `description_pins`，與素材按下標對應，值為 1 起的位置或 None）。
+    條數不足時，缺少的槽位也記為無效。
+
+    Returns:
+        dict: {"headlines": {槽位下標: 原因}, "descriptions": {...}}，全部有效時兩個字典都為空
+    """
+    issues = {}
+    for field, (max_length, min_count, _, positions) in RSA_LIMITS.items():
+        texts = rsa_text.get(field, [])
+        pins = rsa_text.get(f"{field[:-1]}_pins") or []
+        field_issues = {}
+        seen = set()
+        for index, text in enumerate(texts):
+            text = text.strip()
+            if not text:
+                field_issues[index] = "empty"
+            elif len(text) > max_length:
+                field_issues[index] = f"longer than {max_length} characters"
+            elif text.casefold() in seen:
+                field_issues[index] = "duplicate"
+            elif DISALLOWED_CHARACTERS.search(text):
+                field_issues[index] = "contains a disallowed symbol"
+            elif REPEATED_PUNCTUATION.search(text):
+                field_issues[index] = "repeated punctuation"
+            elif field == "headlines" and "!" in text:
+                field_issues[index] = "exclamation mark in a headline"
+            seen.add(text.casefold())
+
+        pin_counts = {}
+        for index, position in enumerate(pins[:len(texts)]):
+            if position is None:
+                continue
+            if position not in range(1, positions + 1):
+                field_issues.setdefault(index, f"pinned to invalid position {position}")
+                continue
+            pin_counts[position] = pin_counts.get(position, 0) + 1
+            if pin_counts[position] > MAX_PINS_PER_POSITION:
+                field_issues.setdefault(index, f"more than {MAX_PINS_PER_POSITION} assets pinned to position {position}")
+
+        for index in range(len(texts), min_count):
+            field_issues[index] = "missing"
+        issues[field] = field_issues
+    return issues
+
+def _repair_prompt(rsa_text, issues, keywords):
+    lines = [
+        "Some Google Ads responsive search ad assets were rejected. Write replacements only for the slots listed.",
+        f"Keywords: {', '.join(keywords)}",
+    ]
+    for field, (max_length, *_) in RSA_LIMITS.items():
+        if not issues[field]:
+            continue
+        texts = rsa_text.get(field, [])
+        kept = [text for index, text in enumerate(texts) if index not in issues[field]]
+        lines.append(f"{field} (at most {max_length} characters each, must differ from: {json.dumps(kept, ensure_ascii=False)}):")
+        for index, reason in sorted(issues[field].items()):
+            current = texts[index] if index < len(texts) else ""
+            lines.append(f"- slot {index}: {json.dumps(current, ensure_ascii=False)} ({reason})")
+    lines.append(
+        "No emoji or decorative symbols, no repeated punctuation, no exclamation marks in headlines. "
+        "Return a JSON object mapping \"headlines\" and \"descriptions\" to objects of slot number to new text."
+    )
+    return "\n".join(lines)
+
+def repair_rsa_text(rsa_text, keywords=None, client=None, max_rounds=MAX_RSA_REPAIR_ROUNDS):
+    """
+    只為無效的槽位重新請求文案並合併回原文案。
+
+    每輪把所有無效槽位放進一個小請求，最多 `max_rounds` 輪；仍然無效的素材被丟棄（固定位置一併丟棄），
+    多出上限的素材被截掉。
+
+    Returns:
+        dict: 修復後的文案，格式與 generate_rsa_text 相同
+
+    Raises:
+        ValueError: 修復後有效的標題或描述仍少於 Google Ads 的最低條數
+    """
+    keywords = keywords or []
+    rsa_text = {key: list(value) for key, value in rsa_text.items()}
+    for _ in range(max_rounds):
+        issues = validate_rsa_text(rsa_text)
+        if not any(issues.values()):
+            break
+        logger.info(f"RSA 文案有無效素材，重新生成: {issues}")
+        content = chat_with_openai(_repair_prompt(rsa_text, issues, keywords), client=client,
+                                   response_format={"type": "json_object"})
+        try:
+            replacements = json.loads(content)
+        except json.JSONDecodeError:
+            replacements = None
+        if not isinstance(replacements, dict):
+            logger.error(f"❌ 無法解析 RSA 修復結果為 JSON 對象: {content}")
+            break
+        for field in RSA_LIMITS:
+            texts = rsa_text.setdefault(field, [])
+            slots = replacements.get(field)
+            if not isinstance(slots, dict):
+                # 不是「槽位 → 文案」的對象，這一輪不替換該字段
+                continue
+            for slot, text in slots.items():
+                try:
+                    index = int(slot)
+                except ValueError:
+                    continue
+                if index in issues[field]:
+                    texts.extend([""] * (index + 1 - len(texts)))
+                    texts[index] = str(text)
+
+    issues = validate_rsa_text(rsa_text)
+    for field, (_, min_count, max_count, _) in RSA_LIMITS.items():
+        pins_key = f"{field[:-1]}_pins"
+        texts = rsa_text.get(field, [])
+        pins = rsa_text.get(pins_key) or [None] * len(texts)
+        kept = [index for index in range(len(texts)) if index not in issues[field]][:max_count]
+        if len(kept) < min_count:
+            raise ValueError(f"Only {len(kept)} valid {field} after repair, at least {min_count} required.")
+        rsa_text[field] = [texts[index].strip() for index in kept]
+        if pins_key in rsa_text:
+            rsa_text[pins_key] = [pins[index] if index < len(pins) else None for index in kept]
+    return rsa_text
+
+def generate_rsa_text(client=None, keywords=None, repair=True):
+    """
+    基於關鍵詞生成響應式搜索廣告 (RSA) 文案。
+
+    `repair=True` 時先在本地校驗，只為無效的素材再發一個小請求（見 repair_rsa_text）。
+
+    Returns:
+        dict: {"headlines": [...], "descriptions": [...]}，失敗時兩個列表為空
+    """
+    keywords = keywords or []
+    prompt = (
+        "Write Google Ads responsive search ad text for the keywords below. "
+        "Return a JSON object with a \"headlines\" array of 15 unique headlines (at most 30 characters each) "
+        "and a \"descriptions\" array of 4 unique descriptions (at most 90 characters each).\n"
+        f"Keywords: {', '.join(keywords)}"
+    )
+    content = chat_with_openai(prompt, client=client, response_format={"type": "json_object"})
     try:
-        if not rsa_text.get("headlines") or not rsa_text.get("descriptions"):
-            logger.error(f"Incomplete RSA text data: {rsa_text}")
-            raise ValueError("Incomplete RSA text data.")
-
-        ad_group_ad_service = client.get_service("AdGroupAdService")
-        ad_group_ad_operation = client.get_type("AdGroupAdOperation")
-        ad_group_ad = ad_group_ad_operation.create
-        ad_group_ad.ad_group = ad_group_id
-        ad_group_ad.status = client.enums.AdGroupAdStatusEnum.ENABLED
-
-        # Add headlines and descriptions
-        rsa_info = ad_group_ad.ad.responsive_search_ad
-        for headline in rsa_text["headlines"]:
-            headline_part = client.get_type("AdTextAsset")
-            headline_part.text = headline
-            rsa_info.headlines.append(headline_part)
-
-        for description in rsa_text["descriptions"]:
-            description_part = client.get_type("AdTextAsset")
-            description_part.text = description
-            rsa_info.descriptions.append(description_part)
-
-        # Add final URL
-        final_url = "https://www.greenewrap.com"
-        ad_group_ad.ad.final_urls.append(final_url)
-        logger.info(f"Final URL set: {final_url}")
-
-        # Send request
-        logger.debug("Sending request to create RSA ad")
-        response = ad_group_ad_service.mutate_ad_group_ads(
-            customer_id=customer_id, operations=[ad_group_ad_operation]
-        )
-        ad_resource_name = response.results[0].resource_name
-        logger.info(f"Ad created successfully: {ad_resource_name}")
-        return ad_resource_name
-
-    except GoogleAdsException as e:
-        logger.error(f"Google Ads API Error: {e.failure}")
-        raise
-    except Exception as e:
-        logger.error(f"Failed to create RSA ad: {e}")
-        raise
-
-if __name__ == "__main__":
-    logger.info("啟動程序，開始測試 Google Ads API 日記功能")
-    print("啟動程序，開始測試 Google Ads API 日記功能")
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        data = None
+    if not isinstance(data, dict) or not all(isinstance(data.get(field, []), list) for field in RSA_LIMITS):
+        logger.error(f"❌ 無法解析 RSA 文案為 JSON: {content}")
+        return {"headlines": [], "descriptions": []}
+    rsa_text = {field: [str(text) for text in data.get(field, [])] for field in RSA_LIMITS}
+    if not repair:
+        return rsa_text
     try:
-        # 加載 Google Ads 客戶端
-        client = load_google_ads_client()
-
-        # 初始化 OpenAI 客戶端（假設已正確配置）
-        openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-        # Google Ads 客戶 ID
-        customer_id = "5141511711"
-
-        # Step 1: 創建廣告系列
-        try:
-            logger.info("開始創建廣告系列...")
-            print("開始創建廣告系列...")
-            campaign_id = create_campaign(client, customer_id, campaign_type="SEARCH")
-            logger.info(f"✅ 廣告系列已創建，ID: {campaign_id}")
-            print(f"✅ 廣告系列已創建，ID: {campaign_id}")
-        except Exception as e:
-            logger.error(f"❌ 創建廣告系列失敗：{e}")
-            print(f"❌ 創建廣告系列失敗：{e}")
-            raise
-
-        # Step 2: 創建廣告組
-        try:
-            logger.info("開始創建廣告組...")
-            print("開始創建廣告組...")
-            ad_group_id = create_ad_group(client, customer_id, campaign_id)
-            logger.info(f"✅ 廣告組已創建，ID: {ad_group_id}")
-            print(f"✅ 廣告組已創建，ID: {ad_group_id}")
-        except Exception as e:
-            logger.error(f"❌ 創建廣告組失敗：{e}")
-            print(f"❌ 創建廣告組失敗：{e}")
-            raise
-
-        # Step 3: 生成 RSA 文案並創建廣告
-        try:
-            logger.info("開始整合 RSA 廣告創建流程...")
-            print("開始整合 RSA 廣告創建流程...")
-
-            # 使用整合的工作流函數創建廣告
-            rsa_ad_id = create_google_ads_rsa_workflow(client, openai_client, customer_id, ad_group_id)
-
-            logger.info(f"✅ 創建的 RSA 廣告 ID: {rsa_ad_id}")
-            print(f"✅ 創建的 RSA 廣告 ID: {rsa_ad_id}")
-        except Exception as e:
-            logger.error(f"❌ 創建 RSA 廣告失敗：{e}")
-            print(f"❌ 創建 RSA 廣告失敗：{e}")
-
-        logger.info("所有步驟執行完畢！")
-        print("✅ 所有步驟執行完畢！")
-
-    except Exception as e:
-        logger.error(f"❌ 程序執行失敗：{e}")
-        print(f"❌ 程序執行失敗：{e}")
+        return repair_rsa_text(rsa_text, keywords, client=client)
+    except ValueError as e:
+        logger.error(f"❌ RSA 文案修復失敗: {e}")
+        return {"headlines": [], "descriptions": []}
@@ -0,0 +1,173 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+# Default quotas per API: (tokens refilled per second, bucket capacity).
+# Override with RATE_LIMIT_<NAME>="rate/capacity", e.g. RATE_LIMIT_OPENAI="8/20".
+DEFAULT_BUCKETS = {
+    # Shopify REST drains 2 calls/s from a 40-call bucket; keep some headroom for other apps
+    "shopify": (2.0, 36),
+    # Google Ads API services
+    "google_ads": (5.0, 10),
+    # OpenAI chat completions (requests, not tokens)
+    "openai": (3.0, 10),
+}
+
+# "file" shares buckets between processes on one host, "mysql" between hosts
+BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "file")
+STATE_DIR = os.environ.get(
+    "RATE_LIMIT_STATE_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/ratelimits"))
+)
+
+RATE_LIMIT_DDL = """
+    CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+        name VARCHAR(64) NOT NULL PRIMARY KEY,
+        tokens DOUBLE NOT NULL,
+        updated_at DOUBLE NOT NULL
+    )
+"""
+
+
+def _refill(tokens, updated_at, now, rate, capacity):
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+class FileBackend:
+    """Bucket state in a small JSON file, serialized with an exclusive flock."""
+
+    def __init__(self, name):
+        os.makedirs(STATE_DIR, exist_ok=True)
+        self.path = os.path.join(STATE_DIR, f"{name}.json")
+
+    def take(self, tokens, rate, capacity):
+        """Take `tokens` if available. Returns 0, or the seconds to wait before retrying."""
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                now = time.time()
+                state = json.loads(raw) if raw else {"tokens": capacity, "updated_at": now}
+                available = _refill(state["tokens"], state["updated_at"], now, rate, capacity)
+                wait = 0.0
+                if available >= tokens:
+                    available -= tokens
+                else:
+                    wait = (tokens - available) / rate
+                f.seek(0)
+                f.truncate()
+                json.dump({"tokens": available, "updated_at": now}, f)
+                f.flush()
+                return wait
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class MySQLBackend:
+    """Bucket state in one row per bucket, locked with SELECT ... FOR UPDATE and clocked by the DB server."""
+
+    def __init__(self, name):
+        self.name = name
+        self.local = threading.local()
+
+    def _connection(self):
+        # pymysql connections are not thread-safe, so each thread keeps its own
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            from modules.database.db_connection import connect_db
+            connection = connect_db()
+            with connection.cursor() as cursor:
+                cursor.execute(RATE_LIMIT_DDL)
+            connection.commit()
+            self.local.connection = connection
+        return connection
+
+    def take(self, tokens, rate, capacity):
+        connection = self._connection()
+        connection.begin()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "INSERT IGNORE INTO rate_limit_buckets (name, tokens, updated_at) "
+                    "VALUES (%s, %s, UNIX_TIMESTAMP(NOW(6)))",
+                    (self.name, capacity),
+                )
+                cursor.execute(
+                    "SELECT tokens, updated_at, UNIX_TIMESTAMP(NOW(6)) AS now FROM rate_limit_buckets "
+                    "WHERE name = %s FOR UPDATE",
+                    (self.name,),
+                )
+                row = cursor.fetchone()
+                now = float(row["now"])
+                available = _refill(row["tokens"], row["updated_at"], now, rate, capacity)
+                wait = 0.0
+                if available >= tokens:
+                    available -= tokens
+                else:
+                    wait = (tokens - available) / rate
+                cursor.execute(
+                    "UPDATE rate_limit_buckets SET tokens = %s, updated_at = %s WHERE name = %s",
+                    (available, now, self.name),
+                )
+            connection.commit()
+            return wait
+        except Exception:
+            connection.rollback()
+            raise
+
+
+BACKENDS = {"file": FileBackend, "mysql": MySQLBackend}
+
+
+class SharedTokenBucket:
+    """Token bucket whose state is shared by every process (and host, with the MySQL backend) using it."""
+
+    def __init__(self, name, rate, capacity, backend=None):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.backend = BACKENDS[backend or BACKEND](name)
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available in the shared bucket, then take them."""
+        while True:
+            wait = self.backend.take(tokens, self.rate, self.capacity)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1):
+        """Like `acquire`, for coroutines: the backend runs in a worker thread and the wait is awaited."""
+        while True:
+            wait = await asyncio.to_thread(self.backend.take, tokens, self.rate, self.capacity)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_shared_limiter(name, key=None):
+    """
+    Return the process-wide shared bucket for an API, configured from DEFAULT_BUCKETS or the environment.
+
+    `key` gives separately metered accounts of the same API (e.g. one Shopify store each)
+    their own bucket with the API's quota.
+    """
+    bucket_name = f"{name}_{key}" if key else name
+    with _buckets_lock:
+        if bucket_name not in _buckets:
+            rate, capacity = DEFAULT_BUCKETS[name]
+            override = os.environ.get(f"RATE_LIMIT_{name.upper()}")
+            if override:
+                rate, capacity = (float(part) for part in override.split("/"))
+            logging.info(f"Shared rate limiter '{bucket_name}': {rate}/s, capacity {capacity}, backend {BACKEND}")
+            _buckets[bucket_name] = SharedTokenBucket(bucket_name, rate, capacity)
+        return _buckets[bucket_name]
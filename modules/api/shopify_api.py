@@ -1,15 +1,24 @@
+import asyncio
 import requests
 import logging
 import json
 import os
+import threading
+import time
 from datetime import datetime
+from urllib.parse import urlparse
+from modules.api.http_cassette import install_requests_cassette
+from modules.api.rate_limiter import get_shared_limiter
+from modules.api.shopify_records import PRODUCT_FIELDS, loads, parse_products
 from modules.database.db_connection import connect_db
-
-# Set up logging configuration for better readability
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+from modules.monitoring.log_config import configure_logging
+from modules.monitoring.metrics import record_bytes, record_retry, timed
 
 # Load configuration file
-CONFIG_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../config/shopify_config.json"))
+CONFIG_PATH = os.environ.get(
+    "SHOPIFY_CONFIG_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../../config/shopify_config.json"))
+)
 
 def load_config():
     """Load the Shopify configuration file"""
@@ -29,11 +38,58 @@ def load_config():
         logging.error(f"Error loading Shopify configuration: {e}")
         raise
 
-# Load the configuration
-config = load_config()
+def load_store_configs(config=None):
+    """
+    Return the list of store configs.
+
+    The config file holds either one store (`SHOPIFY_STORE_URL`, `ACCESS_TOKEN`,
+    `BLOG_ID`) or several under `"stores"`; other top-level keys (e.g. a shared
+    `WEBHOOK_SECRET`) are defaults for every store. Each store gets a `STORE_ID`,
+    taken from the file or defaulting to the store's host name; rows synced from
+    it are tagged with that id.
+    """
+    config = config if config is not None else load_config()
+    shared = {key: value for key, value in config.items() if key != "stores"}
+    stores = [{**shared, **store} for store in config.get("stores", [config])]
+    for store in stores:
+        store.setdefault("STORE_ID", urlparse(store["SHOPIFY_STORE_URL"]).netloc or store["SHOPIFY_STORE_URL"])
+    return stores
+
+def select_store(stores, store_id=None):
+    """Pick the store named by `store_id` (or SHOPIFY_STORE_ID), defaulting to the first one."""
+    store_id = store_id or os.environ.get("SHOPIFY_STORE_ID")
+    if not store_id:
+        return stores[0]
+    for store in stores:
+        if store["STORE_ID"] == store_id:
+            return store
+    raise KeyError(f"Unknown Shopify store '{store_id}'")
+
+def store_for_domain(stores, shop_domain):
+    """Find the store whose `SHOPIFY_STORE_URL` host is `shop_domain` (e.g. from X-Shopify-Shop-Domain), or None."""
+    shop_domain = (shop_domain or "").strip().lower()
+    for store in stores:
+        if urlparse(store["SHOPIFY_STORE_URL"]).netloc.lower() == shop_domain:
+            return store
+    return None
+
+def store_key(store, stores=None):
+    """Suffix for per-store bucket, cassette and index names; None in single-store setups."""
+    stores = stores if stores is not None else STORES
+    return store["STORE_ID"] if len(stores) > 1 else None
+
+# Load the configuration. A process talks to one store; the sharded driver in
+# modules.jobs.store_sync starts one process per store with SHOPIFY_STORE_ID set.
+STORES = load_store_configs()
+config = select_store(STORES)
+STORE_ID = config["STORE_ID"]
 SHOPIFY_STORE_URL = config["SHOPIFY_STORE_URL"]
 ACCESS_TOKEN = config["ACCESS_TOKEN"]
 BLOG_ID = config["BLOG_ID"]
+# Rows without a store id predate multi-store support and belong to the first store
+IS_DEFAULT_STORE = STORE_ID == STORES[0]["STORE_ID"]
+# Single-store setups keep their original bucket and cassette names
+STORE_KEY = store_key(config)
 
 # HTTP headers for Shopify API requests
 headers = {
@@ -41,12 +97,127 @@ headers = {
     "X-Shopify-Access-Token": ACCESS_TOKEN
 }
 
+# Shopify REST uses a leaky bucket of 40 calls per store, draining at 2 calls/second
+SHOPIFY_BUCKET_SIZE = 40
+SHOPIFY_LEAK_RATE = 2.0
+MAX_RETRIES = 5
+
+# A shared session keeps connections to the store alive between calls
+session = requests.Session()
+session.headers.update(headers)
+# Record or replay Shopify responses when HTTP_CASSETTE_MODE is set
+install_requests_cassette(session, f"shopify_{STORE_KEY}" if STORE_KEY else "shopify")
+
+
+class ShopifyRateLimiter:
+    """Thread-safe leaky bucket mirroring Shopify's REST call limit."""
+
+    def __init__(self, bucket_size=SHOPIFY_BUCKET_SIZE, leak_rate=SHOPIFY_LEAK_RATE, headroom=4):
+        self.bucket_size = bucket_size
+        self.leak_rate = leak_rate
+        self.headroom = headroom
+        self.used = 0.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _leak(self):
+        now = time.monotonic()
+        if now > self.updated_at:
+            self.used = max(0.0, self.used - (now - self.updated_at) * self.leak_rate)
+            self.updated_at = now
+
+    def try_acquire(self):
+        """Reserve a call if it fits in the bucket. Returns 0, or the seconds to wait before retrying."""
+        with self.lock:
+            self._leak()
+            if self.used + 1 <= self.bucket_size - self.headroom:
+                self.used += 1
+                return 0
+            return (self.used + 1 - (self.bucket_size - self.headroom)) / self.leak_rate
+
+    def acquire(self):
+        """Block until a call fits in the bucket, then reserve it."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Like `acquire`, but waits on the event loop instead of blocking the thread."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def update_from_header(self, call_limit):
+        """Sync with the `X-Shopify-Shop-Api-Call-Limit` header, e.g. "32/40"."""
+        if not call_limit:
+            return
+        try:
+            used, size = (int(part) for part in call_limit.split("/"))
+        except ValueError:
+            return
+        with self.lock:
+            # Buckets leak at 1/20 of their size per second (40 -> 2/s on standard plans, 400 -> 20/s on Plus)
+            self._leak()
+            self.bucket_size = size
+            self.leak_rate = size / 20.0
+            # Responses arrive out of order and the header does not count calls still in flight,
+            # so a lower server count never discards local reservations
+            self.used = max(self.used, float(used))
+
+    def backoff(self, seconds):
+        """Treat the bucket as full after a 429 so every writer waits."""
+        with self.lock:
+            self.used = float(self.bucket_size)
+            self.updated_at = time.monotonic() + seconds
+
+
+rate_limiter = ShopifyRateLimiter()
+# Shared with every other process calling this store, so parallel steps don't overrun the quota together.
+# Shopify meters each store separately, so every store has its own bucket.
+shared_limiter = get_shared_limiter("shopify", key=STORE_KEY)
+
+
+def send_request(method, url, rest_limited=True, **kwargs):
+    """
+    Send a rate-limited request, retrying on 429 and 5xx responses.
+
+    GraphQL calls pass `rest_limited=False`: they are metered by query cost (see
+    `ShopifyGraphQLThrottle`), not by the REST call bucket.
+    """
+    for attempt in range(1, MAX_RETRIES + 1):
+        shared_limiter.acquire()
+        if rest_limited:
+            rate_limiter.acquire()
+        with timed("shopify", method):
+            response = session.request(method, url, timeout=30, **kwargs)
+        record_bytes("shopify", sent=len(response.request.body or b""), received=len(response.content))
+        rate_limiter.update_from_header(response.headers.get("X-Shopify-Shop-Api-Call-Limit"))
+
+        if response.status_code == 429 or response.status_code >= 500:
+            retry_after = float(response.headers.get("Retry-After", 2 ** attempt))
+            logging.warning(f"Shopify returned {response.status_code} for {url}, retrying in {retry_after}s "
+                            f"(attempt {attempt}/{MAX_RETRIES})")
+            if response.status_code == 429:
+                rate_limiter.backoff(retry_after)
+            record_retry("shopify")
+            time.sleep(retry_after)
+            continue
+
+        response.raise_for_status()
+        return response
+
+    response.raise_for_status()
+    return response
+
 def make_request(url):
     """General function to make GET requests with retry logic"""
     logging.info(f"Making request to URL: {url}")
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
+        response = send_request("GET", url)
         logging.info(f"Request to {url} successful.")
         return response.json()
     except requests.exceptions.HTTPError as e:
@@ -55,40 +226,281 @@ def make_request(url):
         logging.error(f"Error during API request: {e}")
     return None
 
-def get_shopify_blogs():
-    """Fetch Shopify blog articles"""
-    logging.info("Fetching Shopify blog articles...")
+def get_page(url, params=None):
+    """
+    Fetch one page of a paginated REST endpoint.
+
+    Returns a `(data, next_url)` tuple. `next_url` is the cursor link from the
+    `Link` header, or None on the last page. `data` is None if the request failed.
+    """
+    logging.info(f"Making request to URL: {url}")
+    try:
+        response = send_request("GET", url, params=params)
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error during API request: {e}")
+        return None, None
+    return loads(response.content), response.links.get("next", {}).get("url")
+
+def iter_shopify_article_pages(updated_at_min=None, limit=250):
+    """
+    Stream Shopify articles of `BLOG_ID` one page at a time.
+
+    Follows the cursor links in the `Link` header. Pass `updated_at_min` (ISO 8601
+    string or datetime) to only pull articles changed since the last sync.
+    """
     url = f"{SHOPIFY_STORE_URL}/admin/api/2023-10/blogs/{BLOG_ID}/articles.json"
-    data = make_request(url)
-    
-    if data:
+    params = {"limit": limit}
+    if updated_at_min:
+        params["updated_at_min"] = (updated_at_min.isoformat() if isinstance(updated_at_min, datetime)
+                                    else updated_at_min)
+    total = 0
+
+    while url:
+        data, url = get_page(url, params)
+        # The cursor link already carries limit and the filters
+        params = None
+        if data is None:
+            logging.error("Failed to fetch Shopify blogs.")
+            return
         articles = data.get("articles", [])
-        logging.info(f"Fetched {len(articles)} articles from Shopify.")
-        return articles
-    logging.error("Failed to fetch Shopify blogs.")
-    return []
+        total += len(articles)
+        logging.info(f"Fetched {len(articles)} articles from Shopify. Total so far: {total}")
+        if articles:
+            yield articles
+
+def get_shopify_blogs(updated_at_min=None):
+    """Fetch all Shopify blog articles"""
+    logging.info("Fetching Shopify blog articles...")
+    articles = [article for page in iter_shopify_article_pages(updated_at_min) for article in page]
+    logging.info(f"Fetched {len(articles)} articles from Shopify.")
+    return articles
 
 def get_shopify_products():
-    """Fetch Shopify products data"""
+    """
+    Fetch all Shopify products as ProductRecord objects.
+
+    Only the fields the product sync stores are requested, and each page is parsed
+    into records before the next one is fetched.
+    """
     logging.info("Fetching Shopify products data...")
-    url = f"{SHOPIFY_STORE_URL}/admin/api/2023-10/products.json?limit=250"
+    url = f"{SHOPIFY_STORE_URL}/admin/api/2023-10/products.json"
+    params = {"limit": 250, "fields": PRODUCT_FIELDS}
     products = []
 
     while url:
-        data = make_request(url)
+        data, url = get_page(url, params)
+        # `fields` may be sent with page_info; repeat it unless the cursor link already does
+        params = None if url and "fields=" in url else {"fields": PRODUCT_FIELDS}
         if data:
-            products_page = data.get("products", [])
+            products_page = parse_products(data)
             products.extend(products_page)
             logging.info(f"Fetched {len(products_page)} products from Shopify. Total so far: {len(products)}")
-            # Get next page if available
-            url = data.get("next", {}).get("url", None)
         else:
             break
 
     logging.info(f"Total products fetched: {len(products)}")
     return products
 
+def create_or_update_shopify_blog(shopify_article_id=None, blog_data=None):
+    """
+    Create a Shopify article, or update it when `shopify_article_id` is given.
+
+    Returns a `(success, shopify_article_id)` tuple. Safe to call from several
+    threads at once; all calls share the session and the rate limiter.
+    """
+    base_url = f"{SHOPIFY_STORE_URL}/admin/api/2023-10/blogs/{BLOG_ID}/articles"
+    payload = {"article": dict(blog_data or {})}
+    try:
+        if shopify_article_id:
+            payload["article"]["id"] = shopify_article_id
+            response = send_request("PUT", f"{base_url}/{shopify_article_id}.json", json=payload)
+        else:
+            response = send_request("POST", f"{base_url}.json", json=payload)
+        article = response.json().get("article", {})
+        return True, article.get("id", shopify_article_id)
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error pushing article '{payload['article'].get('title')}' to Shopify: {e}")
+        return False, shopify_article_id
+
+# Article mutations exist in the GraphQL Admin API from 2024-10 on
+GRAPHQL_API_VERSION = "2024-10"
+GRAPHQL_URL = f"{SHOPIFY_STORE_URL}/admin/api/{GRAPHQL_API_VERSION}/graphql.json"
+# articleCreate requires an author; the REST endpoint defaulted to the shop owner
+ARTICLE_AUTHOR = config.get("ARTICLE_AUTHOR", "AutoContentify")
+# One query may cost at most 1000 points; a mutation field costs about 10
+GRAPHQL_MAX_QUERY_COST = 1000
+GRAPHQL_MUTATION_COST = 10
+# Article bodies travel as variables, so batches are capped by size as well as by cost
+ARTICLE_BATCH_SIZE = 50
+ARTICLE_BATCH_BYTES = 2 * 1024 * 1024
+# REST article fields -> ArticleCreateInput / ArticleUpdateInput fields
+ARTICLE_INPUT_FIELDS = {"title": "title", "body_html": "body", "summary_html": "summary", "handle": "handle"}
+ARTICLE_RESULT_FIELDS = "article { id } userErrors { field message }"
+
+
+class ShopifyGraphQLThrottle:
+    """
+    Thread-safe view of Shopify's GraphQL cost bucket (2000 points restoring at 100/s on
+    standard plans), kept in sync with `extensions.cost.throttleStatus` of every response.
+    """
+
+    def __init__(self, maximum=2000.0, restore_rate=100.0):
+        self.maximum = maximum
+        self.available = maximum
+        self.restore_rate = restore_rate
+        # Learned from requestedQueryCost; used to size the next batch
+        self.mutation_cost = GRAPHQL_MUTATION_COST
+        self.updated_at = time.monotonic()
+        # Notified on every response, so waiters re-check as soon as the server reports more points
+        self.changed = threading.Condition()
+
+    def _restore(self):
+        now = time.monotonic()
+        if now > self.updated_at:
+            self.available = min(self.maximum, self.available + (now - self.updated_at) * self.restore_rate)
+            self.updated_at = now
+
+    def acquire(self, cost):
+        """Block until `cost` points are available, then reserve them."""
+        with self.changed:
+            while True:
+                self._restore()
+                needed = min(cost, self.maximum)
+                if self.available >= needed:
+                    self.available -= needed
+                    return
+                self.changed.wait((needed - self.available) / self.restore_rate)
+
+    def update(self, cost, mutations=0):
+        """Sync with a response's `extensions.cost`; `mutations` is the number of mutation fields sent."""
+        status = cost.get("throttleStatus") or {}
+        with self.changed:
+            if status:
+                self.maximum = float(status["maximumAvailable"])
+                self.available = float(status["currentlyAvailable"])
+                self.restore_rate = float(status["restoreRate"])
+                self.updated_at = time.monotonic()
+            if mutations and cost.get("requestedQueryCost"):
+                self.mutation_cost = max(1, cost["requestedQueryCost"] // mutations)
+            self.changed.notify_all()
+
+    def batch_size(self):
+        """Mutations per request: as many as one query's cost limit and the bucket allow."""
+        with self.changed:
+            per_query = GRAPHQL_MAX_QUERY_COST // self.mutation_cost
+            per_bucket = int(self.maximum // self.mutation_cost)
+        return max(1, min(ARTICLE_BATCH_SIZE, per_query, per_bucket))
+
+
+graphql_throttle = ShopifyGraphQLThrottle()
+
+
+def send_graphql(query, variables=None, cost=GRAPHQL_MUTATION_COST, mutations=0):
+    """
+    POST a GraphQL query, reserving `cost` points first and waiting out THROTTLED errors.
+
+    Returns the parsed response body (`data`, `errors`, `extensions`).
+    """
+    for attempt in range(1, MAX_RETRIES + 1):
+        graphql_throttle.acquire(cost)
+        response = send_request("POST", GRAPHQL_URL, rest_limited=False,
+                                json={"query": query, "variables": variables or {}})
+        body = response.json()
+        graphql_throttle.update(body.get("extensions", {}).get("cost", {}), mutations)
+        errors = body.get("errors") or []
+        if any(error.get("extensions", {}).get("code") == "THROTTLED" for error in errors):
+            wait = cost / graphql_throttle.restore_rate
+            logging.warning(f"Shopify GraphQL throttled, retrying in {wait:.1f}s (attempt {attempt}/{MAX_RETRIES})")
+            record_retry("shopify")
+            time.sleep(wait)
+            continue
+        return body
+    return body
+
+
+def article_gid(article_id):
+    return f"gid://shopify/Article/{article_id}"
+
+
+def _gid_to_id(gid):
+    return int(str(gid).rsplit("/", 1)[-1])
+
+
+def _article_input(blog_data):
+    return {field: blog_data[key] for key, field in ARTICLE_INPUT_FIELDS.items() if key in blog_data}
+
+
+def build_article_mutation(articles):
+    """
+    Build one mutation with an aliased `articleCreate` or `articleUpdate` field per article.
+
+    `articles` is a list of `(shopify_article_id, blog_data)`; field `a<i>` holds the result of article i.
+    """
+    declarations, fields, variables = [], [], {}
+    for index, (shopify_article_id, blog_data) in enumerate(articles):
+        article = _article_input(blog_data)
+        if shopify_article_id:
+            declarations += [f"$id{index}: ID!", f"$article{index}: ArticleUpdateInput!"]
+            fields.append(f"a{index}: articleUpdate(id: $id{index}, article: $article{index}) "
+                          f"{{ {ARTICLE_RESULT_FIELDS} }}")
+            variables[f"id{index}"] = article_gid(shopify_article_id)
+        else:
+            article["blogId"] = f"gid://shopify/Blog/{BLOG_ID}"
+            article.setdefault("author", {"name": ARTICLE_AUTHOR})
+            declarations.append(f"$article{index}: ArticleCreateInput!")
+            fields.append(f"a{index}: articleCreate(article: $article{index}) {{ {ARTICLE_RESULT_FIELDS} }}")
+        variables[f"article{index}"] = article
+    return f"mutation PublishArticles({', '.join(declarations)}) {{ {' '.join(fields)} }}", variables
+
+
+def _article_batches(articles):
+    """Split `articles` into batches sized by the current query cost and ARTICLE_BATCH_BYTES."""
+    batch, size = [], 0
+    for article in articles:
+        blog_data = article[2]
+        article_size = len(blog_data.get("title") or "") + len(blog_data.get("body_html") or "")
+        if batch and (len(batch) >= graphql_throttle.batch_size() or size + article_size > ARTICLE_BATCH_BYTES):
+            yield batch
+            batch, size = [], 0
+        batch.append(article)
+        size += article_size
+    if batch:
+        yield batch
+
+
+def publish_shopify_articles(articles):
+    """
+    Create or update articles through the GraphQL Admin API, several mutations per request.
+
+    `articles` is a list of `(key, shopify_article_id, blog_data)`, where `blog_data` uses the
+    REST field names (`title`, `body_html`, ...). Returns `{key: (success, shopify_article_id)}`
+    with numeric article ids, like `create_or_update_shopify_blog`. Safe to call from several threads.
+    """
+    results = {}
+    for batch in _article_batches(articles):
+        query, variables = build_article_mutation([(article_id, data) for _, article_id, data in batch])
+        try:
+            body = send_graphql(query, variables, cost=len(batch) * graphql_throttle.mutation_cost,
+                                mutations=len(batch))
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error publishing {len(batch)} articles to Shopify: {e}")
+            body = {}
+        data = body.get("data") or {}
+        if body.get("errors"):
+            logging.error(f"Shopify GraphQL errors publishing {len(batch)} articles: {body['errors']}")
+        for index, (key, shopify_article_id, blog_data) in enumerate(batch):
+            payload = data.get(f"a{index}") or {}
+            article = payload.get("article")
+            if article and not payload.get("userErrors"):
+                results[key] = (True, _gid_to_id(article["id"]))
+            else:
+                if payload.get("userErrors"):
+                    logging.error(f"Shopify rejected article '{blog_data.get('title')}': {payload['userErrors']}")
+                results[key] = (False, shopify_article_id)
+    return results
+
 if __name__ == "__main__":
+    configure_logging()
     logging.info("Starting the Shopify integration script...")
     get_shopify_blogs()
     get_shopify_products()
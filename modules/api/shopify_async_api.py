@@ -0,0 +1,122 @@
+"""
+Async Shopify Admin REST client built on httpx.AsyncClient.
+
+Shares the store configuration, the per-process leaky bucket and the cross-process
+shared limiter with `shopify_api`, so sync and async callers never overrun the
+store quota together. Many requests can be in flight on one connection pool
+(HTTP/2 when the `h2` package is installed), which lets a single process keep the
+Shopify bucket saturated.
+
+    async with AsyncShopifyClient() as shopify:
+        async for articles in shopify.iter_article_pages():
+            ...
+"""
+import asyncio
+import importlib.util
+import logging
+from datetime import datetime
+
+import httpx
+
+from modules.api.http_cassette import cassette_async_transport
+from modules.api.shopify_api import (
+    BLOG_ID, MAX_RETRIES, SHOPIFY_STORE_URL, STORE_KEY, headers, rate_limiter, shared_limiter,
+)
+from modules.monitoring.metrics import record_bytes, record_retry, timed
+
+API_VERSION = "2023-10"
+# httpx needs the optional h2 package for HTTP/2; fall back to HTTP/1.1 keep-alive without it
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class AsyncShopifyClient:
+    """Rate-limited async client for one store; use as `async with`."""
+
+    def __init__(self, store_url=None, blog_id=None, max_connections=20, http2=True, timeout=30):
+        self.store_url = store_url or SHOPIFY_STORE_URL
+        self.blog_id = blog_id or BLOG_ID
+        self.max_connections = max_connections
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.timeout = timeout
+        self.client = None
+
+    async def __aenter__(self):
+        if not self.http2:
+            logging.info("Async Shopify client using HTTP/1.1 (install h2 for HTTP/2).")
+        # The transport carries both the HTTP/2 and the connection pool settings
+        transport = httpx.AsyncHTTPTransport(
+            http2=self.http2,
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections),
+        )
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=self.timeout,
+            transport=cassette_async_transport(f"shopify_async_{STORE_KEY}" if STORE_KEY else "shopify_async", transport),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.client.aclose()
+        self.client = None
+
+    def _url(self, path):
+        return f"{self.store_url}/admin/api/{API_VERSION}/{path}"
+
+    async def send_request(self, method, url, **kwargs):
+        """Send a rate-limited request, retrying on 429 and 5xx responses."""
+        for attempt in range(1, MAX_RETRIES + 1):
+            await shared_limiter.acquire_async()
+            await rate_limiter.acquire_async()
+            with timed("shopify", method):
+                response = await self.client.request(method, url, **kwargs)
+            record_bytes("shopify", sent=len(response.request.content or b""), received=len(response.content))
+            rate_limiter.update_from_header(response.headers.get("X-Shopify-Shop-Api-Call-Limit"))
+
+            if response.status_code == 429 or response.status_code >= 500:
+                retry_after = float(response.headers.get("Retry-After", 2 ** attempt))
+                logging.warning(f"Shopify returned {response.status_code} for {url}, retrying in {retry_after}s "
+                                f"(attempt {attempt}/{MAX_RETRIES})")
+                if response.status_code == 429:
+                    rate_limiter.backoff(retry_after)
+                record_retry("shopify")
+                await asyncio.sleep(retry_after)
+                continue
+
+            response.raise_for_status()
+            return response
+
+        response.raise_for_status()
+        return response
+
+    async def iter_pages(self, path, key, params=None):
+        """Yield each page of a paginated endpoint as a list, following the `Link` cursor."""
+        url = self._url(path)
+        total = 0
+        while url:
+            logging.info(f"Making request to URL: {url}")
+            try:
+                response = await self.send_request("GET", url, params=params)
+            except httpx.HTTPError as e:
+                logging.error(f"Error during API request: {e}")
+                return
+            # The cursor link already carries limit and the filters
+            params = None
+            url = response.links.get("next", {}).get("url")
+            items = response.json().get(key, [])
+            total += len(items)
+            logging.info(f"Fetched {len(items)} {key} from Shopify. Total so far: {total}")
+            if items:
+                yield items
+
+    def iter_product_pages(self, limit=250):
+        """Async iterator over pages of products."""
+        return self.iter_pages("products.json", "products", {"limit": limit})
+
+    def iter_article_pages(self, updated_at_min=None, limit=250):
+        """Async iterator over pages of articles in the blog, optionally only those changed since `updated_at_min`."""
+        params = {"limit": limit}
+        if updated_at_min:
+            params["updated_at_min"] = (updated_at_min.isoformat() if isinstance(updated_at_min, datetime)
+                                        else updated_at_min)
+        return self.iter_pages(f"blogs/{self.blog_id}/articles.json", "articles", params)
@@ -0,0 +1,92 @@
+"""
+Compact records for the Shopify product payloads the product sync consumes.
+
+Product pages are requested with `fields=PRODUCT_FIELDS` and parsed straight into
+slotted records holding only the product, variant and image fields the sync stores;
+everything else in the payload is dropped page by page instead of living on as
+nested dicts for the whole catalog. Repeated low-cardinality strings (vendor,
+status, weight unit, ...) are interned.
+
+Records support the read-only dict access the sync code already uses
+(`product["title"]`, `variant.get("sku")`), so webhook payloads, which arrive as
+plain dicts, go through the same functions. A field missing from the payload is
+missing from the record too: `get()` returns the default and `[]` raises KeyError.
+
+Responses are decoded with orjson when it is installed.
+"""
+import importlib.util
+import json
+import sys
+
+# Optional faster decoder; the standard library json is used otherwise
+ORJSON_AVAILABLE = importlib.util.find_spec("orjson") is not None
+
+if ORJSON_AVAILABLE:
+    from orjson import loads
+else:
+    loads = json.loads
+
+
+class _Record:
+    __slots__ = ()
+    # Fields whose values repeat across the catalog and are interned
+    _interned = ()
+
+    def __init__(self, data):
+        for name in self.__slots__:
+            if name in data:
+                value = data[name]
+                if name in self._interned and isinstance(value, str):
+                    value = sys.intern(value)
+                setattr(self, name, value)
+
+    def __getitem__(self, name):
+        if name not in self.__slots__:
+            raise KeyError(name)
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def get(self, name, default=None):
+        if name not in self.__slots__:
+            return default
+        return getattr(self, name, default)
+
+    def __contains__(self, name):
+        return name in self.__slots__ and hasattr(self, name)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if hasattr(self, name))
+        return f"{type(self).__name__}({fields})"
+
+
+class VariantRecord(_Record):
+    __slots__ = ("id", "title", "price", "sku", "inventory_quantity", "inventory_policy", "weight", "weight_unit")
+    _interned = ("title", "inventory_policy", "weight_unit")
+
+
+class ImageRecord(_Record):
+    __slots__ = ("id", "position", "src", "alt", "variant_ids")
+
+
+class ProductRecord(_Record):
+    __slots__ = ("id", "title", "body_html", "product_type", "created_at", "updated_at",
+                 "vendor", "status", "handle", "variants", "images")
+    _interned = ("product_type", "vendor", "status")
+
+    def __init__(self, data):
+        super().__init__(data)
+        if "variants" in data:
+            self.variants = tuple(VariantRecord(variant) for variant in data["variants"] or ())
+        if "images" in data:
+            self.images = tuple(ImageRecord(image) for image in data["images"] or ())
+
+
+# Top-level keys requested from products.json; Shopify returns variants and images whole
+PRODUCT_FIELDS = ",".join(ProductRecord.__slots__)
+
+
+def parse_products(data):
+    """Turn a decoded products.json page into ProductRecord objects."""
+    return [ProductRecord(product) for product in data.get("products", [])]
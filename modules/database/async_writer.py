@@ -0,0 +1,83 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from config.common import setup_logger
+from modules.database.db_connection import connect_db
+
+# 初始化日誌
+logger = setup_logger(script_name="async_writer")
+
+
+class AsyncDBWriter:
+    """
+    供 asyncio 代碼使用的 MySQL 寫入通道。
+
+    寫入任務在專用的單線程中依次執行並各自提交，事件循環在寫入期間可以繼續發出 API 請求。
+    最多排隊 `max_pending` 個任務，寫入跟不上時 `submit` 會等待，內存不會無限增長。
+
+        async with AsyncDBWriter() as writer:
+            await writer.submit(upsert_rows, rows)   # upsert_rows(cursor, rows)
+    """
+
+    def __init__(self, connection=None, max_pending=4):
+        self.connection = connection
+        self.owns_connection = connection is None
+        self.max_pending = max_pending
+        # pymysql 連接不是線程安全的，所有寫入固定在同一個線程
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-db-writer")
+        self.queue = None
+        self.task = None
+        self.error = None
+        self.results = []
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        if self.connection is None:
+            self.connection = await loop.run_in_executor(self.executor, connect_db)
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self.task = asyncio.create_task(self._drain())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.queue.put(None)
+        await self.task
+        loop = asyncio.get_running_loop()
+        if self.owns_connection:
+            await loop.run_in_executor(self.executor, self.connection.close)
+        self.executor.shutdown(wait=True)
+        if self.error is not None and exc_type is None:
+            raise self.error
+
+    def _run(self, func, args):
+        with self.connection.cursor() as cursor:
+            result = func(cursor, *args)
+        self.connection.commit()
+        return result
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            func, args = item
+            if self.error is not None:
+                continue
+            try:
+                self.results.append(await loop.run_in_executor(self.executor, self._run, func, args))
+            except Exception as e:
+                logger.error(f"❌ 異步寫入失敗: {e}")
+                await loop.run_in_executor(self.executor, self.connection.rollback)
+                self.error = e
+
+    async def submit(self, func, *args):
+        """排隊執行 `func(cursor, *args)` 並提交；之前的寫入失敗時拋出該錯誤。"""
+        if self.error is not None:
+            raise self.error
+        await self.queue.put((func, args))
+
+    async def execute_many(self, query, rows):
+        """排隊執行一次 executemany。"""
+        rows = list(rows)
+        if rows:
+            await self.submit(lambda cursor, batch: cursor.executemany(query, batch), rows)
@@ -1,5 +1,8 @@
+import hashlib
+import re
 import pymysql
 from config.common import setup_logger, get_config, CONFIG_DIR, ensure_sys_path
+from modules.monitoring.metrics import record_rows, timed
 
 # 確保 sys.path 配置正確
 ensure_sys_path()
@@ -7,6 +10,24 @@ ensure_sys_path()
 # 初始化日誌
 logger = setup_logger(script_name="db_connection")
 
+# 從寫入語句中提取表名，用於統計寫入行數
+WRITE_TABLE_PATTERN = re.compile(
+    r"^\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+(?:\w+\s+)?FROM)\s+(?:\w+\.)?(\w+)",
+    re.IGNORECASE,
+)
+
+class InstrumentedDictCursor(pymysql.cursors.DictCursor):
+    """記錄每條語句耗時和寫入行數的 DictCursor"""
+
+    def execute(self, query, args=None):
+        operation = query.lstrip().split(None, 1)[0].lower() if query.strip() else "unknown"
+        with timed("mysql", operation):
+            affected = super().execute(query, args)
+        match = WRITE_TABLE_PATTERN.match(query)
+        if match:
+            record_rows(match.group(1), affected)
+        return affected
+
 def connect_db():
     """
     使用配置文件建立並返回 MySQL 數據庫連接。
@@ -23,14 +44,15 @@ def connect_db():
         }
 
         # 創建數據庫連接
-        connection = pymysql.connect(
-            host=db_config["host"],
-            user=db_config["user"],
-            password=db_config["password"],
-            database=db_config["database"],
-            charset=db_config["charset"],
-            cursorclass=pymysql.cursors.DictCursor,  # 返回字典格式的結果
-        )
+        with timed("mysql", "connect"):
+            connection = pymysql.connect(
+                host=db_config["host"],
+                user=db_config["user"],
+                password=db_config["password"],
+                database=db_config["database"],
+                charset=db_config["charset"],
+                cursorclass=InstrumentedDictCursor,  # 返回字典格式的結果，並記錄耗時
+            )
         logger.info("✅ 成功連接到數據庫")
         return connection
     except Exception as e:
@@ -46,19 +68,14 @@ def fetch_keywords_from_database(connection=None, min_searches=100):
         min_searches (int, optional): 關鍵詞的最低平均每月搜索量，默認為 100。
 
     Returns:
-        list: 符合條件的關鍵詞列表
+        list: 符合條件的關鍵詞列表（大表請直接使用 iter_keywords / iter_keyword_chunks 流式處理）
     """
     try:
         # 如果沒有提供 connection，自動建立
         if connection is None:
             connection = connect_db()
 
-        with connection.cursor() as cursor:
-            query = f"SELECT keyword FROM ecommerce_data_db.keywords WHERE avg_monthly_searches >= %s"
-            cursor.execute(query, (min_searches,))
-            result = cursor.fetchall()
-
-        keywords = [row["keyword"] for row in result]
+        keywords = list(iter_keywords(min_searches=min_searches, connection=connection))
         if not keywords:
             logger.warning("⚠️ 關鍵詞列表為空，請檢查數據庫內容。")
         return keywords
@@ -70,6 +87,107 @@ def fetch_keywords_from_database(connection=None, min_searches=100):
             connection.close()
             logger.info("🔒 數據庫連接已關閉")
 
+def iter_keywords(table_name="keywords", min_searches=None, fetch_size=1000, connection=None):
+    """
+    按主鍵分頁（keyset）逐批讀取關鍵詞，內存佔用與表大小無關。
+
+    只讀取開始時已存在的行（id 不超過當時的最大 id），處理過程中新插入的關鍵詞不會被讀到。
+    每頁是一條獨立的短查詢，兩頁之間調用方可以花任意長時間處理，不會像服務端游標那樣
+    長時間佔住結果集而觸發 net_write_timeout。
+
+    Args:
+        table_name (str, optional): 關鍵詞表名，默認為 "keywords"。
+        min_searches (int, optional): 只讀取平均每月搜索量不低於該值的關鍵詞。
+        fetch_size (int, optional): 每次查詢讀取的行數，默認為 1000。
+        connection (object, optional): 現有的數據庫連接對象。如果未提供，將自動建立並在結束時關閉。
+
+    Yields:
+        str: 關鍵詞
+    """
+    condition, args = "", []
+    if min_searches is not None:
+        condition, args = "AND avg_monthly_searches >= %s", [min_searches]
+
+    own_connection = connection is None
+    if own_connection:
+        connection = connect_db()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT MAX(id) AS max_id FROM {table_name}")
+            max_id = cursor.fetchone()["max_id"] or 0
+            last_id = 0
+            while last_id < max_id:
+                cursor.execute(
+                    f"""
+                    SELECT id, keyword FROM {table_name}
+                    WHERE id > %s AND id <= %s {condition}
+                    ORDER BY id
+                    LIMIT %s
+                    """,
+                    [last_id, max_id] + args + [fetch_size],
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1]["id"]
+                for row in rows:
+                    yield row["keyword"]
+    finally:
+        if own_connection:
+            connection.close()
+
+def iter_keyword_chunks(table_name="keywords", chunk_size=20, min_searches=None, fetch_size=1000):
+    """
+    將 iter_keywords 的結果按 `chunk_size` 分組，直接交給批處理階段。
+
+    Yields:
+        list: 最多 `chunk_size` 個關鍵詞
+    """
+    chunk = []
+    for keyword in iter_keywords(table_name, min_searches=min_searches, fetch_size=fetch_size):
+        chunk.append(keyword)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def ensure_column(connection, table_name, column_name, definition):
+    """
+    如果表中還沒有該列，則添加它（MySQL 不支持 ADD COLUMN IF NOT EXISTS）。
+
+    Args:
+        connection (object): 數據庫連接對象。
+        table_name (str): 表名。
+        column_name (str): 列名。
+        definition (str): 列定義，例如 "CHAR(32) NULL"。
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT COUNT(*) AS column_count FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+            """,
+            (table_name, column_name),
+        )
+        if cursor.fetchone()["column_count"]:
+            return
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {definition}")
+    connection.commit()
+    logger.info(f"✅ 已為表 {table_name} 添加列 {column_name}")
+
+def content_hash(*fields):
+    """
+    計算字段內容的緊湊哈希（blake2b 128 位，32 個十六進制字符），用於跳過沒有變化的寫入。
+
+    字段先做規範化：None 視為空字符串，字符串去除首尾空白，其他值轉為字符串。
+    """
+    normalized = "\x1f".join(
+        "" if field is None else field.strip() if isinstance(field, str) else str(field)
+        for field in fields
+    )
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
 # 測試代碼
 if __name__ == "__main__":
     try:
@@ -0,0 +1,236 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+from config.common import setup_logger
+from modules.api.rate_limiter import get_shared_limiter
+from modules.database.db_connection import connect_db, content_hash
+from modules.monitoring.metrics import timed
+
+# 初始化日誌
+logger = setup_logger(script_name="google_ads_mirror")
+
+# 與 google_ads_api 共用同一個進程內的配額桶
+google_ads_limiter = get_shared_limiter("google_ads")
+
+# 廣告賬戶結構（廣告系列、廣告組、RSA 廣告）的本地鏡像，每個實體一行。
+# 按 (customer_id, entity_type, parent_resource_name, name) 查找，廣告的 name 是文案的內容哈希。
+GOOGLE_ADS_MIRROR_DDL = """
+    CREATE TABLE IF NOT EXISTS google_ads_mirror (
+        customer_id VARCHAR(20) NOT NULL,
+        resource_name VARCHAR(255) NOT NULL,
+        entity_type ENUM('campaign', 'ad_group', 'ad') NOT NULL,
+        parent_resource_name VARCHAR(255) NOT NULL DEFAULT '',
+        name VARCHAR(255) NOT NULL,
+        status VARCHAR(32) NOT NULL,
+        detail JSON NULL,
+        PRIMARY KEY (customer_id, resource_name),
+        KEY idx_google_ads_mirror_lookup (customer_id, entity_type, parent_resource_name, name)
+    )
+"""
+
+# 每個賬戶上次從 API 完整刷新鏡像的時間
+GOOGLE_ADS_MIRROR_STATE_DDL = """
+    CREATE TABLE IF NOT EXISTS google_ads_mirror_state (
+        customer_id VARCHAR(20) NOT NULL PRIMARY KEY,
+        refreshed_at DATETIME NOT NULL
+    )
+"""
+
+# 鏡像的有效期（秒），過期後下一次讀取會重新查詢 API
+MIRROR_TTL = int(os.environ.get("GOOGLE_ADS_MIRROR_TTL", 3600))
+
+# GAQL 每個查詢只能有一個 FROM 資源；沒有廣告的廣告組、沒有廣告組的廣告系列也要進入鏡像，
+# 所以每種實體各用一個 search_stream 查詢，已刪除的實體不讀取
+MIRROR_QUERIES = {
+    "campaign": """
+        SELECT campaign.resource_name, campaign.name, campaign.status,
+               campaign_budget.resource_name, campaign_budget.amount_micros
+        FROM campaign
+        WHERE campaign.status != 'REMOVED'
+    """,
+    "ad_group": """
+        SELECT ad_group.resource_name, ad_group.name, ad_group.status, ad_group.campaign,
+               ad_group.cpc_bid_micros
+        FROM ad_group
+        WHERE ad_group.status != 'REMOVED' AND campaign.status != 'REMOVED'
+    """,
+    "ad": """
+        SELECT ad_group_ad.resource_name, ad_group_ad.ad_group, ad_group_ad.status,
+               ad_group_ad.ad.responsive_search_ad.headlines,
+               ad_group_ad.ad.responsive_search_ad.descriptions,
+               ad_group_ad.ad.final_urls
+        FROM ad_group_ad
+        WHERE ad_group_ad.ad.type = 'RESPONSIVE_SEARCH_AD' AND ad_group_ad.status != 'REMOVED'
+    """,
+}
+
+
+def rsa_content_hash(headlines, descriptions, final_urls):
+    """RSA 廣告文案的內容哈希，相同文案的廣告不會重複創建。"""
+    return content_hash(*headlines, "\x1e", *descriptions, "\x1e", *final_urls)
+
+
+def _entity(entity_type, resource_name, parent, name, status, **detail):
+    return {"entity_type": entity_type, "resource_name": resource_name, "parent_resource_name": parent or "",
+            "name": name, "status": status, "detail": detail}
+
+
+def _row_entity(entity_type, row):
+    if entity_type == "campaign":
+        return _entity("campaign", row.campaign.resource_name, "", row.campaign.name, row.campaign.status.name,
+                       budget=row.campaign_budget.resource_name,
+                       budget_amount_micros=row.campaign_budget.amount_micros)
+    if entity_type == "ad_group":
+        return _entity("ad_group", row.ad_group.resource_name, row.ad_group.campaign, row.ad_group.name,
+                       row.ad_group.status.name, cpc_bid_micros=row.ad_group.cpc_bid_micros)
+    ad = row.ad_group_ad.ad
+    headlines = [asset.text for asset in ad.responsive_search_ad.headlines]
+    descriptions = [asset.text for asset in ad.responsive_search_ad.descriptions]
+    return _entity("ad", row.ad_group_ad.resource_name, row.ad_group_ad.ad_group,
+                   rsa_content_hash(headlines, descriptions, list(ad.final_urls)), row.ad_group_ad.status.name)
+
+
+def fetch_account_structure(client, customer_id):
+    """
+    用 GoogleAdsService.search_stream 讀取賬戶中所有未刪除的廣告系列、廣告組和 RSA 廣告。
+
+    Returns:
+        list: 實體字典（entity_type、resource_name、parent_resource_name、name、status、detail）
+    """
+    ga_service = client.get_service("GoogleAdsService")
+    entities = []
+    for entity_type, query in MIRROR_QUERIES.items():
+        google_ads_limiter.acquire()
+        with timed("google_ads", "search_stream"):
+            for batch in ga_service.search_stream(customer_id=customer_id, query=query):
+                entities.extend(_row_entity(entity_type, row) for row in batch.results)
+    return entities
+
+
+class AccountMirror:
+    """
+    一個 Google Ads 賬戶結構的內存視圖，按名稱查找已有實體。
+
+    `record` 在本地創建或修改實體後寫穿到 MySQL，鏡像在有效期內保持準確，不需要重新查詢 API。
+    """
+
+    def __init__(self, customer_id, entities, refreshed_at):
+        self.customer_id = str(customer_id)
+        self.refreshed_at = refreshed_at
+        self.entities = {}
+        for entity in entities:
+            self._index(entity)
+
+    def _index(self, entity):
+        self.entities[(entity["entity_type"], entity["parent_resource_name"], entity["name"])] = entity
+
+    def find(self, entity_type, name, parent=""):
+        """按類型、上級資源名和名稱查找實體，不存在時返回 None。"""
+        return self.entities.get((entity_type, parent or "", name))
+
+    def children(self, entity_type, parent):
+        """返回 `parent` 下某類型的所有實體。"""
+        return [entity for (kind, entity_parent, _), entity in self.entities.items()
+                if kind == entity_type and entity_parent == parent]
+
+    def record(self, entity_type, resource_name, name, status, parent="", connection=None, **detail):
+        """把新建或修改後的實體寫入鏡像和 MySQL。"""
+        entity = _entity(entity_type, resource_name, parent, name, status, **detail)
+        self._index(entity)
+        own_connection = connection is None
+        if own_connection:
+            connection = connect_db()
+        try:
+            with connection.cursor() as cursor:
+                _upsert_entities(cursor, self.customer_id, [entity])
+            connection.commit()
+        finally:
+            if own_connection:
+                connection.close()
+        return entity
+
+
+def _upsert_entities(cursor, customer_id, entities):
+    cursor.executemany(
+        """
+        INSERT INTO google_ads_mirror
+            (customer_id, resource_name, entity_type, parent_resource_name, name, status, detail)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            entity_type = VALUES(entity_type),
+            parent_resource_name = VALUES(parent_resource_name),
+            name = VALUES(name),
+            status = VALUES(status),
+            detail = VALUES(detail)
+        """,
+        [
+            (customer_id, entity["resource_name"], entity["entity_type"], entity["parent_resource_name"],
+             entity["name"], entity["status"], json.dumps(entity["detail"]))
+            for entity in entities
+        ],
+    )
+
+
+def ensure_google_ads_mirror_tables(connection):
+    """建立鏡像表和刷新狀態表（如果不存在）。"""
+    with connection.cursor() as cursor:
+        cursor.execute(GOOGLE_ADS_MIRROR_DDL)
+        cursor.execute(GOOGLE_ADS_MIRROR_STATE_DDL)
+    connection.commit()
+
+
+def refresh_account_mirror(client, customer_id, connection):
+    """從 API 重新讀取賬戶結構，整體替換該賬戶的鏡像行。"""
+    customer_id = str(customer_id)
+    entities = fetch_account_structure(client, customer_id)
+    refreshed_at = datetime.now().replace(microsecond=0)
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM google_ads_mirror WHERE customer_id = %s", (customer_id,))
+        if entities:
+            _upsert_entities(cursor, customer_id, entities)
+        cursor.execute(
+            """
+            INSERT INTO google_ads_mirror_state (customer_id, refreshed_at) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE refreshed_at = VALUES(refreshed_at)
+            """,
+            (customer_id, refreshed_at),
+        )
+    connection.commit()
+    logger.info(f"✅ 已刷新 Google Ads 賬戶 {customer_id} 的鏡像：{len(entities)} 個實體")
+    return AccountMirror(customer_id, entities, refreshed_at)
+
+
+def load_account_mirror(client, customer_id, max_age=MIRROR_TTL, force=False, connection=None):
+    """
+    返回賬戶結構鏡像：有效期內直接讀 MySQL，過期、不存在或 `force=True` 時先用 search_stream 刷新。
+    """
+    customer_id = str(customer_id)
+    own_connection = connection is None
+    if own_connection:
+        connection = connect_db()
+    try:
+        ensure_google_ads_mirror_tables(connection)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT refreshed_at FROM google_ads_mirror_state WHERE customer_id = %s AND refreshed_at > %s",
+                (customer_id, datetime.now().replace(microsecond=0) - timedelta(seconds=max_age)),
+            )
+            state = cursor.fetchone()
+            if not force and state:
+                cursor.execute(
+                    """
+                    SELECT resource_name, entity_type, parent_resource_name, name, status, detail
+                    FROM google_ads_mirror WHERE customer_id = %s
+                    """,
+                    (customer_id,),
+                )
+                entities = [
+                    {**row, "detail": json.loads(row["detail"]) if row["detail"] else {}}
+                    for row in cursor.fetchall()
+                ]
+                return AccountMirror(customer_id, entities, state["refreshed_at"])
+        return refresh_account_mirror(client, customer_id, connection)
+    finally:
+        if own_connection:
+            connection.close()
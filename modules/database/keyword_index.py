@@ -0,0 +1,412 @@
+"""
+關鍵詞搜索索引：在內存中按前綴、子串和模糊（三元組相似度）查找 `keywords` 表中的關鍵詞，
+結果按 avg_monthly_searches 從高到低排列（模糊查詢先按相似度）。
+
+索引全部存放在數組中：
+- 按小寫文本排序的關鍵詞數組（二分查找，相當於壓縮的前綴樹）；
+- 字符三元組倒排表，每個倒排列表按搜索量降序存放關鍵詞 ID，查詢取夠 `limit` 條即可停止；
+- 上次重建後新增或搜索量變化的關鍵詞放在一個小的增量集合中，查詢時單獨掃描，
+  超過 MAX_DELTA 條後整體重建。
+
+模糊查詢用 NumPy 的 bincount 統計共同三元組數，按相似度（以 0.1 為一檔）再按搜索量排序。
+
+跨進程更新：關鍵詞計劃和歷史指標模塊寫入數據庫後，把變化追加到 `data/keyword_index/keywords.journal`；
+讀取進程每次查詢前 stat 一次快照和日誌，只重放新增的日誌行。日誌超過 JOURNAL_COMPACT_BYTES 時
+由寫入進程合併進快照。
+
+線程安全：重放和重新載入在鎖內進行，並且在索引的副本上完成後才替換進程內共享的索引；
+已發布的索引對象不再修改，查詢無需加鎖。
+
+    index = get_keyword_index()
+    index.prefix("eco fr")
+    index.fuzzy("ecofriendly packging")
+"""
+import bisect
+import fcntl
+import json
+import logging
+import math
+import os
+import pickle
+import tempfile
+import threading
+from array import array
+from collections import defaultdict
+
+import numpy as np
+
+from modules.database.db_connection import connect_db
+
+KEYWORD_INDEX_DIR = os.environ.get(
+    "AUTOCONTENTIFY_KEYWORD_INDEX_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/keyword_index"))
+)
+# 索引只覆蓋這張表；其他表名（例如測試表）的寫入不記錄
+KEYWORD_INDEX_TABLE = "keywords"
+
+# 增量集合超過這個大小時重建數組
+MAX_DELTA = 1000
+# 前綴範圍不超過 limit 的這個倍數時直接排序整個範圍，否則沿錨定三元組的倒排列表按排名查找
+PREFIX_SCAN_FACTOR = 8
+FUZZY_THRESHOLD = 0.3
+# 日誌超過這個大小時合併進快照
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+
+
+def _trigrams(text):
+    """帶邊界的三元組（與 pg_trgm 相同：前面補兩個空格，後面補一個）。"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _inner_trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class KeywordIndex:
+    """
+    關鍵詞 ID 從 0 開始連續分配；`keywords`、`folded`、`searches`、`trigram_counts` 按 ID 存放。
+
+    prefix / contains 按搜索量排序；fuzzy 先按相似度再按搜索量排序。
+
+    upsert / apply / rebuild 會修改對象本身；共享給其他線程的索引要先 `copy()` 再更新。
+    """
+
+    def __init__(self):
+        self.keywords = []
+        self.folded = []
+        self.searches = array("q")
+        self.trigram_counts = array("H")
+        self.ids = {}
+        # 上次重建時的數組
+        self.sorted_keywords = []
+        self.sorted_ids = array("I")
+        self.ranked_ids = array("I")
+        self.postings = {}
+        # 重建後新增或變化的 ID（有序集合）；新增關鍵詞的三元組另存一份，供模糊查詢計數
+        self.delta = {}
+        self.delta_postings = defaultdict(list)
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def copy(self):
+        """可以獨立更新的副本。重建生成的數組之後不再修改，直接共享；按 ID 存放的數組和增量集合複製一份。"""
+        index = KeywordIndex.__new__(KeywordIndex)
+        index.keywords = list(self.keywords)
+        index.folded = list(self.folded)
+        index.searches = array("q", self.searches)
+        index.trigram_counts = array("H", self.trigram_counts)
+        index.ids = dict(self.ids)
+        index.sorted_keywords = self.sorted_keywords
+        index.sorted_ids = self.sorted_ids
+        index.ranked_ids = self.ranked_ids
+        index.postings = self.postings
+        index.delta = dict(self.delta)
+        index.delta_postings = defaultdict(list, {trigram: list(ids) for trigram, ids in self.delta_postings.items()})
+        if hasattr(self, "journal_offset"):
+            index.journal_offset = self.journal_offset
+        return index
+
+    def upsert(self, keyword, searches, rebuild=True):
+        """新增關鍵詞或更新其搜索量；`rebuild=False` 時由調用方在批量更新後調用 `maybe_rebuild`。"""
+        searches = int(searches or 0)
+        keyword_id = self.ids.get(keyword)
+        if keyword_id is None:
+            keyword_id = len(self.keywords)
+            folded = keyword.lower()
+            self.ids[keyword] = keyword_id
+            self.keywords.append(keyword)
+            self.folded.append(folded)
+            self.searches.append(searches)
+            trigrams = _trigrams(folded)
+            self.trigram_counts.append(min(len(trigrams), 0xFFFF))
+            for trigram in trigrams:
+                self.delta_postings[trigram].append(keyword_id)
+        elif self.searches[keyword_id] == searches:
+            return
+        else:
+            self.searches[keyword_id] = searches
+        self.delta[keyword_id] = None
+        if rebuild:
+            self.maybe_rebuild()
+
+    def apply(self, rows):
+        """批量更新 `(keyword, avg_monthly_searches)`，最多重建一次。"""
+        for keyword, searches in rows:
+            self.upsert(keyword, searches, rebuild=False)
+        self.maybe_rebuild()
+
+    def maybe_rebuild(self):
+        if len(self.delta) > MAX_DELTA:
+            self.rebuild()
+
+    def rebuild(self):
+        """按當前搜索量重建排序數組和倒排表，清空增量集合。"""
+        count = len(self.keywords)
+        ranked = sorted(range(count), key=self.searches.__getitem__, reverse=True)
+        postings = defaultdict(list)
+        folded = self.folded
+        for keyword_id in ranked:
+            for trigram in _trigrams(folded[keyword_id]):
+                postings[trigram].append(keyword_id)
+        order = sorted(range(count), key=folded.__getitem__)
+
+        self.ranked_ids = array("I", ranked)
+        self.postings = {trigram: array("I", ids) for trigram, ids in postings.items()}
+        self.sorted_ids = array("I", order)
+        self.sorted_keywords = [folded[keyword_id] for keyword_id in order]
+        self.delta = {}
+        self.delta_postings = defaultdict(list)
+
+    def _collect(self, candidates, predicate, limit):
+        """
+        按排名遍歷重建時的候選 ID（跳過增量集合中的 ID），取夠 `limit` 條即停止；
+        再加上增量集合中的匹配項，按當前搜索量排序。
+        """
+        delta = self.delta
+        matches = []
+        for keyword_id in candidates:
+            if keyword_id not in delta and predicate(keyword_id):
+                matches.append(keyword_id)
+                if len(matches) >= limit:
+                    break
+        matches.extend(keyword_id for keyword_id in delta if predicate(keyword_id))
+        matches.sort(key=self.searches.__getitem__, reverse=True)
+        return [(self.keywords[keyword_id], self.searches[keyword_id]) for keyword_id in matches[:limit]]
+
+    def prefix(self, text, limit=20):
+        """以 `text` 開頭的關鍵詞（不區分大小寫）。"""
+        text = text.lower()
+        folded = self.folded
+        if not text:
+            return self._collect(self.ranked_ids, lambda keyword_id: True, limit)
+        low = bisect.bisect_left(self.sorted_keywords, text)
+        high = bisect.bisect_left(self.sorted_keywords, text[:-1] + chr(ord(text[-1]) + 1), low)
+        if high - low <= limit * PREFIX_SCAN_FACTOR:
+            candidates = sorted(self.sorted_ids[low:high], key=self.searches.__getitem__, reverse=True)
+        else:
+            # 匹配項很多：沿最後一個錨定三元組（"  a" 或 " ab"）的倒排列表按排名查找
+            anchored = f"  {text}"[1:4] if len(text) >= 2 else f"  {text}"
+            candidates = self.postings.get(anchored, ())
+        return self._collect(candidates, lambda keyword_id: folded[keyword_id].startswith(text), limit)
+
+    def contains(self, text, limit=20):
+        """包含子串 `text` 的關鍵詞（不區分大小寫）。"""
+        text = text.lower()
+        folded = self.folded
+        trigrams = _inner_trigrams(text)
+        if trigrams:
+            # 沿最短的倒排列表查找；某個三元組不存在時只可能在增量集合中匹配
+            postings = [self.postings.get(trigram, ()) for trigram in trigrams]
+            candidates = min(postings, key=len)
+        else:
+            candidates = self.ranked_ids
+        return self._collect(candidates, lambda keyword_id: text in folded[keyword_id], limit)
+
+    def fuzzy(self, text, limit=20, threshold=FUZZY_THRESHOLD):
+        """
+        三元組相似度（共同三元組數 / 三元組並集大小）不低於 `threshold` 的關鍵詞，可以容忍拼寫錯誤。
+
+        搜索量變化不影響三元組，所以只需補上增量集合中新增關鍵詞的倒排列表。
+        """
+        query = _trigrams(text.lower())
+        postings = [np.frombuffer(self.postings[trigram], dtype=np.uint32)
+                    for trigram in query if trigram in self.postings]
+        postings += [np.array(self.delta_postings[trigram], dtype=np.uint32)
+                     for trigram in query if self.delta_postings.get(trigram)]
+        if not postings:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.keywords))
+        # 相似度達標的關鍵詞至少有 threshold * |query| 個共同三元組，先用它篩掉大部分候選
+        candidates = np.flatnonzero(shared >= math.ceil(threshold * len(query)))
+        common = shared[candidates]
+        # 共享的索引不會再被修改，可以直接在數組緩衝區上取值
+        trigram_counts = np.frombuffer(self.trigram_counts, dtype=np.uint16)[candidates].astype(np.int64)
+        similarity = common / (len(query) + trigram_counts - common)
+        keep = similarity >= threshold
+        candidates, similarity = candidates[keep], similarity[keep]
+        searches = np.frombuffer(self.searches, dtype=np.int64)[candidates]
+        order = np.lexsort((-searches, -np.floor(similarity * 10)))[:limit]
+        return [(self.keywords[keyword_id], int(searches[position]))
+                for keyword_id, position in zip(candidates[order].tolist(), order.tolist())]
+
+    def __getstate__(self):
+        # folded、ids 和 sorted_keywords 可以在載入時從其他數組推出，不寫入快照
+        return {"keywords": self.keywords, "searches": self.searches, "trigram_counts": self.trigram_counts,
+                "sorted_ids": self.sorted_ids, "ranked_ids": self.ranked_ids, "postings": self.postings,
+                "delta": self.delta, "delta_postings": self.delta_postings}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.folded = [keyword.lower() for keyword in self.keywords]
+        self.ids = {keyword: keyword_id for keyword_id, keyword in enumerate(self.keywords)}
+        self.sorted_keywords = [self.folded[keyword_id] for keyword_id in self.sorted_ids]
+
+
+def _snapshot_path():
+    return os.path.join(KEYWORD_INDEX_DIR, "keywords.pkl")
+
+
+def _journal_path():
+    return os.path.join(KEYWORD_INDEX_DIR, "keywords.journal")
+
+
+class _JournalLock:
+    """日誌的排他鎖：追加、合併和從數據庫重建互斥。"""
+
+    def __enter__(self):
+        os.makedirs(KEYWORD_INDEX_DIR, exist_ok=True)
+        self.file = open(os.path.join(KEYWORD_INDEX_DIR, "keywords.lock"), "a")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def save_keyword_index(index):
+    """原子地寫入快照。"""
+    os.makedirs(KEYWORD_INDEX_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=KEYWORD_INDEX_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, _snapshot_path())
+
+
+def build_keyword_index(connection=None):
+    """從 `keywords` 表重建索引並保存快照，清空已包含在表中的日誌。"""
+    own_connection = connection is None
+    if own_connection:
+        connection = connect_db()
+    index = KeywordIndex()
+    try:
+        with _JournalLock():
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT keyword, avg_monthly_searches FROM {KEYWORD_INDEX_TABLE}")
+                for row in cursor.fetchall():
+                    index.upsert(row["keyword"], row["avg_monthly_searches"], rebuild=False)
+            index.rebuild()
+            save_keyword_index(index)
+            open(_journal_path(), "w").close()
+    finally:
+        if own_connection:
+            connection.close()
+    logging.info(f"關鍵詞索引已重建：{len(index)} 個關鍵詞，{len(index.postings)} 個三元組")
+    return index
+
+
+def _read_journal(offset=0):
+    """返回日誌中 `offset` 之後的完整行和新的偏移量。"""
+    try:
+        with open(_journal_path(), "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], 0
+    end = data.rfind(b"\n") + 1
+    rows = [json.loads(line) for line in data[:end].splitlines() if line]
+    return rows, offset + end
+
+
+def load_keyword_index():
+    """載入快照並重放日誌；還沒有快照時從數據庫重建。"""
+    try:
+        with open(_snapshot_path(), "rb") as f:
+            index = pickle.load(f)
+    except FileNotFoundError:
+        index = build_keyword_index()
+    # 日誌中的寫入都是冪等的，即使已包含在快照中也可以重放
+    rows, index.journal_offset = _read_journal()
+    index.apply(rows)
+    return index
+
+
+def compact_keyword_index():
+    """把日誌合併進快照並清空日誌。"""
+    with _JournalLock():
+        try:
+            with open(_snapshot_path(), "rb") as f:
+                index = pickle.load(f)
+        except FileNotFoundError:
+            index = None
+        if index is not None:
+            rows, _ = _read_journal()
+            index.apply(rows)
+            index.rebuild()
+            save_keyword_index(index)
+            open(_journal_path(), "w").close()
+    if index is None:
+        build_keyword_index()
+
+
+def record_keywords(rows, table_name=KEYWORD_INDEX_TABLE):
+    """
+    記錄寫入數據庫的 `(keyword, avg_monthly_searches)`，供各進程的索引增量更新。
+
+    在數據庫提交之後調用。本進程的索引也在下一次 get_keyword_index 時從日誌重放。
+    """
+    if table_name != KEYWORD_INDEX_TABLE or not rows:
+        return
+    payload = "".join(json.dumps([keyword, int(searches or 0)], ensure_ascii=False) + "\n"
+                      for keyword, searches in rows).encode("utf-8")
+    with _JournalLock():
+        with open(_journal_path(), "ab") as f:
+            f.write(payload)
+            size = f.tell()
+    if size > JOURNAL_COMPACT_BYTES:
+        compact_keyword_index()
+
+
+_index = None
+_index_version = None
+# 保護 _index 的重新載入和日誌重放
+_index_lock = threading.Lock()
+
+
+def _files_version():
+    try:
+        snapshot = os.stat(_snapshot_path())
+    except FileNotFoundError:
+        return None, 0
+    try:
+        journal_size = os.stat(_journal_path()).st_size
+    except FileNotFoundError:
+        journal_size = 0
+    return (snapshot.st_ino, snapshot.st_mtime_ns), journal_size
+
+
+def get_keyword_index():
+    """
+    進程內共享的索引。每次調用 stat 一次快照和日誌：快照被替換時重新載入，日誌變長時只重放新增的行。
+
+    新的行重放到副本上，完成後再替換 `_index`；返回的索引不會再被修改，可以在鎖外查詢。
+    """
+    global _index, _index_version
+    with _index_lock:
+        snapshot_version, journal_size = _files_version()
+        if _index is None or snapshot_version != _index_version or journal_size < _index.journal_offset:
+            _index = load_keyword_index()
+            _index_version, _ = _files_version()
+        elif journal_size > _index.journal_offset:
+            index = _index.copy()
+            rows, index.journal_offset = _read_journal(index.journal_offset)
+            index.apply(rows)
+            _index = index
+        return _index
+
+
+SEARCH_MODES = ("prefix", "contains", "fuzzy")
+
+
+def search_keywords(text, mode="prefix", limit=20):
+    """
+    按 `mode`（prefix、contains 或 fuzzy）查找關鍵詞。
+
+    Returns:
+        list: `(keyword, avg_monthly_searches)`，按搜索量降序（fuzzy 先按相似度）
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"mode must be one of {SEARCH_MODES}")
+    return getattr(get_keyword_index(), mode)(text, limit)
@@ -0,0 +1,35 @@
+import pymysql
+
+from modules.database.db_connection import connect_db
+
+
+def fetch_top_keywords(limit=20, min_score=0.0, connection=None):
+    """
+    按機會分數取前 `limit` 個關鍵字（走 opportunity_score 索引）。
+
+    還沒有評分結果時返回空列表，調用方可以退回按搜索量篩選。
+    keyword_scores 表由 google_ads_keyword_scoring 的 `write_keyword_scores` 建立。
+    """
+    own_connection = connection is None
+    if own_connection:
+        connection = connect_db()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT keyword FROM keyword_scores
+                WHERE opportunity_score > %s
+                ORDER BY opportunity_score DESC
+                LIMIT %s
+                """,
+                (min_score, limit),
+            )
+            return [row["keyword"] for row in cursor.fetchall()]
+    except pymysql.err.ProgrammingError as e:
+        # 1146：keyword_scores 表還不存在，即從未評分過
+        if e.args[0] != 1146:
+            raise
+        return []
+    finally:
+        if own_connection:
+            connection.close()
@@ -0,0 +1,170 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from cachetools import TTLCache
+
+from modules.database.db_connection import connect_db
+
+# 各數據集的版本文件：同步和生成步驟寫入後更新版本，所有進程（包括 Flask 應用）的緩存隨之失效。
+# 只需一次 stat，不訪問數據庫。
+CACHE_VERSION_DIR = os.environ.get(
+    "AUTOCONTENTIFY_CACHE_VERSION_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/cache_versions"))
+)
+# 版本文件之外的寫入（例如手工修改數據庫）最多在這段時間後可見
+READ_CACHE_TTL = int(os.environ.get("AUTOCONTENTIFY_READ_CACHE_TTL", 60))
+READ_CACHE_SIZE = 512
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# 小於這個大小的響應不壓縮
+GZIP_MIN_BYTES = 512
+
+DATASETS = ("blogs", "products", "keywords")
+
+
+def bump_cache_version(*names):
+    """標記數據集已變化，讀緩存下次請求時重新查詢。"""
+    os.makedirs(CACHE_VERSION_DIR, exist_ok=True)
+    for name in names:
+        fd, temp_path = tempfile.mkstemp(dir=CACHE_VERSION_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(str(time.time_ns()))
+        os.replace(temp_path, os.path.join(CACHE_VERSION_DIR, name))
+
+
+def cache_version(name):
+    """數據集當前版本（版本文件的 inode 和修改時間），從未更新過時為 0。"""
+    try:
+        stat = os.stat(os.path.join(CACHE_VERSION_DIR, name))
+    except FileNotFoundError:
+        return 0
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    return str(value)
+
+
+class CachedBody:
+    """序列化後的響應體，同時保存 gzip 版本和 ETag，命中緩存時不再編碼或壓縮。"""
+
+    __slots__ = ("body", "gzipped", "etag")
+
+    def __init__(self, data):
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+        self.gzipped = gzip.compress(self.body, compresslevel=6) if len(self.body) >= GZIP_MIN_BYTES else None
+        self.etag = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+
+
+_cache = TTLCache(maxsize=READ_CACHE_SIZE, ttl=READ_CACHE_TTL)
+_cache_lock = threading.Lock()
+
+
+def cached_read(dataset, key, loader):
+    """
+    按 (數據集, 數據集版本, key) 緩存 `loader()` 的結果。
+
+    Returns:
+        CachedBody: 序列化後的結果；`loader()` 返回 None 時為 None（不緩存）
+    """
+    cache_key = (dataset, cache_version(dataset), key)
+    with _cache_lock:
+        cached = _cache.get(cache_key)
+    if cached is not None:
+        return cached
+    data = loader()
+    if data is None:
+        return None
+    cached = CachedBody(data)
+    with _cache_lock:
+        _cache[cache_key] = cached
+    return cached
+
+
+def clear_read_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _page(query, args, limit, key_field):
+    connection = connect_db()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(query, args + (limit,))
+            items = cursor.fetchall()
+    finally:
+        connection.close()
+    next_after = items[-1][key_field] if len(items) == limit else None
+    return {"items": items, "next_after": next_after}
+
+
+def clamp_page_size(limit):
+    return max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+
+def blogs_page(after=0, limit=DEFAULT_PAGE_SIZE):
+    """按 id 分頁的博客列表（不含正文）。"""
+    return _page(
+        """
+        SELECT id, title, shopify_article_id, synced_to_shopify, store_id, last_updated_at
+        FROM blogs WHERE id > %s ORDER BY id LIMIT %s
+        """,
+        (after,), limit, "id",
+    )
+
+
+def blog_detail(blog_id):
+    """單篇博客（含正文），不存在時返回 None。"""
+    connection = connect_db()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, title, content, shopify_article_id, synced_to_shopify, store_id, last_updated_at
+                FROM blogs WHERE id = %s
+                """,
+                (blog_id,),
+            )
+            return cursor.fetchone()
+    finally:
+        connection.close()
+
+
+def products_page(after=0, limit=DEFAULT_PAGE_SIZE):
+    """按 id 分頁的商品列表。"""
+    return _page(
+        """
+        SELECT id, shopify_product_id, name, handle, price, stock, vendor, status, store_id, last_updated_at
+        FROM products WHERE id > %s ORDER BY id LIMIT %s
+        """,
+        (after,), limit, "id",
+    )
+
+
+def keywords_page(after=0, limit=DEFAULT_PAGE_SIZE):
+    """按機會分數排名分頁的關鍵詞（見 google_ads_keyword_scoring）。"""
+    return _page(
+        """
+        SELECT s.opportunity_rank, s.keyword, s.opportunity_score, s.trend_slope, s.scored_at,
+               k.avg_monthly_searches, k.competition_index
+        FROM keyword_scores s
+        LEFT JOIN keywords k ON k.keyword = s.keyword
+        WHERE s.opportunity_rank > %s
+        ORDER BY s.opportunity_rank
+        LIMIT %s
+        """,
+        (after,), limit, "opportunity_rank",
+    )
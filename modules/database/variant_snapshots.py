@@ -0,0 +1,219 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from config.common import setup_logger
+
+# 初始化日誌
+logger = setup_logger(script_name="variant_snapshots")
+
+# 只追加的變體價格/庫存變化記錄：每次同步只寫入發生變化的變體。
+# 按月分區，按時間範圍的查詢只掃描相關分區，舊數據可以整個分區刪除。
+VARIANT_SNAPSHOTS_DDL = """
+    CREATE TABLE IF NOT EXISTS variant_snapshots (
+        variant_id BIGINT UNSIGNED NOT NULL,
+        captured_at DATETIME NOT NULL,
+        price DECIMAL(10, 2) NULL,
+        inventory_quantity INT NULL,
+        PRIMARY KEY (variant_id, captured_at)
+    )
+    PARTITION BY RANGE (TO_DAYS(captured_at)) (
+        PARTITION p_future VALUES LESS THAN MAXVALUE
+    )
+"""
+
+TREND_FIELDS = ("price", "inventory_quantity")
+
+
+def _month_start(day, offset=0):
+    month = day.year * 12 + day.month - 1 + offset
+    return date(month // 12, month % 12 + 1, 1)
+
+
+# 本進程已確認存在的月份分區；之後的調用不再執行 DDL 和 information_schema 查詢
+_ensured_partitions = set()
+
+
+def ensure_variant_snapshots_table(connection, months_ahead=1):
+    """
+    建立快照表，並確保本月到 `months_ahead` 個月後都有各自的分區。
+
+    每個進程每個分區只檢查一次，webhook 等逐條寫入的路徑不會每次都執行 DDL。
+    """
+    today = date.today()
+    months = [_month_start(today, offset) for offset in range(months_ahead + 1)]
+    names = [f"p{month:%Y%m}" for month in months]
+    if _ensured_partitions.issuperset(names):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(VARIANT_SNAPSHOTS_DDL)
+        cursor.execute(
+            """
+            SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'variant_snapshots'
+            """
+        )
+        existing = {row["PARTITION_NAME"] for row in cursor.fetchall()}
+        for month, name in zip(months, names):
+            if name in existing:
+                continue
+            # 從 p_future 中拆出新的月份分區
+            cursor.execute(
+                f"""
+                ALTER TABLE variant_snapshots REORGANIZE PARTITION p_future INTO (
+                    PARTITION {name} VALUES LESS THAN (TO_DAYS('{_month_start(month, 1):%Y-%m-%d}')),
+                    PARTITION p_future VALUES LESS THAN MAXVALUE
+                )
+                """
+            )
+            logger.info(f"新增快照分區 {name}")
+    connection.commit()
+    _ensured_partitions.update(names)
+
+
+def has_snapshots(cursor):
+    """快照表中是否已有數據（沒有時首次同步需要寫入完整基線）。"""
+    cursor.execute("SELECT 1 AS found FROM variant_snapshots LIMIT 1")
+    return cursor.fetchone() is not None
+
+
+def _normalize(price, inventory_quantity):
+    return (round(float(price), 2) if price is not None else None,
+            int(inventory_quantity) if inventory_quantity is not None else None)
+
+
+def record_variant_snapshots(cursor, products, captured_at=None, baseline=False):
+    """
+    在覆蓋 product_variants 之前，記錄 `products` 中價格或庫存發生變化的變體。
+
+    與 product_variants 中的當前值比較，只寫入新變體和發生變化的變體；
+    `baseline=True` 時寫入全部變體，用於建立首份完整快照。
+
+    Returns:
+        int: 寫入的快照行數
+    """
+    variants = [variant for product in products for variant in product.get("variants", [])]
+    if not variants:
+        return 0
+
+    previous = {}
+    if not baseline:
+        placeholders = ", ".join(["%s"] * len(variants))
+        cursor.execute(
+            f"SELECT variant_id, price, inventory_quantity FROM product_variants WHERE variant_id IN ({placeholders})",
+            [variant["id"] for variant in variants],
+        )
+        previous = {row["variant_id"]: _normalize(row["price"], row["inventory_quantity"])
+                    for row in cursor.fetchall()}
+
+    captured_at = captured_at or datetime.now().replace(microsecond=0)
+    rows = []
+    for variant in variants:
+        current = _normalize(variant.get("price"), variant.get("inventory_quantity"))
+        if previous.get(variant["id"]) != current:
+            rows.append((variant["id"], captured_at) + current)
+
+    if rows:
+        cursor.executemany(
+            """
+            INSERT INTO variant_snapshots (variant_id, captured_at, price, inventory_quantity)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE price = VALUES(price), inventory_quantity = VALUES(inventory_quantity)
+            """,
+            rows,
+        )
+    return len(rows)
+
+
+def _load_series(connection, field, since, variant_ids):
+    """讀取 `since` 之後的變化點，以及每個變體在 `since` 之前的最後一個值（作為起點）。"""
+    variant_filter, variant_args = "", []
+    if variant_ids:
+        variant_filter = f"AND variant_id IN ({', '.join(['%s'] * len(variant_ids))})"
+        variant_args = list(variant_ids)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT variant_id, UNIX_TIMESTAMP(captured_at) AS ts, {field} AS value
+            FROM variant_snapshots
+            WHERE captured_at >= %s AND {field} IS NOT NULL {variant_filter}
+            """,
+            [since] + variant_args,
+        )
+        rows = cursor.fetchall()
+        cursor.execute(
+            f"""
+            SELECT s.variant_id, UNIX_TIMESTAMP(%s) AS ts, s.{field} AS value
+            FROM variant_snapshots s
+            JOIN (
+                SELECT variant_id, MAX(captured_at) AS captured_at FROM variant_snapshots
+                WHERE captured_at < %s {variant_filter}
+                GROUP BY variant_id
+            ) latest ON latest.variant_id = s.variant_id AND latest.captured_at = s.captured_at
+            WHERE s.{field} IS NOT NULL
+            """,
+            [since, since] + variant_args,
+        )
+        rows.extend(cursor.fetchall())
+
+    count = len(rows)
+    variant_id = np.fromiter((row["variant_id"] for row in rows), dtype=np.int64, count=count)
+    ts = np.fromiter((row["ts"] for row in rows), dtype=np.float64, count=count)
+    value = np.fromiter((row["value"] for row in rows), dtype=np.float64, count=count)
+    return variant_id, ts, value
+
+
+def variant_trends(connection, field="price", since=None, variant_ids=None):
+    """
+    計算每個變體在 `since` 之後的價格或庫存趨勢，全部以向量化運算完成。
+
+    Args:
+        connection: 數據庫連接
+        field (str): "price" 或 "inventory_quantity"
+        since (datetime, optional): 起始時間，默認為最近 30 天
+        variant_ids (list, optional): 只計算這些變體，默認為全部
+
+    Returns:
+        dict: 同長度的 NumPy 數組，按 variant_id 排序：
+            variant_id, samples, first, last, change, pct_change（起點為 0 時為 nan）,
+            slope_per_day（對變化點做最小二乘擬合，只有一個點時為 0）
+    """
+    if field not in TREND_FIELDS:
+        raise ValueError(f"field 必須是 {TREND_FIELDS} 之一")
+    since = since or datetime.now() - timedelta(days=30)
+
+    variant_id, ts, value = _load_series(connection, field, since, variant_ids)
+    if not len(variant_id):
+        empty = np.array([], dtype=np.float64)
+        return {"variant_id": np.array([], dtype=np.int64), "samples": np.array([], dtype=np.int64),
+                "first": empty, "last": empty, "change": empty, "pct_change": empty, "slope_per_day": empty}
+
+    order = np.lexsort((ts, variant_id))
+    variant_id, days, value = variant_id[order], ts[order] / 86400.0, value[order]
+
+    starts = np.flatnonzero(np.r_[True, variant_id[1:] != variant_id[:-1]])
+    samples = np.diff(np.r_[starts, len(variant_id)])
+    group = np.repeat(np.arange(len(starts)), samples)
+
+    first = value[starts]
+    last = value[starts + samples - 1]
+    change = last - first
+    pct_change = np.divide(change, first, out=np.full(len(first), np.nan), where=first != 0)
+
+    # 每組做最小二乘：slope = Σ(t - t̄)(v - v̄) / Σ(t - t̄)²
+    days_centered = days - (np.add.reduceat(days, starts) / samples)[group]
+    value_centered = value - (np.add.reduceat(value, starts) / samples)[group]
+    covariance = np.add.reduceat(days_centered * value_centered, starts)
+    variance = np.add.reduceat(days_centered * days_centered, starts)
+    slope_per_day = np.divide(covariance, variance, out=np.zeros(len(starts)), where=variance > 0)
+
+    return {
+        "variant_id": variant_id[starts],
+        "samples": samples,
+        "first": first,
+        "last": last,
+        "change": change,
+        "pct_change": pct_change,
+        "slope_per_day": slope_per_day,
+    }
@@ -0,0 +1,276 @@
+import json
+import os
+import socket
+import threading
+import uuid
+
+from config.common import setup_logger
+from modules.database.db_connection import connect_db
+
+# 初始化日誌
+logger = setup_logger(script_name="work_queue")
+
+WORK_QUEUE_DDL = """
+    CREATE TABLE IF NOT EXISTS work_queue (
+        id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        queue_name VARCHAR(64) NOT NULL,
+        payload JSON NOT NULL,
+        status ENUM('pending', 'claimed', 'done', 'failed') NOT NULL DEFAULT 'pending',
+        attempts INT NOT NULL DEFAULT 0,
+        worker_id VARCHAR(128) NULL,
+        lease_expires_at DATETIME NULL,
+        heartbeat_at DATETIME NULL,
+        last_error TEXT NULL,
+        created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        KEY idx_work_queue_claim (queue_name, status, lease_expires_at, id)
+    )
+"""
+
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+# enqueue_chunks 每次 executemany 寫入的塊數
+ENQUEUE_BATCH_SIZE = 500
+
+
+def ensure_work_queue_table(connection):
+    """建立工作隊列表（如果不存在）。"""
+    with connection.cursor() as cursor:
+        cursor.execute(WORK_QUEUE_DDL)
+    connection.commit()
+
+
+def default_worker_id():
+    """主機名 + 進程號 + 隨機後綴，確保多台機器上的 worker 不重名。"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def enqueue_chunks(queue_name, items, chunk_size=20, connection=None):
+    """
+    將工作項切塊後寫入隊列。
+
+    Args:
+        queue_name (str): 隊列名稱，例如 "keyword_plan"。
+        items (iterable): 工作項（關鍵詞、博客 ID 等），必須可 JSON 序列化。
+        chunk_size (int, optional): 每塊的工作項數量，默認為 20。
+        connection (object, optional): 現有的數據庫連接對象。
+
+    Returns:
+        int: 寫入的塊數
+    """
+    own_connection = connection is None
+    connection = connection or connect_db()
+    try:
+        ensure_work_queue_table(connection)
+        # items 可以是生成器：每攢夠 ENQUEUE_BATCH_SIZE 塊就寫入一次，內存只保留一批
+        chunks, chunk, total = [], [], 0
+        with connection.cursor() as cursor:
+            for item in items:
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    chunks.append((queue_name, json.dumps(chunk)))
+                    chunk = []
+                if len(chunks) >= ENQUEUE_BATCH_SIZE:
+                    cursor.executemany("INSERT INTO work_queue (queue_name, payload) VALUES (%s, %s)", chunks)
+                    total += len(chunks)
+                    chunks = []
+            if chunk:
+                chunks.append((queue_name, json.dumps(chunk)))
+            if chunks:
+                cursor.executemany("INSERT INTO work_queue (queue_name, payload) VALUES (%s, %s)", chunks)
+                total += len(chunks)
+        connection.commit()
+        logger.info(f"✅ 隊列 {queue_name} 新增 {total} 個工作塊")
+        return total
+    finally:
+        if own_connection:
+            connection.close()
+
+
+def claim_chunk(connection, queue_name, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS,
+                max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    認領一個待處理（或租約已過期）的工作塊。
+
+    `FOR UPDATE SKIP LOCKED` 讓多個 worker 同時認領時互不阻塞，也不會拿到同一塊。
+    租約過期的塊只有在嘗試次數少於 `max_attempts` 時才會被重新認領，其餘留給 requeue_expired 標記為 failed。
+
+    Returns:
+        dict | None: {"id", "items", "attempts"}，沒有可認領的塊時返回 None
+    """
+    connection.begin()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, payload, attempts FROM work_queue
+                WHERE queue_name = %s
+                  AND (status = 'pending'
+                       OR (status = 'claimed' AND lease_expires_at < NOW() AND attempts < %s))
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+                """,
+                (queue_name, max_attempts),
+            )
+            row = cursor.fetchone()
+            if row is None:
+                connection.commit()
+                return None
+            cursor.execute(
+                """
+                UPDATE work_queue
+                SET status = 'claimed', worker_id = %s, attempts = attempts + 1,
+                    lease_expires_at = NOW() + INTERVAL %s SECOND, heartbeat_at = NOW()
+                WHERE id = %s
+                """,
+                (worker_id, lease_seconds, row["id"]),
+            )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return {"id": row["id"], "items": json.loads(row["payload"]), "attempts": row["attempts"] + 1}
+
+
+def heartbeat(connection, chunk_id, worker_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    延長租約。返回 False 表示租約已丟失（已過期並被其他 worker 認領）。
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE work_queue
+            SET lease_expires_at = NOW() + INTERVAL %s SECOND, heartbeat_at = NOW()
+            WHERE id = %s AND worker_id = %s AND status = 'claimed'
+            """,
+            (lease_seconds, chunk_id, worker_id),
+        )
+        renewed = cursor.rowcount == 1
+    connection.commit()
+    return renewed
+
+
+def complete_chunk(connection, chunk_id, worker_id):
+    """標記工作塊已完成。"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE work_queue SET status = 'done', lease_expires_at = NULL WHERE id = %s AND worker_id = %s",
+            (chunk_id, worker_id),
+        )
+    connection.commit()
+
+
+def fail_chunk(connection, chunk_id, worker_id, error, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """工作塊處理失敗：未超過最大嘗試次數時放回隊列，否則標記為 failed。"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE work_queue
+            SET status = IF(attempts >= %s, 'failed', 'pending'), lease_expires_at = NULL, last_error = %s
+            WHERE id = %s AND worker_id = %s
+            """,
+            (max_attempts, str(error)[:65535], chunk_id, worker_id),
+        )
+    connection.commit()
+
+
+def requeue_expired(queue_name, max_attempts=DEFAULT_MAX_ATTEMPTS, connection=None):
+    """
+    將租約過期的工作塊放回隊列（超過最大嘗試次數的標記為 failed）。
+
+    Returns:
+        int: 受影響的塊數
+    """
+    own_connection = connection is None
+    connection = connection or connect_db()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE work_queue
+                SET status = IF(attempts >= %s, 'failed', 'pending'), lease_expires_at = NULL,
+                    last_error = 'lease expired'
+                WHERE queue_name = %s AND status = 'claimed' AND lease_expires_at < NOW()
+                """,
+                (max_attempts, queue_name),
+            )
+            affected = cursor.rowcount
+        connection.commit()
+        if affected:
+            logger.warning(f"⚠️ 隊列 {queue_name} 有 {affected} 個工作塊租約過期，已重新排隊")
+        return affected
+    finally:
+        if own_connection:
+            connection.close()
+
+
+def _heartbeat_loop(chunk_id, worker_id, lease_seconds, stop_event, lost_event):
+    # 心跳線程使用獨立連接，pymysql 連接不是線程安全的
+    connection = connect_db()
+    try:
+        while not stop_event.wait(lease_seconds / 3):
+            if not heartbeat(connection, chunk_id, worker_id, lease_seconds):
+                logger.error(f"❌ 工作塊 {chunk_id} 的租約已丟失")
+                lost_event.set()
+                return
+    except Exception as e:
+        logger.error(f"❌ 工作塊 {chunk_id} 心跳失敗: {e}")
+    finally:
+        connection.close()
+
+
+def run_worker(queue_name, processor, worker_id=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+               max_attempts=DEFAULT_MAX_ATTEMPTS, max_chunks=None):
+    """
+    持續認領並處理工作塊，直到隊列為空（或處理完 `max_chunks` 塊）。
+
+    Args:
+        queue_name (str): 隊列名稱。
+        processor (callable): 接收一個工作項列表的塊處理函數。
+        worker_id (str, optional): worker 標識，默認自動生成。
+        lease_seconds (int, optional): 租約時長，心跳每 1/3 租約續期一次。
+        max_attempts (int, optional): 每塊最多嘗試次數。
+        max_chunks (int, optional): 最多處理的塊數。
+
+    Returns:
+        int: 成功處理的塊數
+    """
+    worker_id = worker_id or default_worker_id()
+    connection = connect_db()
+    ensure_work_queue_table(connection)
+    processed = 0
+    logger.info(f"🚀 worker {worker_id} 開始處理隊列 {queue_name}")
+    try:
+        while max_chunks is None or processed < max_chunks:
+            chunk = claim_chunk(connection, queue_name, worker_id, lease_seconds, max_attempts)
+            if chunk is None:
+                break
+
+            stop_event, lost_event = threading.Event(), threading.Event()
+            heartbeat_thread = threading.Thread(
+                target=_heartbeat_loop,
+                args=(chunk["id"], worker_id, lease_seconds, stop_event, lost_event),
+                daemon=True,
+            )
+            heartbeat_thread.start()
+            try:
+                processor(chunk["items"])
+            except Exception as e:
+                logger.error(f"❌ 工作塊 {chunk['id']} 處理失敗（第 {chunk['attempts']} 次）: {e}")
+                fail_chunk(connection, chunk["id"], worker_id, e, max_attempts)
+                continue
+            finally:
+                stop_event.set()
+                heartbeat_thread.join()
+
+            if lost_event.is_set():
+                # 其他 worker 已接手，這裡的結果不再提交
+                continue
+            complete_chunk(connection, chunk["id"], worker_id)
+            processed += 1
+            logger.info(f"✅ 工作塊 {chunk['id']} 已完成（{len(chunk['items'])} 項）")
+    finally:
+        connection.close()
+    logger.info(f"🔒 worker {worker_id} 結束，共處理 {processed} 個工作塊")
+    return processed
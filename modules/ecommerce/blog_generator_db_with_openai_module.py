@@ -1,20 +1,22 @@
+import itertools
 import json
+import logging
 from modules.api.openai_api import chat_with_openai
-from modules.database.db_connection import connect_db
+from modules.database.db_connection import connect_db, iter_keywords
+from modules.database.keyword_scores import fetch_top_keywords
+from modules.database.read_api import bump_cache_version
+from modules.ecommerce.blog_internal_links import get_product_linker
+from modules.monitoring.log_config import configure_logging
+from modules.monitoring.profiling import profile_step
 
-def fetch_keywords_from_database():
-    """直接從數據庫獲取關鍵詞列表，並只選擇 avg_monthly_searches >= 100 的關鍵字"""
-    try:
-        connection = connect_db()
-        cursor = connection.cursor()
-        # 加入條件：選擇 avg_monthly_searches >= 100 的關鍵字
-        cursor.execute("SELECT keyword FROM ecommerce_data_db.keywords WHERE avg_monthly_searches >= 100")
-        result = cursor.fetchall()
-        cursor.close()
-        connection.close()
+# 每次生成博客時使用的關鍵詞數量
+TOP_KEYWORDS = 20
 
-        # 提取關鍵詞為列表
-        keywords = [row["keyword"] for row in result]
+def fetch_keywords_from_database(limit=None):
+    """直接從數據庫獲取關鍵詞列表，並只選擇 avg_monthly_searches >= 100 的關鍵字；`limit` 限制讀取數量"""
+    try:
+        # 按主鍵分頁流式讀取，取夠 limit 個就停止
+        keywords = list(itertools.islice(iter_keywords(min_searches=100), limit))
         if not keywords:
             print("關鍵詞列表為空，請檢查數據庫內容。")
         return keywords
@@ -40,21 +42,31 @@ def generate_blog_titles(keywords):
         print("無法解析生成的標題為JSON格式，請檢查API響應。")
         return []
 
+def process_keyword_chunk(keywords):
+    """
+    基於一塊關鍵詞生成博客標題和內容並保存。
+    可直接作為工作隊列（modules.database.work_queue）的塊處理函數。
+    """
+    titles = generate_blog_titles(keywords)
+    logging.info(f"生成的博客標題: {titles}")
+    for title in titles:
+        # Extract the title string from the dictionary and ensure it's a valid string
+        if isinstance(title, dict) and "title" in title and title["title"].strip():  # Ensure it's a valid string
+            blog_content = generate_seo_blog_content(title["title"], keywords)
+            if blog_content:
+                # 只記錄長度，完整 HTML 已保存到數據庫
+                logging.info(f"生成的博客內容: {title['title']}（{len(blog_content)} 字符）")
+                blog_content = add_product_links(blog_content)
+                save_blog_to_database(title["title"], blog_content)
+        else:
+            print("Invalid title or empty title skipped.")
+
 def main():
-    keywords = fetch_keywords_from_database()
+    # 優先使用機會分數最高的關鍵詞，還沒有評分結果時退回按搜索量篩選
+    keywords = fetch_top_keywords(limit=TOP_KEYWORDS) or fetch_keywords_from_database(limit=TOP_KEYWORDS)
     if keywords:
         print(f"加載的關鍵詞: {keywords}")
-        titles = generate_blog_titles(keywords)
-        print(f"生成的博客標題: {titles}")
-        for title in titles:
-            # Extract the title string from the dictionary and ensure it's a valid string
-            if isinstance(title, dict) and "title" in title and title["title"].strip():  # Ensure it's a valid string
-                blog_content = generate_seo_blog_content(title["title"], keywords)
-                if blog_content:
-                    print(f"生成的博客內容: {blog_content}")
-                    save_blog_to_database(title["title"], blog_content)
-            else:
-                print("Invalid title or empty title skipped.")
+        process_keyword_chunk(keywords)
     else:
         print("未能加載關鍵詞，請檢查數據庫配置或數據表。")
 
@@ -82,6 +94,14 @@ def generate_seo_blog_content(title, keywords):
         print("生成的博客內容不符合要求，請檢查API提示設計。")
         return ""
 
+def add_product_links(content):
+    """為博客中出現的商品名稱和 SKU 添加商品頁內鏈；詞條不可用時原樣返回。"""
+    try:
+        return get_product_linker().inject_links(content)
+    except Exception as e:
+        logging.warning(f"無法添加商品內鏈: {e}")
+        return content
+
 def save_blog_to_database(title, content):
     """將生成的博客保存到數據庫"""
     try:
@@ -94,9 +114,12 @@ def save_blog_to_database(title, content):
         connection.commit()
         cursor.close()
         connection.close()
-        print(f"成功將博客保存到數據庫: {title}")
+        bump_cache_version("blogs")
+        logging.info(f"成功將博客保存到數據庫: {title}")
     except Exception as e:
         print(f"保存博客到數據庫時發生錯誤: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    configure_logging()
+    with profile_step("blog_generator"):
+        main()
\ No newline at end of file
@@ -0,0 +1,343 @@
+"""
+博客內鏈：把生成的博客 HTML 中出現的商品名稱和 SKU 鏈接到 Shopify 商品頁。
+
+商品目錄的詞條（小寫名稱/SKU -> 商品 URL）保存在 `data/link_index/`，商品同步時只更新變化的商品；
+生成博客的進程載入詞條後建一次 Aho-Corasick 自動機，之後每篇文章的每個文本節點只掃描一遍，
+耗時與文章長度成正比，與目錄大小無關。安裝了 pyahocorasick 時使用其 C 實現。
+
+    linker = get_product_linker()
+    html = linker.inject_links(html)
+"""
+import fcntl
+import html as html_lib
+import importlib.util
+import logging
+import os
+import pickle
+import re
+import tempfile
+from collections import deque
+
+from modules.api.shopify_api import STORES, config as store_config, store_key
+from modules.database.db_connection import connect_db
+
+# 可選的 C 實現，沒有安裝時使用下面的純 Python 自動機
+AHOCORASICK_AVAILABLE = importlib.util.find_spec("ahocorasick") is not None
+
+LINK_INDEX_DIR = os.environ.get(
+    "AUTOCONTENTIFY_LINK_INDEX_DIR",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/link_index"))
+)
+
+
+def storefront_url(store):
+    """商品頁的公開域名，默認與 API 使用的店鋪域名相同。"""
+    return (store.get("STOREFRONT_URL") or store["SHOPIFY_STORE_URL"]).rstrip("/")
+
+
+STOREFRONT_URL = storefront_url(store_config)
+
+# 太短的名稱/SKU 容易誤匹配普通單詞
+MIN_TERM_LENGTH = 4
+# 每篇文章最多添加的內鏈數，同一商品只鏈接第一次出現
+MAX_LINKS_PER_ARTICLE = 10
+# 這些標籤內的文本不添加鏈接
+SKIP_TAGS = {"a", "script", "style", "code", "pre", "h1", "h2", "h3", "h4", "h5", "h6", "button", "textarea"}
+
+_TAG = re.compile(r"(<[^>]*>)")
+_TAG_NAME = re.compile(r"<\s*(/?)\s*([a-zA-Z0-9]+)")
+
+
+class _PythonAutomaton:
+    """純 Python 的 Aho-Corasick 自動機；每個狀態記錄以它結尾的全部詞條長度（從長到短）。"""
+
+    def __init__(self, terms):
+        self.goto = [{}]
+        self.lengths = [()]
+        for term in terms:
+            state = 0
+            for char in term:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.lengths.append(())
+                state = next_state
+            self.lengths[state] = (len(term),)
+
+        # 按層次遍歷計算失配指針，並把後綴上的匹配接在後面：最長匹配不在詞邊界時還可以用較短的
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.lengths[next_state] += self.lengths[self.fail[next_state]]
+                queue.append(next_state)
+
+    def iter_matches(self, text):
+        """對每個結束位置產出以它結尾的全部匹配 `(start, end)`，長的在前（與 pyahocorasick 相同）。"""
+        goto, fail, lengths = self.goto, self.fail, self.lengths
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length in lengths[state]:
+                yield index + 1 - length, index + 1
+
+
+class _NativeAutomaton:
+    """pyahocorasick 包裝，接口與 _PythonAutomaton 相同。"""
+
+    def __init__(self, terms):
+        import ahocorasick
+
+        self.automaton = ahocorasick.Automaton()
+        for term in terms:
+            self.automaton.add_word(term, len(term))
+        if len(self.automaton):
+            self.automaton.make_automaton()
+
+    def iter_matches(self, text):
+        if not len(self.automaton):
+            return
+        for end, length in self.automaton.iter(text):
+            yield end + 1 - length, end + 1
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+class ProductLinker:
+    """
+    商品目錄詞條和由它構建的自動機。
+
+    `terms` 為 {小寫詞條: 商品 URL}，`products` 為 {商品 ID: [詞條]}，用於增量更新。
+    """
+
+    def __init__(self, terms=None, products=None):
+        self.terms = terms or {}
+        self.products = products or {}
+        self._automaton = None
+
+    @property
+    def automaton(self):
+        if self._automaton is None:
+            automaton_class = _NativeAutomaton if AHOCORASICK_AVAILABLE else _PythonAutomaton
+            self._automaton = automaton_class(self.terms)
+        return self._automaton
+
+    def update_product(self, product_id, url, names):
+        """替換一個商品的詞條；已被其他商品使用的詞條保持原鏈接。"""
+        self.remove_product(product_id)
+        owned = []
+        for name in names:
+            term = (name or "").strip().lower()
+            if len(term) < MIN_TERM_LENGTH or term in self.terms:
+                continue
+            self.terms[term] = url
+            owned.append(term)
+        if owned:
+            self.products[product_id] = owned
+        self._automaton = None
+
+    def remove_product(self, product_id):
+        for term in self.products.pop(product_id, []):
+            self.terms.pop(term, None)
+        self._automaton = None
+
+    def find_links(self, text, linked, limit=MAX_LINKS_PER_ARTICLE):
+        """
+        返回 `text` 中要添加鏈接的 `(start, end, url)`：最左最長、互不重疊、位於詞邊界，
+        跳過 `linked` 中的 URL，最多 `limit` 個。
+        """
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # 極少數字符小寫後長度會變，此時位置無法對應回原文
+            return []
+        candidates = []
+        for start, end in self.automaton.iter_matches(lowered):
+            if start > 0 and _is_word_char(text[start - 1]) and _is_word_char(text[start]):
+                continue
+            if end < len(text) and _is_word_char(text[end]) and _is_word_char(text[end - 1]):
+                continue
+            candidates.append((start, end))
+        candidates.sort(key=lambda match: (match[0], -match[1]))
+
+        links = []
+        position = 0
+        for start, end in candidates:
+            if len(links) >= limit:
+                break
+            if start < position:
+                continue
+            url = self.terms.get(lowered[start:end])
+            if url is None or url in linked:
+                continue
+            links.append((start, end, url))
+            linked.add(url)
+            position = end
+        return links
+
+    def inject_links(self, content, max_links=MAX_LINKS_PER_ARTICLE):
+        """
+        在 HTML 的文本節點中為商品名稱和 SKU 添加 `<a>` 鏈接，單次線性掃描，不修改標籤本身。
+        """
+        if not self.terms or not content:
+            return content
+        parts = _TAG.split(content)
+        skip_depth = {}
+        linked = set()
+        for index, part in enumerate(parts):
+            if not part:
+                continue
+            if index % 2:
+                match = _TAG_NAME.match(part)
+                if match and match.group(2).lower() in SKIP_TAGS and not part.endswith("/>"):
+                    tag = match.group(2).lower()
+                    skip_depth[tag] = max(0, skip_depth.get(tag, 0) + (-1 if match.group(1) else 1))
+                continue
+            if any(skip_depth.values()) or len(linked) >= max_links:
+                continue
+            links = self.find_links(part, linked, max_links - len(linked))
+            if not links:
+                continue
+            pieces, position = [], 0
+            for start, end, url in links:
+                pieces.append(part[position:start])
+                pieces.append(f'<a href="{html_lib.escape(url)}">{part[start:end]}</a>')
+                position = end
+            pieces.append(part[position:])
+            parts[index] = "".join(pieces)
+        return "".join(parts)
+
+
+def product_url(handle, variant_id=None, base_url=STOREFRONT_URL):
+    url = f"{base_url}/products/{handle}"
+    return f"{url}?variant={variant_id}" if variant_id else url
+
+
+def _index_path(store=None, suffix=".pkl"):
+    key = store_key(store or store_config)
+    return os.path.join(LINK_INDEX_DIR, f"products_{key}{suffix}" if key else f"products{suffix}")
+
+
+class _LinkIndexLock:
+    """一個店鋪詞條文件的排他鎖：應用內的 webhook 線程和商品同步進程的增量更新互斥。"""
+
+    def __init__(self, store=None):
+        self.path = _index_path(store, ".lock")
+
+    def __enter__(self):
+        os.makedirs(LINK_INDEX_DIR, exist_ok=True)
+        self.file = open(self.path, "a")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def save_product_linker(linker, store=None):
+    """原子地寫入詞條（不保存自動機，載入後按需重建）。"""
+    os.makedirs(LINK_INDEX_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=LINK_INDEX_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump({"terms": linker.terms, "products": linker.products}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, _index_path(store))
+
+
+def build_product_linker(connection=None, store=None):
+    """
+    從 products / product_variants 讀取店鋪（默認為當前店鋪）的全部商品名稱和 SKU，重建詞條。
+    """
+    store = store or store_config
+    own_connection = connection is None
+    if own_connection:
+        connection = connect_db()
+    linker = ProductLinker()
+    try:
+        with connection.cursor() as cursor:
+            # 沒有 store_id 的商品是多店鋪支持之前同步的，屬於第一個店鋪
+            cursor.execute(
+                """
+                SELECT p.id, p.shopify_product_id, p.name, p.handle, v.sku, v.variant_id
+                FROM products p
+                LEFT JOIN product_variants v ON v.product_id = p.id
+                WHERE p.handle IS NOT NULL AND p.status = 'active'
+                  AND (p.store_id = %s OR (p.store_id IS NULL AND %s))
+                ORDER BY p.id
+                """,
+                (store["STORE_ID"], store["STORE_ID"] == STORES[0]["STORE_ID"]),
+            )
+            rows = cursor.fetchall()
+    finally:
+        if own_connection:
+            connection.close()
+
+    grouped = {}
+    for row in rows:
+        product = grouped.setdefault(row["shopify_product_id"], {"handle": row["handle"], "name": row["name"], "skus": []})
+        if row["sku"]:
+            product["skus"].append(row["sku"])
+    base_url = storefront_url(store)
+    for product_id, product in grouped.items():
+        linker.update_product(product_id, product_url(product["handle"], base_url=base_url),
+                              [product["name"], *product["skus"]])
+    save_product_linker(linker, store)
+    logging.info(f"商品內鏈詞條已重建：{len(grouped)} 個商品，{len(linker.terms)} 個詞條")
+    return linker
+
+
+def load_product_linker(store=None):
+    """載入保存的詞條；還沒有時從數據庫重建。"""
+    try:
+        with open(_index_path(store), "rb") as f:
+            data = pickle.load(f)
+        return ProductLinker(data["terms"], data["products"])
+    except FileNotFoundError:
+        return build_product_linker(store=store)
+
+
+def update_product_links(products=(), deleted_ids=(), store=None):
+    """
+    商品同步後增量更新詞條：只處理 `products`（Shopify 商品字典）和 `deleted_ids` 中的商品。
+
+    `store` 為商品所屬店鋪的配置，默認為當前店鋪。讀取、修改和寫回在文件鎖內完成，
+    並發的更新不會互相覆蓋。
+    """
+    if not products and not deleted_ids:
+        return
+    store = store or store_config
+    base_url = storefront_url(store)
+    with _LinkIndexLock(store):
+        linker = load_product_linker(store)
+        for product_id in deleted_ids:
+            linker.remove_product(product_id)
+        for product in products:
+            if product.get("status", "active") != "active" or not product.get("handle"):
+                linker.remove_product(product["id"])
+                continue
+            skus = [variant.get("sku") for variant in product.get("variants", [])]
+            linker.update_product(product["id"], product_url(product["handle"], base_url=base_url),
+                                  [product["title"], *skus])
+        save_product_linker(linker, store)
+
+
+_linker = None
+
+
+def get_product_linker():
+    """進程內共享的 ProductLinker，自動機只構建一次。"""
+    global _linker
+    if _linker is None:
+        _linker = load_product_linker()
+    return _linker
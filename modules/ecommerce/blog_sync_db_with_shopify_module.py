@@ -1,78 +1,347 @@
-from modules.api.shopify_api import get_shopify_blogs, create_or_update_shopify_blog
-from modules.database.db_connection import connect_db
+from modules.api.shopify_api import (
+    ARTICLE_BATCH_SIZE, IS_DEFAULT_STORE, STORE_ID, iter_shopify_article_pages, publish_shopify_articles,
+)
+from modules.api.shopify_async_api import AsyncShopifyClient
+from modules.database.async_writer import AsyncDBWriter
+from modules.database.db_connection import connect_db, content_hash, ensure_column
+from modules.database.read_api import bump_cache_version
+from modules.jobs.job_runner import report_progress
+from modules.monitoring.log_config import configure_logging
+from modules.monitoring.profiling import profile_step
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+import asyncio
+import logging
+import threading
 import pymysql
 
-def sync_shopify_to_db():
-    """同步 Shopify 博客到本地数据库"""
-    articles = get_shopify_blogs()
-    if not articles:
-        print("No blogs fetched from Shopify.")
-        return
+def ensure_blog_columns(conn):
+    """添加博客同步写入的 content_hash 和 store_id 列（旧表没有）"""
+    ensure_column(conn, "blogs", "content_hash", "CHAR(32) NULL")
+    ensure_column(conn, "blogs", "store_id", "VARCHAR(64) NULL")
 
-    conn = connect_db()
-    cursor = conn.cursor()
+# 只读取当前店铺的博客；没有 store_id 的博客（新生成的和旧数据）属于第一个店铺
+STORE_FILTER = "(store_id = %s OR (store_id IS NULL AND %s))"
+STORE_FILTER_ARGS = (STORE_ID, IS_DEFAULT_STORE)
 
+def _blog_hash(title, content):
+    return content_hash(title, content)
+
+def upsert_shopify_articles(cursor, articles, stored_hashes=None, store_id=STORE_ID):
+    """
+    批量写入 Shopify 文章（标记为 `store_id` 店铺的文章），跳过内容哈希与 `stored_hashes` 相同的文章
+
+    Returns:
+        int: 实际写入的文章数
+    """
+    stored_hashes = stored_hashes or {}
+    rows = []
     for article in articles:
         shopify_article_id = article["id"]
         title = article["title"]
         content = article["body_html"]
+        article_hash = _blog_hash(title, content)
+        if stored_hashes.get(shopify_article_id) == article_hash:
+            continue
+
         updated_at = datetime.strptime(article["updated_at"], "%Y-%m-%dT%H:%M:%S%z")
+        rows.append((shopify_article_id, title, content, article_hash, updated_at, store_id))
 
-        cursor.execute("""
-            INSERT INTO blogs (shopify_article_id, title, content, last_updated_at, synced_to_shopify)
-            VALUES (%s, %s, %s, %s, TRUE)
+    if rows:
+        cursor.executemany("""
+            INSERT INTO blogs (shopify_article_id, title, content, content_hash, last_updated_at, store_id,
+                               synced_to_shopify)
+            VALUES (%s, %s, %s, %s, %s, %s, TRUE)
             ON DUPLICATE KEY UPDATE
                 title = VALUES(title),
                 content = VALUES(content),
+                content_hash = VALUES(content_hash),
                 last_updated_at = VALUES(last_updated_at),
+                store_id = VALUES(store_id),
                 synced_to_shopify = TRUE
-        """, (shopify_article_id, title, content, updated_at))
+        """, rows)
+    return len(rows)
 
-    conn.commit()
-    cursor.close()
-    conn.close()
-    print("Shopify blogs synchronized to database successfully.")
+def sync_shopify_to_db(updated_at_min=None):
+    """
+    同步 Shopify 博客到本地数据库
 
-def sync_db_to_shopify():
-    """同步本地数据库博客到 Shopify"""
+    逐页读取文章（可用 `updated_at_min` 只拉取增量），每页只批量写入内容哈希发生变化的文章。
+    """
     conn = connect_db()
-    cursor = conn.cursor(pymysql.cursors.DictCursor)
-
-    cursor.execute("""
-        SELECT * FROM blogs
-        WHERE synced_to_shopify = FALSE
-    """)
-    unsynced_blogs = cursor.fetchall()
-
-    for blog in unsynced_blogs:
-        blog_data = {
-            "title": blog["title"],
-            "body_html": blog["content"]
-        }
-
-        success, shopify_article_id = create_or_update_shopify_blog(
-            shopify_article_id=blog.get("shopify_article_id"),
-            blog_data=blog_data
-        )
-
-        if success:
-            print(f"Successfully synced blog: {blog['title']}")
-            cursor.execute("""
-                UPDATE blogs
-                SET shopify_article_id = %s, synced_to_shopify = TRUE, last_updated_at = CURRENT_TIMESTAMP
-                WHERE id = %s
-            """, (shopify_article_id, blog["id"]))
-        else:
-            print(f"Failed to sync blog: {blog['title']}")
+    ensure_blog_columns(conn)
+    cursor = conn.cursor()
+
+    cursor.execute(f"""
+        SELECT shopify_article_id, content_hash FROM blogs
+        WHERE shopify_article_id IS NOT NULL AND {STORE_FILTER}
+    """, STORE_FILTER_ARGS)
+    stored_hashes = {row["shopify_article_id"]: row["content_hash"] for row in cursor.fetchall()}
+
+    fetched = changed = 0
+    for articles in iter_shopify_article_pages(updated_at_min=updated_at_min):
+        written = upsert_shopify_articles(cursor, articles, stored_hashes)
+        if written:
+            conn.commit()
+        fetched += len(articles)
+        changed += written
 
-    conn.commit()
     cursor.close()
     conn.close()
-    print("Database blogs synchronized to Shopify successfully.")
+    if changed:
+        bump_cache_version("blogs")
+    if not fetched:
+        print("No blogs fetched from Shopify.")
+        return
+    print(f"Shopify blogs synchronized to database successfully: "
+          f"{changed} changed, {fetched - changed} unchanged.")
 
-if __name__ == "__main__":
+# 上传成功后记录文章 ID 和内容哈希，并把博客归属到当前店铺
+MARK_SYNCED_SQL = """
+    UPDATE blogs
+    SET shopify_article_id = %s, content_hash = %s, store_id = %s, synced_to_shopify = TRUE,
+        last_updated_at = CURRENT_TIMESTAMP
+    WHERE id = %s
+"""
+
+def _mark_blogs_synced(conn, synced):
+    """批量标记已上传的博客并提交"""
+    if not synced:
+        return
+    with conn.cursor() as cursor:
+        cursor.executemany(MARK_SYNCED_SQL, synced)
+    conn.commit()
+    synced.clear()
+
+def _push_blogs(blogs):
+    """通过 GraphQL 批量创建/更新文章，返回 {博客 id: (success, shopify_article_id)}"""
+    return publish_shopify_articles([
+        (blog["id"], blog["shopify_article_id"], {"title": blog["title"], "body_html": blog["content"]})
+        for blog in blogs
+    ])
+
+def sync_db_to_shopify(max_workers=4, commit_batch_size=20, batch_size=ARTICLE_BATCH_SIZE):
+    """
+    同步本地数据库博客到 Shopify
+
+    未同步的博客通过服务端游标逐行读取，每 `batch_size` 篇打包成一个 GraphQL 请求
+    （每篇一个带别名的 articleCreate/articleUpdate，实际条数按查询成本再拆分），
+    交给最多 `max_workers` 个共享限流器的上传线程。每成功 `commit_batch_size` 篇就提交一次，
+    中途崩溃也不会丢失已上传博客的同步状态。内容哈希与上次同步时相同的博客不会再次上传，只标记为已同步。
+    """
+    read_conn = connect_db()
+    write_conn = connect_db()
+    ensure_blog_columns(write_conn)
+    read_cursor = read_conn.cursor(pymysql.cursors.SSDictCursor)
+    read_cursor.execute(f"""
+        SELECT id, title, content, shopify_article_id, content_hash FROM blogs
+        WHERE synced_to_shopify = FALSE AND {STORE_FILTER}
+    """, STORE_FILTER_ARGS)
+
+    synced = []
+    stats = {"synced": 0, "unchanged": 0, "failed": 0}
+    pending = {}
+    batch = []
+    # 最多只让 2 * max_workers 批博客同时在内存中，避免一次加载全部 HTML
+    in_flight = threading.BoundedSemaphore(max_workers * 2)
+
+    def collect(future):
+        blogs = pending.pop(future)
+        results = future.result()
+        for blog_id, title, blog_hash in blogs:
+            success, shopify_article_id = results.get(blog_id, (False, None))
+            if success:
+                logging.info(f"Successfully synced blog: {title}")
+                synced.append((shopify_article_id, blog_hash, STORE_ID, blog_id))
+                stats["synced"] += 1
+            else:
+                logging.warning(f"Failed to sync blog: {title}")
+                stats["failed"] += 1
+        report_progress(stats["synced"] + stats["unchanged"] + stats["failed"], message="blogs pushed to Shopify")
+        if len(synced) >= commit_batch_size:
+            _mark_blogs_synced(write_conn, synced)
+
+    def submit(executor):
+        in_flight.acquire()
+        future = executor.submit(_push_blogs, [blog for blog, _ in batch])
+        future.add_done_callback(lambda _: in_flight.release())
+        pending[future] = [(blog["id"], blog["title"], blog_hash) for blog, blog_hash in batch]
+        batch.clear()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for blog in read_cursor:
+                blog_hash = _blog_hash(blog["title"], blog["content"])
+                if blog["shopify_article_id"] and blog["content_hash"] == blog_hash:
+                    # Shopify 上已是相同内容，无需再次上传
+                    synced.append((blog["shopify_article_id"], blog_hash, STORE_ID, blog["id"]))
+                    stats["unchanged"] += 1
+                    if len(synced) >= commit_batch_size:
+                        _mark_blogs_synced(write_conn, synced)
+                    continue
+
+                batch.append((blog, blog_hash))
+                if len(batch) >= batch_size:
+                    submit(executor)
+
+                for done in [f for f in pending if f.done()]:
+                    collect(done)
+
+            if batch:
+                submit(executor)
+            for done in as_completed(list(pending)):
+                collect(done)
+    finally:
+        # 即使中途出错，也提交已成功上传的博客
+        _mark_blogs_synced(write_conn, synced)
+        read_cursor.close()
+        read_conn.close()
+        write_conn.close()
+        bump_cache_version("blogs")
+
+    print(f"Database blogs synchronized to Shopify: {stats['synced']} synced, "
+          f"{stats['unchanged']} unchanged, {stats['failed']} failed.")
+
+
+def _load_stored_hashes(conn):
+    ensure_blog_columns(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT shopify_article_id, content_hash FROM blogs
+            WHERE shopify_article_id IS NOT NULL AND {STORE_FILTER}
+        """, STORE_FILTER_ARGS)
+        return {row["shopify_article_id"]: row["content_hash"] for row in cursor.fetchall()}
+
+async def sync_shopify_to_db_async(updated_at_min=None):
+    """
+    sync_shopify_to_db 的异步版本
+
+    下一页请求与上一页的数据库写入同时进行，写入由 AsyncDBWriter 在单独线程中完成。
+    """
+    conn = await asyncio.to_thread(connect_db)
+    stored_hashes = await asyncio.to_thread(_load_stored_hashes, conn)
+
+    fetched = 0
+    async with AsyncDBWriter(conn) as writer:
+        async with AsyncShopifyClient() as shopify:
+            async for articles in shopify.iter_article_pages(updated_at_min=updated_at_min):
+                await writer.submit(upsert_shopify_articles, articles, stored_hashes)
+                fetched += len(articles)
+    changed = sum(writer.results)
+    await asyncio.to_thread(conn.close)
+    if changed:
+        bump_cache_version("blogs")
+
+    if not fetched:
+        print("No blogs fetched from Shopify.")
+        return
+    print(f"Shopify blogs synchronized to database successfully: "
+          f"{changed} changed, {fetched - changed} unchanged.")
+
+async def sync_db_to_shopify_async(concurrency=4, commit_batch_size=20, read_batch_size=100,
+                                   batch_size=ARTICLE_BATCH_SIZE):
+    """
+    sync_db_to_shopify 的异步版本
+
+    与同步版本一样，每 `batch_size` 篇博客打包成一个 GraphQL 请求（publish_shopify_articles），
+    由 `concurrency` 个共享限流器的上传协程在线程中发送。上传状态每 `commit_batch_size` 篇交给
+    AsyncDBWriter 批量提交，未同步的博客通过服务端游标每次读取 `read_batch_size` 行。
+    """
+    read_conn = await asyncio.to_thread(connect_db)
+    write_conn = await asyncio.to_thread(connect_db)
+    await asyncio.to_thread(ensure_blog_columns, write_conn)
+    read_cursor = read_conn.cursor(pymysql.cursors.SSDictCursor)
+    await asyncio.to_thread(read_cursor.execute, f"""
+        SELECT id, title, content, shopify_article_id, content_hash FROM blogs
+        WHERE synced_to_shopify = FALSE AND {STORE_FILTER}
+    """, STORE_FILTER_ARGS)
+
+    stats = {"synced": 0, "unchanged": 0, "failed": 0}
+    # 队列有界，内存中最多只有约 2 * concurrency 批博客
+    batches = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def flush(synced):
+        # 写入失败后不再排队，错误由 AsyncDBWriter 退出时抛出
+        if synced and writer.error is None:
+            await writer.execute_many(MARK_SYNCED_SQL, synced)
+        synced.clear()
+
+    async def uploader():
+        synced = []
+        while True:
+            batch = await batches.get()
+            if batch is None:
+                break
+            if writer.error is not None:
+                # 同步状态已无法保存，丢弃剩余博客，避免重复上传
+                continue
+            # 单批出错只把这批记为失败，上传协程继续消费队列，生产者不会卡在已满的队列上
+            try:
+                results = await asyncio.to_thread(_push_blogs, [blog for blog, _ in batch])
+            except Exception as e:
+                logging.error(f"Error pushing {len(batch)} blogs to Shopify: {e}")
+                results = {}
+            for blog, blog_hash in batch:
+                success, shopify_article_id = results.get(blog["id"], (False, None))
+                if success:
+                    logging.info(f"Successfully synced blog: {blog['title']}")
+                    synced.append((shopify_article_id, blog_hash, STORE_ID, blog["id"]))
+                    stats["synced"] += 1
+                else:
+                    logging.warning(f"Failed to sync blog: {blog['title']}")
+                    stats["failed"] += 1
+            report_progress(stats["synced"] + stats["unchanged"] + stats["failed"], message="blogs pushed to Shopify")
+            if len(synced) >= commit_batch_size:
+                await flush(synced)
+        # 即使其他协程出错，也提交本协程已成功上传的博客
+        await flush(synced)
+
+    try:
+        async with AsyncDBWriter(write_conn) as writer:
+            uploaders = [asyncio.create_task(uploader()) for _ in range(concurrency)]
+            unchanged = []
+            batch = []
+            try:
+                while True:
+                    rows = await asyncio.to_thread(read_cursor.fetchmany, read_batch_size)
+                    if not rows or writer.error is not None:
+                        break
+                    for blog in rows:
+                        blog_hash = _blog_hash(blog["title"], blog["content"])
+                        if blog["shopify_article_id"] and blog["content_hash"] == blog_hash:
+                            # Shopify 上已是相同内容，无需再次上传
+                            unchanged.append((blog["shopify_article_id"], blog_hash, STORE_ID, blog["id"]))
+                            stats["unchanged"] += 1
+                            continue
+                        batch.append((blog, blog_hash))
+                        if len(batch) >= batch_size:
+                            await batches.put(batch)
+                            batch = []
+                    if len(unchanged) >= commit_batch_size:
+                        await flush(unchanged)
+                if batch:
+                    await batches.put(batch)
+            finally:
+                await flush(unchanged)
+                for _ in uploaders:
+                    await batches.put(None)
+                await asyncio.gather(*uploaders)
+    finally:
+        await asyncio.to_thread(read_cursor.close)
+        await asyncio.to_thread(read_conn.close)
+        await asyncio.to_thread(write_conn.close)
+        bump_cache_version("blogs")
+
+    print(f"Database blogs synchronized to Shopify: {stats['synced']} synced, "
+          f"{stats['unchanged']} unchanged, {stats['failed']} failed.")
+
+def main():
     print("Starting Shopify and Database Blog Synchronization...")
     sync_shopify_to_db()  # 从 Shopify 同步到本地数据库
     sync_db_to_shopify()  # 从本地数据库同步到 Shopify
-    print("Synchronization completed successfully.")
\ No newline at end of file
+    print("Synchronization completed successfully.")
+
+if __name__ == "__main__":
+    configure_logging()
+    with profile_step("blog_sync"):
+        main()
\ No newline at end of file
@@ -1,17 +1,19 @@
-from modules.database.db_connection import connect_db
+import logging
+from modules.database.db_connection import connect_db, iter_keyword_chunks, iter_keywords
+from modules.database.keyword_index import record_keywords
+from modules.monitoring.log_config import configure_logging
+from modules.monitoring.profiling import profile_step
 from modules.api.google_ads_api import load_google_ads_client, generate_keyword_historical_metrics
+from modules.ecommerce.google_ads_keyword_scoring import KEYWORD_MONTHLY_VOLUMES_DDL
 
 
 def fetch_keywords_from_table(table_name):
     """
     從 MySQL 關鍵字表中讀取關鍵字列表。
+    大表請用 iter_keyword_chunks 流式讀取，避免一次性載入全部關鍵字。
     """
     try:
-        connection = connect_db()  # 使用 db_connection.py 的連接方法
-        with connection.cursor() as cursor:
-            cursor.execute(f"SELECT keyword FROM {table_name}")
-            keywords = [row["keyword"] for row in cursor.fetchall()]
-        connection.close()
+        keywords = list(iter_keywords(table_name))
         print(f"✅ 從表 {table_name} 中讀取了 {len(keywords)} 條關鍵字。")
         return keywords
     except Exception as e:
@@ -19,12 +21,56 @@ def fetch_keywords_from_table(table_name):
         raise
 
 
+# 每次歷史指標請求的關鍵字數（API 單次上限為 10000）
+HISTORICAL_CHUNK_SIZE = 1000
+
+MONTH_NAMES = ("JANUARY", "FEBRUARY", "MARCH", "APRIL", "MAY", "JUNE", "JULY",
+               "AUGUST", "SEPTEMBER", "OCTOBER", "NOVEMBER", "DECEMBER")
+
+
+def _month_number(month):
+    """月份可能是 1–12 或 MonthOfYear 枚舉名（"JANUARY"），統一轉成 1–12。"""
+    if isinstance(month, str):
+        return MONTH_NAMES.index(month.upper()) + 1
+    return int(month)
+
+
+def insert_monthly_search_volumes(historical_data):
+    """
+    將每個關鍵字的 `monthly_search_volumes` 批量寫入 keyword_monthly_volumes，供機會評分計算趨勢。
+    """
+    rows = [
+        (data["keyword"], int(volume["year"]), _month_number(volume["month"]), volume.get("monthly_searches") or 0)
+        for data in historical_data if data.get("keyword")
+        for volume in data.get("monthly_search_volumes") or []
+    ]
+    if not rows:
+        return 0
+    connection = connect_db()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(KEYWORD_MONTHLY_VOLUMES_DDL)
+            cursor.executemany(
+                """
+                INSERT INTO keyword_monthly_volumes (keyword, year, month, searches)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE searches = VALUES(searches)
+                """,
+                rows,
+            )
+        connection.commit()
+    finally:
+        connection.close()
+    return len(rows)
+
+
 def insert_or_update_historical_metrics_to_table(table_name, historical_data):
     """
     Insert or update historical data for keywords into the MySQL table.
     """
     try:
         connection = connect_db()  # Connect to the database
+        written = []
         with connection.cursor() as cursor:
             for data in historical_data:
                 # Ensure that all required fields exist, handle missing data
@@ -67,7 +113,7 @@ def insert_or_update_historical_metrics_to_table(table_name, historical_data):
                             keyword
                         )
                     )
-                    print(f"✅ Updated keyword: {keyword}")
+                    logging.info(f"✅ Updated keyword: {keyword}")
                 else:
                     # Insert a new record if the keyword does not exist
                     cursor.execute(
@@ -91,37 +137,54 @@ def insert_or_update_historical_metrics_to_table(table_name, historical_data):
                             high_top_of_page_bid_percentile
                         )
                     )
-                    print(f"✅ Inserted keyword: {keyword}")
+                    logging.info(f"✅ Inserted keyword: {keyword}")
+                written.append((keyword, avg_monthly_searches))
             
         connection.commit()
         connection.close()
+        # Keep the in-memory keyword search index in step with the table
+        record_keywords(written, table_name)
         print(f"✅ Historical data operation completed successfully!")
     except Exception as e:
         print(f"❌ Failed to operate on historical keyword data in MySQL: {e}")
         raise
 
 
-def main():
-    # 配置 MySQL 表名
-    keyword_table = "keywords"
-
-    # 加載 Google Ads 客戶端
-    client = load_google_ads_client()
-
-    # 1. 從 MySQL 獲取關鍵字列表
-    keywords = fetch_keywords_from_table(keyword_table)
+def process_keyword_chunk(keywords, client=None, keyword_table="keywords"):
+    """
+    刷新一塊關鍵字的歷史數據。
+    可直接作為工作隊列（modules.database.work_queue）的塊處理函數。
+    """
+    if client is None:
+        client = load_google_ads_client()
 
-    # 2. 使用 Google Ads API 獲取關鍵字的歷史數據
+    # 使用 Google Ads API 獲取關鍵字的歷史數據
     historical_data = generate_keyword_historical_metrics(
         client=client,
         customer_id="5141511711",
         keywords=keywords
     )
 
-    # 3. 將歷史數據插入或更新到 MySQL 表中
+    # 將歷史數據插入或更新到 MySQL 表中
     insert_or_update_historical_metrics_to_table(keyword_table, historical_data)
+    insert_monthly_search_volumes(historical_data)
+
+
+def main():
+    # 配置 MySQL 表名
+    keyword_table = "keywords"
+
+    # 加載 Google Ads 客戶端
+    client = load_google_ads_client()
+
+    # 1. 從 MySQL 按主鍵分頁流式讀取關鍵字
+    # 2. 每 HISTORICAL_CHUNK_SIZE 個一批獲取並寫入歷史數據
+    for keywords in iter_keyword_chunks(keyword_table, chunk_size=HISTORICAL_CHUNK_SIZE):
+        process_keyword_chunk(keywords, client=client, keyword_table=keyword_table)
     print("✅ 整個工作流執行完成！")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    configure_logging()
+    with profile_step("keyword_historical"):
+        main()
\ No newline at end of file
@@ -1,17 +1,18 @@
-from modules.database.db_connection import connect_db
+import logging
+from modules.database.db_connection import connect_db, iter_keyword_chunks, iter_keywords
+from modules.database.keyword_index import record_keywords
+from modules.monitoring.log_config import configure_logging
+from modules.monitoring.profiling import profile_step
 from modules.api.google_ads_api import load_google_ads_client, generate_keyword_ideas
 
 
 def fetch_keywords_from_table(table_name):
     """
     從 MySQL 關鍵字表中讀取關鍵字列表。
+    大表請用 iter_keyword_chunks 流式讀取，避免一次性載入全部關鍵字。
     """
     try:
-        connection = connect_db()  # 使用 db_connection.py 的連接方法
-        with connection.cursor() as cursor:
-            cursor.execute(f"SELECT keyword FROM {table_name}")
-            keywords = [row["keyword"] for row in cursor.fetchall()]
-        connection.close()
+        keywords = list(iter_keywords(table_name))
         print(f"✅ 從表 {table_name} 中讀取了 {len(keywords)} 條關鍵字。")
         return keywords
     except Exception as e:
@@ -33,6 +34,7 @@ def insert_new_keywords_to_table(table_name, keywords_data):
     """
     try:
         connection = connect_db()  # 使用 db_connection.py 的連接方法
+        inserted = []
         with connection.cursor() as cursor:
             for data in keywords_data:
                 # 檢查關鍵字是否已存在
@@ -41,7 +43,7 @@ def insert_new_keywords_to_table(table_name, keywords_data):
 
                 if existing_keyword:
                     # 如果關鍵字已存在，則跳過
-                    print(f"❌ 關鍵字已存在，跳過: {data['text']}")
+                    logging.debug(f"關鍵字已存在，跳過: {data['text']}")
                 else:
                     # 如果關鍵字不存在，則插入
                     cursor.execute(
@@ -51,16 +53,41 @@ def insert_new_keywords_to_table(table_name, keywords_data):
                         """,
                         (data["text"], data["avg_monthly_searches"], data["competition"])
                     )
-                    print(f"✅ 插入關鍵字: {data['text']}")
+                    inserted.append((data["text"], data["avg_monthly_searches"]))
+                    logging.info(f"✅ 插入關鍵字: {data['text']}")
             
         connection.commit()
         connection.close()
+        # 增量更新關鍵詞搜索索引
+        record_keywords(inserted, table_name)
         print(f"✅ 關鍵字數據操作完成！")
     except Exception as e:
         print(f"❌ 無法操作關鍵字數據到 MySQL：{e}")
         raise
 
 
+def process_keyword_chunk(keywords, client=None, keyword_table="keywords"):
+    """
+    處理一塊關鍵字：生成關鍵字建議並插入新的關鍵字。
+    可直接作為工作隊列（modules.database.work_queue）的塊處理函數。
+    """
+    if client is None:
+        client = load_google_ads_client()
+
+    # 使用 Google Ads API 生成篩選後的關鍵字建議
+    keyword_results = generate_keyword_ideas(
+        client=client,
+        customer_id="5141511711",
+        location_ids=["2840"],  # 示例地區 ID (美國)
+        language_id="1000",  # 示例語言 ID (英語)
+        keyword_texts=keywords,
+        page_url=None
+    )
+
+    # 將生成的數據插入到 MySQL 表中（不更新現有數據）
+    insert_new_keywords_to_table(keyword_table, keyword_results)
+
+
 def main():
     # 配置 MySQL 表名
     keyword_table = "keywords"
@@ -68,29 +95,17 @@ def main():
     # 加載 Google Ads 客戶端
     client = load_google_ads_client()
 
-    # 1. 從 MySQL 獲取關鍵字列表
-    keywords = fetch_keywords_from_table(keyword_table)
-
-    # 2. 將關鍵字分成 20 個一組的小批量
-    keyword_batches = chunk_keywords(keywords, 20)
+    # 1. 從 MySQL 按主鍵分頁流式讀取關鍵字，並分成 20 個一組的小批量
+    keyword_batches = iter_keyword_chunks(keyword_table, chunk_size=20)
 
-    # 3. 逐批處理關鍵字
+    # 2. 逐批處理關鍵字
     for batch in keyword_batches:
-        # 使用 Google Ads API 生成篩選後的關鍵字建議
-        keyword_results = generate_keyword_ideas(
-            client=client,
-            customer_id="5141511711",
-            location_ids=["2840"],  # 示例地區 ID (美國)
-            language_id="1000",  # 示例語言 ID (英語)
-            keyword_texts=batch,
-            page_url=None
-        )
-
-        # 4. 將生成的數據插入到 MySQL 表中（不更新現有數據）
-        insert_new_keywords_to_table(keyword_table, keyword_results)
+        process_keyword_chunk(batch, client=client, keyword_table=keyword_table)
 
     print("✅ 整個工作流執行完成！")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    configure_logging()
+    with profile_step("keyword_plan"):
+        main()
\ No newline at end of file
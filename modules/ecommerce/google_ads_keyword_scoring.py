@@ -0,0 +1,208 @@
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from modules.database.db_connection import connect_db
+from modules.database.keyword_scores import fetch_top_keywords
+from modules.database.read_api import bump_cache_version
+from modules.monitoring.log_config import configure_logging
+from modules.monitoring.profiling import profile_step
+
+# 評分結果單獨成表：按 opportunity_score 的索引讓「取前 N 個關鍵字」只讀索引頭部
+KEYWORD_SCORES_DDL = """
+    CREATE TABLE IF NOT EXISTS keyword_scores (
+        keyword VARCHAR(255) NOT NULL PRIMARY KEY,
+        opportunity_score DOUBLE NOT NULL,
+        opportunity_rank INT NOT NULL,
+        trend_slope DOUBLE NOT NULL DEFAULT 0,
+        scored_at DATETIME NOT NULL,
+        KEY idx_keyword_scores_score (opportunity_score),
+        KEY idx_keyword_scores_rank (opportunity_rank)
+    )
+"""
+
+# 每個關鍵字的月搜索量（由 google_ads_keyword_historical 寫入），用於計算趨勢
+KEYWORD_MONTHLY_VOLUMES_DDL = """
+    CREATE TABLE IF NOT EXISTS keyword_monthly_volumes (
+        keyword VARCHAR(255) NOT NULL,
+        year SMALLINT NOT NULL,
+        month TINYINT NOT NULL,
+        searches BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (keyword, year, month)
+    )
+"""
+
+# 各項在加權幾何平均中的權重：搜索量、出價成本（越低越好）、競爭度（越低越好）
+SCORE_WEIGHTS = {"volume": 0.5, "cost": 0.25, "competition": 0.25}
+# 月搜索量（取對數）每年增長 100% 時，分數最多上調 50%；下降時同理下調
+TREND_WEIGHT = 0.5
+TREND_MONTHS = 12
+WRITE_BATCH_SIZE = 1000
+
+
+def load_keyword_metrics(connection, keyword_table="keywords"):
+    """
+    一次性讀取所有關鍵字的歷史指標，轉成按列存放的 NumPy 數組。
+
+    Returns:
+        dict: keyword（object 數組）以及 searches、competition_index、出價相關列（float64 數組）
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT keyword, avg_monthly_searches, competition_index, low_bid_range, high_bid_range,
+                   low_top_of_page_bid_micros, high_top_of_page_bid_micros
+            FROM {keyword_table}
+            """
+        )
+        rows = cursor.fetchall()
+
+    count = len(rows)
+
+    def column(name):
+        return np.fromiter((row[name] or 0 for row in rows), dtype=np.float64, count=count)
+
+    return {
+        "keyword": np.array([row["keyword"] for row in rows], dtype=object),
+        "searches": column("avg_monthly_searches"),
+        "competition_index": column("competition_index"),
+        "low_bid_range": column("low_bid_range"),
+        "high_bid_range": column("high_bid_range"),
+        "low_top_of_page_bid_micros": column("low_top_of_page_bid_micros"),
+        "high_top_of_page_bid_micros": column("high_top_of_page_bid_micros"),
+    }
+
+
+def load_trend_slopes(connection, keywords, months=TREND_MONTHS):
+    """
+    對每個關鍵字最近 `months` 個月的 log(1 + 月搜索量) 做最小二乘擬合，返回每月斜率。
+
+    數據不足兩個月的關鍵字斜率為 0。
+    """
+    slopes = np.zeros(len(keywords))
+    if not len(keywords):
+        return slopes
+    with connection.cursor() as cursor:
+        cursor.execute(KEYWORD_MONTHLY_VOLUMES_DDL)
+        cursor.execute("SELECT keyword, year, month, searches FROM keyword_monthly_volumes")
+        rows = cursor.fetchall()
+    if not rows:
+        return slopes
+
+    position = {keyword: index for index, keyword in enumerate(keywords)}
+    count = len(rows)
+    index = np.fromiter((position.get(row["keyword"], -1) for row in rows), dtype=np.int64, count=count)
+    month = np.fromiter((row["year"] * 12 + row["month"] for row in rows), dtype=np.float64, count=count)
+    volume = np.log1p(np.fromiter((row["searches"] or 0 for row in rows), dtype=np.float64, count=count))
+
+    keep = (index >= 0) & (month > month.max() - months)
+    if not keep.any():
+        return slopes
+    index, month, volume = index[keep], month[keep], volume[keep]
+    month -= month.min()
+
+    # slope = (nΣxy − ΣxΣy) / (nΣx² − (Σx)²)，用 bincount 按關鍵字分組求和
+    size = len(keywords)
+    n = np.bincount(index, minlength=size).astype(np.float64)
+    sum_x = np.bincount(index, weights=month, minlength=size)
+    sum_y = np.bincount(index, weights=volume, minlength=size)
+    sum_xy = np.bincount(index, weights=month * volume, minlength=size)
+    sum_xx = np.bincount(index, weights=month * month, minlength=size)
+    denominator = n * sum_xx - sum_x * sum_x
+    np.divide(n * sum_xy - sum_x * sum_y, denominator, out=slopes, where=(n >= 2) & (denominator > 0))
+    return slopes
+
+
+def compute_opportunity_scores(metrics, trend_slopes=None):
+    """
+    向量化計算 0–100 的機會分數：搜索量高、點擊成本低、競爭度低、搜索量上升的關鍵字得分高。
+    """
+    searches = metrics["searches"]
+    if not len(searches):
+        return np.zeros(0)
+
+    # 成本：優先用首頁出價（micros），沒有時退回出價區間
+    cost = (metrics["low_top_of_page_bid_micros"] + metrics["high_top_of_page_bid_micros"]) / 2e6
+    cost = np.where(cost > 0, cost, (metrics["low_bid_range"] + metrics["high_bid_range"]) / 2)
+    positive_cost = cost[cost > 0]
+    median_cost = np.median(positive_cost) if len(positive_cost) else 1.0
+
+    max_volume = np.log1p(searches.max())
+    volume_score = np.log1p(searches) / max_volume if max_volume > 0 else np.zeros(len(searches))
+    cost_score = 1.0 / (1.0 + cost / median_cost)
+    competition_score = 1.0 - np.clip(metrics["competition_index"] / 100.0, 0.0, 1.0)
+
+    with np.errstate(divide="ignore"):
+        log_score = (SCORE_WEIGHTS["volume"] * np.log(volume_score)
+                     + SCORE_WEIGHTS["cost"] * np.log(cost_score)
+                     + SCORE_WEIGHTS["competition"] * np.log(np.maximum(competition_score, 1e-3)))
+    scores = 100.0 * np.exp(log_score)
+
+    if trend_slopes is not None:
+        scores *= np.clip(1.0 + TREND_WEIGHT * trend_slopes * 12, 0.5, 1.5)
+    return scores
+
+
+def write_keyword_scores(connection, keywords, scores, trend_slopes, batch_size=WRITE_BATCH_SIZE):
+    """
+    按分數排名把本次結果批量寫進一張新表，再用 RENAME TABLE 原子地換掉 keyword_scores。
+
+    表名帶本次運行的 ID，重疊的評分各寫各的表，不會刪掉彼此的數據；讀取方始終看到某一次完整的結果。
+    """
+    run_id = uuid.uuid4().hex[:12]
+    staging_table = f"keyword_scores_{run_id}"
+    retired_table = f"keyword_scores_old_{run_id}"
+    scored_at = datetime.now().replace(microsecond=0)
+    order = np.argsort(-scores, kind="stable")
+    rows = [
+        (keywords[i], float(scores[i]), rank, float(trend_slopes[i]), scored_at)
+        for rank, i in enumerate(order.tolist(), start=1)
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(KEYWORD_SCORES_DDL)
+        cursor.execute(f"CREATE TABLE {staging_table} LIKE keyword_scores")
+        try:
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(
+                    f"""
+                    INSERT INTO {staging_table}
+                        (keyword, opportunity_score, opportunity_rank, trend_slope, scored_at)
+                    VALUES (%s, %s, %s, %s, %s)
+                    """,
+                    rows[start:start + batch_size],
+                )
+                connection.commit()
+            cursor.execute(f"RENAME TABLE keyword_scores TO {retired_table}, {staging_table} TO keyword_scores")
+        except Exception:
+            cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+            raise
+        cursor.execute(f"DROP TABLE {retired_table}")
+    connection.commit()
+    return len(rows)
+
+
+def score_keywords(keyword_table="keywords"):
+    """讀取全部關鍵字指標，計算機會分數並寫回 keyword_scores。"""
+    connection = connect_db()
+    try:
+        metrics = load_keyword_metrics(connection, keyword_table)
+        trend_slopes = load_trend_slopes(connection, metrics["keyword"])
+        scores = compute_opportunity_scores(metrics, trend_slopes)
+        written = write_keyword_scores(connection, metrics["keyword"], scores, trend_slopes)
+    finally:
+        connection.close()
+    bump_cache_version("keywords")
+    print(f"✅ 已為 {written} 個關鍵字計算機會分數。")
+    return written
+
+
+def main():
+    score_keywords()
+    print(f"✅ 機會分數最高的關鍵字：{fetch_top_keywords(limit=10)}")
+
+
+if __name__ == "__main__":
+    configure_logging()
+    with profile_step("keyword_scoring"):
+        main()
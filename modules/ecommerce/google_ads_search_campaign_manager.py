@@ -1,11 +1,16 @@
 from modules.api.google_ads_api import (
+    FINAL_URL,
     load_google_ads_client,
-    create_campaign,
-    create_ad_group,
-    create_rsa_ad_text,
-    create_rsa_ad,
+    ensure_campaign,
+    ensure_ad_group,
+    ensure_rsa_ad,
 )
+from modules.api.openai_api import generate_rsa_text
+from modules.database.google_ads_mirror import load_account_mirror
 from modules.database.db_connection import connect_db
+from modules.database.keyword_scores import fetch_top_keywords
+from modules.monitoring.log_config import configure_logging
+from modules.monitoring.profiling import profile_step
 
 
 def fetch_company_website():
@@ -16,11 +21,18 @@ def fetch_company_website():
     cursor.execute(query)
     website = cursor.fetchone()
     connection.close()
-    return website[0] if website else None
+    return website["website"] if website else None
 
 
-def fetch_keywords():
-    """Fetch keywords from the database with minimum average monthly searches."""
+def fetch_keywords(limit=20):
+    """
+    Fetch the top `limit` keywords by opportunity score, falling back to all
+    keywords with minimum average monthly searches before the first scoring run.
+    """
+    top_keywords = fetch_top_keywords(limit=limit)
+    if top_keywords:
+        return top_keywords
+
     connection = connect_db()
     cursor = connection.cursor()
     query = "SELECT keyword FROM ecommerce_data_db.keywords WHERE avg_monthly_searches >= 100"
@@ -29,7 +41,7 @@ def fetch_keywords():
     connection.close()
 
     # Return the list of keywords
-    return [keyword[0] for keyword in keywords]
+    return [keyword["keyword"] for keyword in keywords]
 
 
 def main():
@@ -42,48 +54,51 @@ def main():
     customer_id = googleads_client.login_customer_id
     print(f"✅ Using Customer ID: {customer_id}")
 
-    # Fetch the required data
-    keywords = fetch_keywords()
-    website_url = fetch_company_website()
+    # Load the account structure mirror; existing entities are matched by name instead of re-created
+    mirror = load_account_mirror(googleads_client, customer_id)
 
-    # Create a campaign
-    campaign_id = create_campaign(
+    # Create the campaign, or reuse it if it already exists
+    campaign_id = ensure_campaign(
         googleads_client,
         customer_id,
+        mirror,
         campaign_name="Search Campaign Example",
     )
 
     # Ensure campaign creation was successful
     if not campaign_id:
-        print("❌ Campaign creation failed or campaign already exists.")
+        print("❌ Campaign creation failed.")
         return
 
-    # Create an ad group
-    ad_group_id = create_ad_group(
+    # Create the ad group, or reuse it if it already exists
+    ad_group_id = ensure_ad_group(
         googleads_client,
         customer_id,
+        mirror,
         campaign_id,
         ad_group_name="Search Ad Group Example",
     )
 
     # Ensure ad group creation was successful
     if not ad_group_id:
-        print("❌ Ad Group creation failed or ad group already exists.")
+        print("❌ Ad Group creation failed.")
         return
 
-    # Generate RSA ad text using OpenAI API
-    rsa_text = create_rsa_ad_text(keywords)
-
-    # Create an RSA ad
-    create_rsa_ad(
+    # Create the RSA ad unless the ad group already has one; the text is only generated when it is needed
+    website_url = fetch_company_website()
+    ensure_rsa_ad(
         googleads_client,
         customer_id,
+        mirror,
         ad_group_id,
-        rsa_text,
+        lambda: generate_rsa_text(keywords=fetch_keywords()),
+        final_url=website_url or FINAL_URL,
     )
 
-    print("✅ Campaign, Ad Group, and RSA Ad created successfully!")
+    print("✅ Campaign, Ad Group, and RSA Ad are in place!")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    configure_logging()
+    with profile_step("search_campaign"):
+        main()
\ No newline at end of file
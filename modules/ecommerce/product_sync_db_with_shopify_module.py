@@ -1,51 +1,253 @@
-from modules.api.shopify_api import get_shopify_products
-from modules.database.db_connection import connect_db
+from modules.api.shopify_api import STORE_ID, get_shopify_products
+from modules.database.db_connection import connect_db, content_hash, ensure_column
+from modules.database.read_api import bump_cache_version
+from modules.ecommerce.blog_internal_links import update_product_links
+from modules.database.variant_snapshots import (
+    ensure_variant_snapshots_table, has_snapshots, record_variant_snapshots,
+)
+from modules.jobs.job_runner import report_progress
+from modules.monitoring.log_config import configure_logging
+from modules.monitoring.profiling import profile_step
+import json
 import logging
 
-# Set up logging configuration
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+# One row per Shopify image. InnoDB appends the primary key to secondary indexes, so
+# idx_product_images_product covers "images of a product in order" lookups (image_id, position, src).
+PRODUCT_IMAGES_DDL = """
+    CREATE TABLE IF NOT EXISTS product_images (
+        image_id BIGINT UNSIGNED NOT NULL PRIMARY KEY,
+        shopify_product_id BIGINT UNSIGNED NOT NULL,
+        position INT NOT NULL DEFAULT 1,
+        src VARCHAR(512) NOT NULL,
+        alt VARCHAR(512) NULL,
+        variant_ids JSON NULL,
+        image_hash CHAR(32) NOT NULL,
+        last_updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        KEY idx_product_images_product (shopify_product_id, position, src)
+    )
+"""
+
+# Products written (with their variants and images) per transaction
+PRODUCT_BATCH_SIZE = 200
+
+def product_content_hash(product):
+    """Hash every product, variant and image field the sync writes to the database."""
+    fields = [
+        product['title'],
+        product.get('body_html'),
+        product.get('product_type'),
+        product.get('created_at'),
+        product.get('vendor'),
+        product.get('status', 'active'),
+        # Product URLs in generated blogs are built from the handle
+        product.get('handle'),
+    ]
+    for img in product.get('images', []):
+        fields.extend((img.get('id'), img.get('position'), img['src'], img.get('alt'), img.get('variant_ids')))
+    for variant in product.get('variants') or []:
+        fields.extend((
+            variant['id'],
+            variant['title'],
+            variant.get('price'),
+            variant.get('sku'),
+            variant.get('inventory_quantity'),
+            variant.get('inventory_policy'),
+            variant.get('weight'),
+            variant.get('weight_unit'),
+        ))
+    return content_hash(*fields)
+
+def ensure_product_columns(connection):
+    """Add the products columns the sync writes that older tables lack."""
+    ensure_column(connection, "products", "content_hash", "CHAR(32) NULL")
+    ensure_column(connection, "products", "store_id", "VARCHAR(64) NULL")
+    ensure_column(connection, "products", "handle", "VARCHAR(255) NULL")
 
-def save_to_db(query, data):
-    """Generic function to execute an insert/update query."""
+def fetch_product_hashes():
+    """Load a `{shopify_product_id: content_hash}` map of the products stored for this store."""
     connection = connect_db()
     try:
-        cursor = connection.cursor()
-        cursor.execute(query, data)
+        ensure_product_columns(connection)
+        with connection.cursor() as cursor:
+            # Untagged rows predate multi-store support; they are re-saved once and tagged
+            cursor.execute("SELECT shopify_product_id, content_hash FROM products WHERE store_id = %s", (STORE_ID,))
+            return {row['shopify_product_id']: row['content_hash'] for row in cursor.fetchall()}
+    finally:
+        connection.close()
+
+# Set once this process has created/checked product_images, so per-webhook saves skip the DDL
+_product_images_ready = False
+
+def ensure_product_images_table(connection):
+    """Create the product_images table if it does not exist (once per process)."""
+    global _product_images_ready
+    if _product_images_ready:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(PRODUCT_IMAGES_DDL)
+    connection.commit()
+    _product_images_ready = True
+
+def _image_row(product_id, image):
+    variant_ids = json.dumps(image.get('variant_ids') or [])
+    row = (product_id, image.get('position', 1), image['src'], image.get('alt'), variant_ids)
+    return (image['id'],) + row + (content_hash(*row),)
+
+def save_product_images(cursor, products):
+    """
+    Diff the images of `products` against product_images and write only the changes.
+
+    New or changed images are upserted in one executemany, images no longer on
+    the product are deleted. Returns a `(written, deleted)` tuple.
+    """
+    if not products:
+        return 0, 0
+    product_ids = [product['id'] for product in products]
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    cursor.execute(
+        f"SELECT image_id, image_hash FROM product_images WHERE shopify_product_id IN ({placeholders})",
+        product_ids
+    )
+    stored = {row['image_id']: row['image_hash'] for row in cursor.fetchall()}
+
+    rows = []
+    for product in products:
+        for image in product.get('images') or []:
+            row = _image_row(product['id'], image)
+            if stored.pop(image['id'], None) != row[-1]:
+                rows.append(row)
+
+    if rows:
+        cursor.executemany("""
+            INSERT INTO product_images (image_id, shopify_product_id, position, src, alt, variant_ids, image_hash)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                shopify_product_id = VALUES(shopify_product_id),
+                position = VALUES(position),
+                src = VALUES(src),
+                alt = VALUES(alt),
+                variant_ids = VALUES(variant_ids),
+                image_hash = VALUES(image_hash)
+        """, rows)
+    # Whatever is left in `stored` was removed from the product on Shopify
+    if stored:
+        placeholders = ", ".join(["%s"] * len(stored))
+        cursor.execute(f"DELETE FROM product_images WHERE image_id IN ({placeholders})", list(stored))
+    return len(rows), len(stored)
+
+def save_products(batch, store_id=STORE_ID):
+    """
+    Save `(product, product_hash)` pairs with their variants and images in one transaction.
+
+    The stored content hash makes the next sync skip a product, so it is only committed
+    together with the product's images. A failed batch is rolled back and saved again
+    product by product; returns the ids of the products that still failed, which keep
+    their old hash and are retried by the next sync.
+    """
+    connection = connect_db()
+    try:
+        ensure_product_images_table(connection)
+        with connection.cursor() as cursor:
+            for product, product_hash in batch:
+                _save_product_rows(cursor, product, product_hash, store_id)
+            written, deleted = save_product_images(cursor, [product for product, _ in batch])
         connection.commit()
-        logging.info("Data saved successfully.")
-        return cursor.lastrowid  # Return last inserted ID (used for foreign key reference)
+        logging.info(f"Product images: {written} written, {deleted} deleted.")
+        return []
     except Exception as e:
-        logging.error(f"Error saving data to DB: {e}")
+        logging.error(f"Error saving product batch to DB: {e}")
+        connection.rollback()
     finally:
         connection.close()
+    failed = []
+    for product, product_hash in batch:
+        try:
+            save_product_to_db(product, product_hash, record_snapshot=False, store_id=store_id)
+        except Exception:
+            failed.append(product['id'])
+    return failed
 
-def save_product_to_db(product):
-    """Save product and its variants to the database."""
-    logging.info(f"Processing product: {product['title']}")
+def snapshot_variants(products, batch_size=PRODUCT_BATCH_SIZE):
+    """
+    Append price/inventory changes of `products` to variant_snapshots.
 
+    Must run before the variants are overwritten. The first run against an
+    empty snapshot table records every variant as the baseline.
+    """
+    if not products:
+        return
+    connection = connect_db()
+    written = 0
+    try:
+        ensure_variant_snapshots_table(connection)
+        with connection.cursor() as cursor:
+            baseline = not has_snapshots(cursor)
+            for start in range(0, len(products), batch_size):
+                written += record_variant_snapshots(cursor, products[start:start + batch_size], baseline=baseline)
+                connection.commit()
+    except Exception as e:
+        logging.error(f"Error saving variant snapshots to DB: {e}")
+        connection.rollback()
+    finally:
+        connection.close()
+    logging.info(f"Variant snapshots: {written} changes recorded.")
+
+def save_product_to_db(product, product_hash=None, record_snapshot=True, store_id=STORE_ID):
+    """
+    Save product, its variants and its images to the database in one transaction,
+    tagged with `store_id`.
+
+    Price/inventory changes go to variant_snapshots; pass `record_snapshot=False`
+    when the caller batches them with `snapshot_variants`.
+
+    Raises the database error when the product could not be saved; nothing is written then.
+    """
+    if record_snapshot:
+        snapshot_variants([product])
+    connection = connect_db()
+    try:
+        ensure_product_images_table(connection)
+        with connection.cursor() as cursor:
+            _save_product_rows(cursor, product, product_hash, store_id)
+            save_product_images(cursor, [product])
+        connection.commit()
+    except Exception as e:
+        logging.error(f"Error saving product {product['id']} to DB: {e}")
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+def _save_product_rows(cursor, product, product_hash=None, store_id=STORE_ID):
+    """Write the product row and its variants on `cursor`; the caller commits."""
+    logging.info(f"Processing product: {product['title']}")
+    # Product-level price, stock and weight come from the first variant
+    first_variant = (product.get('variants') or [{}])[0]
     product_data = (
         product['id'],
         product['title'],
         product.get('body_html', None),
-        product['variants'][0].get('price', 0.0),
-        product['variants'][0].get('inventory_quantity', 0),
+        first_variant.get('price', 0.0),
+        first_variant.get('inventory_quantity', 0),
         product.get('product_type', None),
         product.get('created_at', None),
         product.get('updated_at', None),
         product.get('vendor', None),
-        product['variants'][0].get('weight', 0),
-        ','.join([img['src'] for img in product.get('images', [])]) if product.get('images') else None,
-        product['variants'][0].get('inventory_policy', 'deny'),
+        first_variant.get('weight', 0),
+        first_variant.get('inventory_policy', 'deny'),
         product.get('status', 'active'),
-        product['variants'][0].get('weight_unit', 'kg')
+        first_variant.get('weight_unit', 'kg'),
+        product_hash or product_content_hash(product),
+        store_id,
+        product.get('handle')
     )
 
     insert_query = """
         INSERT INTO products (
             shopify_product_id, name, description, price, stock, category_id, created_at, updated_at, 
-            vendor, weight, images, inventory_policy, status, weight_unit, last_updated_at
+            vendor, weight, inventory_policy, status, weight_unit, content_hash, store_id, handle, last_updated_at
         ) 
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP())
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP())
         ON DUPLICATE KEY UPDATE 
             name = VALUES(name), 
             description = VALUES(description), 
@@ -55,23 +257,26 @@ def save_product_to_db(product):
             updated_at = CURRENT_TIMESTAMP(),
             vendor = VALUES(vendor),
             weight = VALUES(weight),
-            images = VALUES(images),
             inventory_policy = VALUES(inventory_policy),
             status = VALUES(status),
             weight_unit = VALUES(weight_unit),
+            content_hash = VALUES(content_hash),
+            store_id = VALUES(store_id),
+            handle = VALUES(handle),
             last_updated_at = CURRENT_TIMESTAMP();
     """
 
     # Insert product and get the product ID
-    product_id = save_to_db(insert_query, product_data)
+    cursor.execute(insert_query, product_data)
+    product_id = cursor.lastrowid
 
     # Save variants for the product using the correct product_id
-    for variant in product['variants']:
+    for variant in product.get('variants') or []:
         logging.info(f"Processing variant: {variant['title']} for product ID: {product_id}")
-        save_variant_to_db(product_id, variant)
+        _save_variant_row(cursor, product_id, variant)
 
-def save_variant_to_db(product_id, variant):
-    """Save product variant data to the database."""
+def _save_variant_row(cursor, product_id, variant):
+    """Write product variant data on `cursor`."""
     variant_data = (
         product_id,  # Foreign key to products table
         variant['id'],
@@ -97,8 +302,39 @@ def save_variant_to_db(product_id, variant):
             variant_weight_unit = VALUES(variant_weight_unit),
             last_updated_at = CURRENT_TIMESTAMP();
     """
-    
-    save_to_db(insert_query, variant_data)
+
+    cursor.execute(insert_query, variant_data)
+
+def delete_product_from_db(shopify_product_id, store=None):
+    """
+    Delete a product, its variants and its images from the database. Errors are logged and re-raised.
+
+    `store` is the config of the product's store (default: this process's store), whose
+    internal-link terms are updated.
+    """
+    logging.info(f"Deleting product: {shopify_product_id}")
+    connection = connect_db()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                DELETE product_variants FROM product_variants
+                JOIN products ON products.id = product_variants.product_id
+                WHERE products.shopify_product_id = %s
+                """,
+                (shopify_product_id,)
+            )
+            cursor.execute("DELETE FROM product_images WHERE shopify_product_id = %s", (shopify_product_id,))
+            cursor.execute("DELETE FROM products WHERE shopify_product_id = %s", (shopify_product_id,))
+        connection.commit()
+    except Exception as e:
+        logging.error(f"Error deleting product {shopify_product_id} from DB: {e}")
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    update_product_links(deleted_ids=[shopify_product_id], store=store)
+    bump_cache_version("products")
 
 def sync_products_with_shopify():
     """Main function to sync products from Shopify to the local database."""
@@ -107,10 +343,30 @@ def sync_products_with_shopify():
     products = get_shopify_products()  # Fetch products from Shopify
     if products:
         logging.info(f"Successfully fetched {len(products)} products.")
+        stored_hashes = fetch_product_hashes()
+        # Skip products whose content is identical to the stored row
+        changed_products = []
         for product in products:
-            save_product_to_db(product)  # Save each product and its variants
+            product_hash = product_content_hash(product)
+            if stored_hashes.get(product['id']) != product_hash:
+                changed_products.append((product, product_hash))
+        # Record price/inventory deltas before the variants are overwritten
+        snapshot_variants([product for product, _ in changed_products])
+        # Products, variants and images are committed together per batch; failed products are retried by the next sync
+        failed = []
+        for start in range(0, len(changed_products), PRODUCT_BATCH_SIZE):
+            failed += save_products(changed_products[start:start + PRODUCT_BATCH_SIZE])
+            report_progress(min(start + PRODUCT_BATCH_SIZE, len(changed_products)), len(changed_products))
+        # Only the changed products' names and SKUs are re-indexed for blog internal links
+        update_product_links([product for product, _ in changed_products])
+        changed = len(changed_products)
+        if changed:
+            bump_cache_version("products")
+        logging.info(f"Products sync finished: {changed} changed, {len(products) - changed} unchanged, {len(failed)} failed.")
     else:
         logging.error("No products found or API request failed.")
 
 if __name__ == "__main__":
-    sync_products_with_shopify()
\ No newline at end of file
+    configure_logging()
+    with profile_step("product_sync"):
+        sync_products_with_shopify()
\ No newline at end of file
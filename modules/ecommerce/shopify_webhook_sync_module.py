@@ -0,0 +1,321 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from modules.api.shopify_api import STORES, store_for_domain
+from modules.database.db_connection import connect_db
+from modules.database.read_api import bump_cache_version
+from modules.ecommerce.blog_internal_links import update_product_links
+from modules.ecommerce.blog_sync_db_with_shopify_module import ensure_blog_columns, upsert_shopify_articles
+from modules.ecommerce.product_sync_db_with_shopify_module import (
+    delete_product_from_db, ensure_product_columns, save_product_to_db, snapshot_variants,
+)
+from modules.monitoring.log_config import configure_logging
+from modules.monitoring.profiling import profile_step
+
+# Webhook topics we subscribe to, and the resource each one changes
+WEBHOOK_TOPICS = {
+    "products/create": "product",
+    "products/update": "product",
+    "products/delete": "product",
+    "articles/update": "article",
+}
+
+# Durable local queue: events survive restarts until a worker has applied them
+QUEUE_PATH = os.environ.get(
+    "SHOPIFY_WEBHOOK_QUEUE_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "../../data/shopify_webhook_queue.db"))
+)
+# Overrides every store's `WEBHOOK_SECRET` from shopify_config.json
+WEBHOOK_SECRET = os.environ.get("SHOPIFY_WEBHOOK_SECRET")
+
+BATCH_SIZE = 100
+POLL_INTERVAL = 2.0
+# Claimed events that were not applied (worker died, or applying them failed) are handed out
+# again after this many seconds
+CLAIM_TIMEOUT = 300
+# Events that failed this many times are marked 'failed' and kept for inspection
+MAX_ATTEMPTS = 5
+
+_worker_thread = None
+_worker_lock = threading.Lock()
+
+
+def webhook_store(shop_domain):
+    """
+    The configured store a webhook came from, by its `X-Shopify-Shop-Domain` header.
+
+    Returns None for unknown shops; a single-store setup also accepts a missing header.
+    """
+    if not shop_domain:
+        return STORES[0] if len(STORES) == 1 else None
+    return store_for_domain(STORES, shop_domain)
+
+
+def verify_webhook_hmac(raw_body, hmac_header, store):
+    """Check the `X-Shopify-Hmac-Sha256` header against the raw request body with `store`'s secret."""
+    secret = WEBHOOK_SECRET or store.get("WEBHOOK_SECRET")
+    if not secret or not hmac_header:
+        return False
+    digest = hmac.new(secret.encode("utf-8"), raw_body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode("ascii"), hmac_header)
+
+
+def _connect_queue():
+    os.makedirs(os.path.dirname(QUEUE_PATH), exist_ok=True)
+    conn = sqlite3.connect(QUEUE_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS webhook_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            webhook_id TEXT UNIQUE,
+            topic TEXT NOT NULL,
+            resource_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            claimed_at REAL,
+            received_at REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            store_id TEXT
+        )
+    """)
+    # Queues created by earlier versions lack the retry and store columns
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(webhook_events)")}
+    for column, definition in (("status", "TEXT NOT NULL DEFAULT 'pending'"),
+                               ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+                               ("last_error", "TEXT"),
+                               ("store_id", "TEXT")):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE webhook_events ADD COLUMN {column} {definition}")
+    return conn
+
+
+def enqueue_webhook_event(topic, payload, webhook_id=None, store_id=None):
+    """
+    Store a verified webhook from store `store_id` (default: the first store) in the local queue.
+
+    Shopify redelivers webhooks, so events with an already-seen `webhook_id` are ignored.
+    """
+    conn = _connect_queue()
+    try:
+        conn.execute(
+            "INSERT OR IGNORE INTO webhook_events (webhook_id, topic, resource_id, payload, received_at, store_id) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (webhook_id, topic, payload["id"], json.dumps(payload), time.time(), store_id)
+        )
+    finally:
+        conn.close()
+
+
+def _claim_batch(conn, batch_size, max_attempts=MAX_ATTEMPTS):
+    """
+    Claim the oldest unclaimed (or abandoned) pending events for this worker.
+
+    Each claim counts as an attempt, so an event that crashes its worker is capped too:
+    abandoned events that already used `max_attempts` are marked failed instead.
+    """
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "UPDATE webhook_events SET status = 'failed', last_error = COALESCE(last_error, 'claim expired') "
+            "WHERE status = 'pending' AND attempts >= ? AND claimed_at < ?",
+            (max_attempts, now - CLAIM_TIMEOUT)
+        )
+        rows = conn.execute(
+            "SELECT id, topic, resource_id, payload, store_id FROM webhook_events "
+            "WHERE status = 'pending' AND (claimed_at IS NULL OR claimed_at < ?) ORDER BY id LIMIT ?",
+            (now - CLAIM_TIMEOUT, batch_size)
+        ).fetchall()
+        conn.executemany("UPDATE webhook_events SET claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                         [(now, row[0]) for row in rows])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return rows
+
+
+def apply_webhook_events(events, store=None):
+    """
+    Apply a batch of `(topic, payload)` events of one store through the product and blog upsert logic.
+
+    Rows are tagged with `store`'s STORE_ID (default: the first store), so webhooks never
+    move another store's products or articles.
+
+    Only the latest event per resource is applied, so a burst of updates to one
+    product costs a single write. Variant snapshots are recorded for the whole
+    batch at once; each product is then written on its own and the articles in
+    one transaction, so a failure only affects the resources involved.
+
+    Returns:
+        dict: `{(resource, resource_id): error}` for the changes that could not be applied
+    """
+    store = store or STORES[0]
+    latest = {}
+    for topic, payload in events:
+        latest[(WEBHOOK_TOPICS[topic], payload["id"])] = (topic, payload)
+
+    # Price/inventory changes must be read before the variants are overwritten
+    snapshot_variants([payload for (resource, _), (topic, payload) in latest.items()
+                       if resource == "product" and topic != "products/delete"])
+
+    failed = {}
+    articles = []
+    saved_products = []
+    for key, (topic, payload) in latest.items():
+        resource, resource_id = key
+        if resource == "product":
+            try:
+                if topic == "products/delete":
+                    delete_product_from_db(resource_id, store=store)
+                else:
+                    save_product_to_db(payload, record_snapshot=False, store_id=store["STORE_ID"])
+                    saved_products.append(payload)
+            except Exception as e:
+                logging.error(f"Error applying {topic} webhook for {resource_id}: {e}")
+                failed[key] = e
+        elif str(payload.get("blog_id")) == str(store["BLOG_ID"]):
+            articles.append(payload)
+
+    # One internal-link index update for the whole batch; on failure the products are
+    # retried so their links are not left stale
+    try:
+        update_product_links(saved_products, store=store)
+    except Exception as e:
+        logging.error(f"Error updating product links for webhook batch: {e}")
+        failed.update((("product", product["id"]), e) for product in saved_products)
+
+    if articles:
+        conn = connect_db()
+        try:
+            with conn.cursor() as cursor:
+                upsert_shopify_articles(cursor, articles, store_id=store["STORE_ID"])
+            conn.commit()
+            bump_cache_version("blogs")
+        except Exception as e:
+            logging.error(f"Error applying article webhooks: {e}")
+            conn.rollback()
+            failed.update((("article", article["id"]), e) for article in articles)
+        finally:
+            conn.close()
+    if saved_products:
+        bump_cache_version("products")
+    logging.info(f"Applied {len(latest) - len(failed)} webhook changes ({len(events)} events, {len(failed)} failed).")
+    return failed
+
+
+# Set once this process has added the products/blogs columns that webhook writes use
+_columns_ready = False
+
+
+def _ensure_columns():
+    """
+    Add the columns a full sync would otherwise add first, once per process, so webhooks
+    arriving on a fresh deploy do not fail with "Unknown column".
+    """
+    global _columns_ready
+    if _columns_ready:
+        return
+    conn = connect_db()
+    try:
+        ensure_product_columns(conn)
+        ensure_blog_columns(conn)
+    finally:
+        conn.close()
+    _columns_ready = True
+
+
+def process_webhook_queue(batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+    """
+    Drain one batch from the queue. Events are deleted only after they were applied.
+
+    An event that fails keeps its claim and is retried after CLAIM_TIMEOUT; after
+    `max_attempts` attempts it is marked 'failed' with the last error.
+
+    Returns:
+        int: number of events processed
+    """
+    conn = _connect_queue()
+    try:
+        rows = _claim_batch(conn, batch_size, max_attempts)
+        if not rows:
+            return 0
+        _ensure_columns()
+        # Events without a store predate multi-store webhooks and belong to the first store
+        stores = {store["STORE_ID"]: store for store in STORES}
+        events, failed = {}, {}
+        for _, topic, resource_id, payload, store_id in rows:
+            store_id = store_id or STORES[0]["STORE_ID"]
+            try:
+                events.setdefault(store_id, []).append((topic, json.loads(payload)))
+            except ValueError as e:
+                failed[(store_id, WEBHOOK_TOPICS[topic], resource_id)] = e
+        for store_id, store_events in events.items():
+            if store_id not in stores:
+                error = KeyError(f"Unknown Shopify store '{store_id}'")
+                failed.update(((store_id, WEBHOOK_TOPICS[topic], payload["id"]), error)
+                              for topic, payload in store_events)
+                continue
+            for (resource, resource_id), error in apply_webhook_events(store_events, stores[store_id]).items():
+                failed[(store_id, resource, resource_id)] = error
+
+        applied, retried = [], []
+        for event_id, topic, resource_id, _, store_id in rows:
+            error = failed.get((store_id or STORES[0]["STORE_ID"], WEBHOOK_TOPICS[topic], resource_id))
+            if error is None:
+                applied.append((event_id,))
+            else:
+                retried.append((str(error)[:2000], max_attempts, event_id))
+        conn.executemany("DELETE FROM webhook_events WHERE id = ?", applied)
+        conn.executemany(
+            "UPDATE webhook_events SET last_error = ?, status = CASE WHEN attempts >= ? THEN 'failed' ELSE status END "
+            "WHERE id = ?",
+            retried
+        )
+        return len(rows)
+    finally:
+        conn.close()
+
+
+def _worker_loop():
+    logging.info("Shopify webhook worker started.")
+    while True:
+        try:
+            if process_webhook_queue():
+                continue
+        except Exception as e:
+            logging.error(f"Error applying webhook events: {e}")
+        time.sleep(POLL_INTERVAL)
+
+
+def start_webhook_worker():
+    """Start the background worker thread once per process."""
+    global _worker_thread
+    with _worker_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(target=_worker_loop, name="shopify-webhook-worker", daemon=True)
+            _worker_thread.start()
+    return _worker_thread
+
+
+if __name__ == "__main__":
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Apply queued Shopify webhook events.")
+    parser.add_argument("--follow", action="store_true",
+                        help="keep polling the queue, e.g. next to a web server that does not run the worker thread")
+    args = parser.parse_args()
+    if args.follow:
+        _worker_loop()
+    # Drain the queue once, e.g. from cron when the web app is not running
+    with profile_step("webhook_sync"):
+        while process_webhook_queue():
+            pass
@@ -0,0 +1,67 @@
+import argparse
+import functools
+import importlib
+import logging
+
+from modules.database.db_connection import iter_keywords
+from modules.database.work_queue import enqueue_chunks, requeue_expired, run_worker
+from modules.monitoring.log_config import configure_logging
+
+# Work-queue name -> (chunk processor module, minimum avg_monthly_searches of the keywords to enqueue)
+QUEUES = {
+    "keyword_plan": ("modules.ecommerce.google_ads_keyword_plan", None),
+    "keyword_historical": ("modules.ecommerce.google_ads_keyword_historical", None),
+    "blog_generator": ("modules.ecommerce.blog_generator_db_with_openai_module", 100),
+}
+
+# Queues whose processors need a Google Ads client; it is loaded once per worker
+GOOGLE_ADS_QUEUES = {"keyword_plan", "keyword_historical"}
+
+
+def seed_queue(queue_name, chunk_size=20):
+    """Stream the keywords for `queue_name` into chunks and enqueue them."""
+    _, min_searches = QUEUES[queue_name]
+    return enqueue_chunks(queue_name, iter_keywords(min_searches=min_searches), chunk_size=chunk_size)
+
+
+def build_processor(queue_name):
+    """Return the chunk processor of the ecommerce module behind `queue_name`."""
+    module_name, _ = QUEUES[queue_name]
+    module = importlib.import_module(module_name)
+    processor = module.process_keyword_chunk
+    if queue_name in GOOGLE_ADS_QUEUES:
+        from modules.api.google_ads_api import load_google_ads_client
+        processor = functools.partial(processor, client=load_google_ads_client())
+    return processor
+
+
+def work(queue_name, lease_seconds=300, max_chunks=None):
+    """Process chunks of `queue_name` until the queue is drained."""
+    requeue_expired(queue_name)
+    return run_worker(queue_name, build_processor(queue_name), lease_seconds=lease_seconds, max_chunks=max_chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distribute pipeline work across hosts via the MySQL work queue.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="enqueue keyword chunks")
+    seed_parser.add_argument("queue", choices=sorted(QUEUES))
+    seed_parser.add_argument("--chunk-size", type=int, default=20)
+
+    work_parser = subparsers.add_parser("work", help="claim and process chunks")
+    work_parser.add_argument("queue", choices=sorted(QUEUES))
+    work_parser.add_argument("--lease-seconds", type=int, default=300)
+    work_parser.add_argument("--max-chunks", type=int, default=None)
+
+    args = parser.parse_args()
+    configure_logging()
+    if args.command == "seed":
+        count = seed_queue(args.queue, chunk_size=args.chunk_size)
+        logging.info(f"Enqueued {count} chunks on {args.queue}.")
+    else:
+        work(args.queue, lease_seconds=args.lease_seconds, max_chunks=args.max_chunks)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import fcntl
+import importlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+# Pipeline steps that can be triggered as background jobs: name -> (module, function).
+# Modules are imported only when a job runs, so the web app starts without Google Ads/OpenAI config.
+JOB_TARGETS = {
+    "keyword_plan": ("modules.ecommerce.google_ads_keyword_plan", "main"),
+    "keyword_historical": ("modules.ecommerce.google_ads_keyword_historical", "main"),
+    "keyword_scoring": ("modules.ecommerce.google_ads_keyword_scoring", "main"),
+    "blog_generator": ("modules.ecommerce.blog_generator_db_with_openai_module", "main"),
+    "blog_sync": ("modules.ecommerce.blog_sync_db_with_shopify_module", "main"),
+    "product_sync": ("modules.ecommerce.product_sync_db_with_shopify_module", "sync_products_with_shopify"),
+}
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+# Job records are files so every passenger process can answer status requests
+JOBS_DIR = os.environ.get(
+    "AUTOCONTENTIFY_JOBS_DIR",
+    os.path.join(PROJECT_ROOT, "data", "jobs")
+)
+# Minimum seconds between progress writes of one job
+PROGRESS_WRITE_INTERVAL = 1.0
+# "skipped" only appears in records written before jobs ran in subprocesses
+FINISHED_STATUSES = ("succeeded", "failed", "skipped")
+
+_current = threading.local()
+
+
+class JobAlreadyRunning(Exception):
+    """Raised when a job with the same name is already queued or running."""
+
+    def __init__(self, job_id):
+        super().__init__(f"Job already running: {job_id}")
+        self.job_id = job_id
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+def _write_job(job):
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    tmp_path = _job_path(job["id"]) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(job, f)
+    os.replace(tmp_path, _job_path(job["id"]))
+
+
+def _read_job(job_id):
+    try:
+        with open(_job_path(os.path.basename(job_id)), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def get_job(job_id):
+    """Return the job record, or None if the id is unknown. Jobs whose process died are reported as failed."""
+    job = _read_job(job_id)
+    if job is not None and job["status"] not in FINISHED_STATUSES:
+        job = _fail_if_abandoned(job)
+    return job
+
+
+def list_jobs(limit=50):
+    """Return the most recent job records, newest first."""
+    if not os.path.isdir(JOBS_DIR):
+        return []
+    jobs = [get_job(name[:-5]) for name in os.listdir(JOBS_DIR) if name.endswith(".json")]
+    jobs = [job for job in jobs if job]
+    jobs.sort(key=lambda job: job["created_at"], reverse=True)
+    return jobs[:limit]
+
+
+def _lock_path(name):
+    return os.path.join(JOBS_DIR, f"{name}.lock")
+
+
+def _open_lock(name):
+    """Non-blocking exclusive lock per job name, shared by all processes on the host."""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    # "a" so a failed attempt does not truncate the holder's job id
+    lock_file = open(_lock_path(name), "a+")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _lock_holder(name):
+    """Id of the job that last took the lock of `name`, or None."""
+    try:
+        with open(_lock_path(name), "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _fail_if_abandoned(job):
+    """
+    Mark a queued/running job failed when its process is gone.
+
+    A job process holds the job's lock until it exits and writes its final status
+    before that, so once the pid is gone the record can be re-read without racing
+    the job. Records written before the process recorded its pid are checked
+    through the lock instead.
+    """
+    pid = job.get("pid")
+    if pid:
+        if _pid_alive(pid):
+            return job
+        job = _read_job(job["id"])
+        if job["status"] not in FINISHED_STATUSES:
+            job.update(status="failed", finished_at=time.time(), error="Job process exited without finishing")
+            _write_job(job)
+        return job
+
+    lock_file = _open_lock(job["name"])
+    if lock_file is None:
+        # Either this job is starting up or another job of the same name runs; this one is
+        # stale only in the second case
+        if _lock_holder(job["name"]) == job["id"]:
+            return job
+    try:
+        current = _read_job(job["id"])
+        if current["status"] not in FINISHED_STATUSES and not current.get("pid"):
+            current.update(status="failed", finished_at=time.time(), error="Job process exited without finishing")
+            _write_job(current)
+        return current
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+
+
+def report_progress(done, total=None, message=None):
+    """
+    Record progress of the job running in the current thread.
+
+    Safe to call from pipeline code that runs outside a job: it does nothing then.
+    """
+    job = getattr(_current, "job", None)
+    if job is None:
+        return
+    job["progress"] = {"done": done, "total": total, "message": message}
+    now = time.monotonic()
+    if now - getattr(_current, "last_write", 0) >= PROGRESS_WRITE_INTERVAL or (total and done >= total):
+        _current.last_write = now
+        _write_job(job)
+
+
+def run_job(job_id):
+    """
+    Run a queued job in the current process and record its outcome.
+
+    This is the body of the job subprocess started by `enqueue_job`, which hands over
+    the job's lock as an inherited file descriptor; it stays locked until this process exits.
+    """
+    job = _read_job(job_id)
+    job.update(status="running", started_at=time.time(), pid=os.getpid())
+    _write_job(job)
+    _current.job = job
+    _current.last_write = 0
+    logging.info(f"Job {job['id']} ({job['name']}) started.")
+    try:
+        module_name, function_name = JOB_TARGETS[job["name"]]
+        getattr(importlib.import_module(module_name), function_name)()
+        job.update(status="succeeded")
+    except BaseException as e:
+        # SystemExit from config checks is recorded like any other failure
+        logging.error(f"Job {job['id']} ({job['name']}) failed: {e!r}")
+        job.update(status="failed", error=repr(e))
+    finally:
+        _current.job = None
+        job["finished_at"] = time.time()
+        _write_job(job)
+        logging.info(f"Job {job['id']} ({job['name']}) finished: {job['status']}.")
+
+
+def enqueue_job(name):
+    """
+    Start a pipeline step in a detached subprocess and return its job record immediately.
+
+    The per-name lock is taken here, before the record is written, and passed on to the
+    subprocess, so only one process on the host can accept a given job at a time. Jobs
+    outlive the web worker that started them and do not share its GIL.
+
+    Raises:
+        KeyError: unknown job name
+        JobAlreadyRunning: the same job is already queued or running
+    """
+    if name not in JOB_TARGETS:
+        raise KeyError(name)
+
+    lock_file = _open_lock(name)
+    if lock_file is None:
+        raise JobAlreadyRunning(_lock_holder(name))
+    try:
+        job = {
+            "id": uuid.uuid4().hex,
+            "name": name,
+            "status": "queued",
+            "pid": None,
+            "progress": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        lock_file.truncate(0)
+        lock_file.write(job["id"])
+        lock_file.flush()
+        _write_job(job)
+        env = dict(os.environ, AUTOCONTENTIFY_STEP=name)
+        process = subprocess.Popen(
+            [sys.executable, "-m", "modules.jobs.job_runner", job["id"]],
+            cwd=PROJECT_ROOT, env=env, pass_fds=(lock_file.fileno(),), start_new_session=True,
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+    except BaseException:
+        lock_file.close()
+        raise
+    # The subprocess now holds the lock through its copy of the descriptor
+    lock_file.close()
+    # Reap the subprocess when it exits; if this process is recycled first, init does
+    threading.Thread(target=process.wait, name=f"job-{job['id']}", daemon=True).start()
+    return job
+
+
+if __name__ == "__main__":
+    from modules.monitoring.log_config import configure_logging
+    # Pipeline modules report progress through the imported module, not this __main__ copy
+    from modules.jobs import job_runner
+
+    configure_logging()
+    job_runner.run_job(sys.argv[1])
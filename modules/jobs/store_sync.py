@@ -0,0 +1,95 @@
+"""
+Sharded Shopify sync: product and blog sync for every configured store, in a process pool.
+
+Each (store, step) pair runs in its own freshly spawned process with
+SHOPIFY_STORE_ID set, so the process imports the Shopify modules bound to that
+store: its own HTTP session, leaky bucket, per-store shared limiter and MySQL
+connections. Steps of different stores never wait on each other, and the pool
+is sized by CPU count, so a run takes about as long as the slowest store's
+steps once there are enough cores.
+
+    python -m modules.jobs.store_sync
+    python -m modules.jobs.store_sync --stores shop-a.myshopify.com --steps product_sync
+"""
+import argparse
+import importlib
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from modules.monitoring.log_config import configure_logging
+from modules.monitoring.profiling import PROFILE_MODES, profile_step
+
+# Step name -> (module, entry point). The steps are independent: a store's blog and product
+# sync run at the same time, in separate processes.
+STEPS = {
+    "blog_sync": ("modules.ecommerce.blog_sync_db_with_shopify_module", "main"),
+    "product_sync": ("modules.ecommerce.product_sync_db_with_shopify_module", "sync_products_with_shopify"),
+}
+
+
+def run_store_step(store_id, step):
+    """Run one step for one store. Must run in a fresh process: the store is bound at import time."""
+    os.environ["SHOPIFY_STORE_ID"] = store_id
+    # Metrics snapshots are written per step and store, and merged by main.py
+    os.environ["AUTOCONTENTIFY_STEP"] = f"{os.environ.get('AUTOCONTENTIFY_STEP', 'store_sync')}-{step}-{store_id}"
+    configure_logging()
+    module_name, entry_point = STEPS[step]
+    started = time.monotonic()
+    with profile_step():
+        getattr(importlib.import_module(module_name), entry_point)()
+    return time.monotonic() - started
+
+
+def sync_stores(store_ids=None, steps=None, processes=None):
+    """
+    Run `steps` (default: all) for `store_ids` (default: every configured store) in a process pool.
+
+    Returns:
+        tuple: `({(store_id, step): seconds}, [(store_id, step), ...])` for the finished and the failed steps
+    """
+    from modules.api.shopify_api import STORES
+
+    store_ids = store_ids or [store["STORE_ID"] for store in STORES]
+    steps = steps or list(STEPS)
+    tasks = [(store_id, step) for store_id in store_ids for step in steps]
+    processes = processes or min(len(tasks), os.cpu_count() or 1)
+    logging.info(f"Syncing {len(store_ids)} store(s), steps {steps}, with {processes} process(es).")
+
+    durations, failed = {}, []
+    # spawn + one task per child: every task starts a new interpreter and imports its store's config
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context, max_tasks_per_child=1) as pool:
+        futures = {pool.submit(run_store_step, store_id, step): (store_id, step) for store_id, step in tasks}
+        for future in as_completed(futures):
+            store_id, step = futures[future]
+            try:
+                durations[(store_id, step)] = future.result()
+                logging.info(f"Store {store_id}: {step} finished in {durations[(store_id, step)]:.1f}s.")
+            except Exception as e:
+                logging.error(f"Store {store_id}: {step} failed: {e}")
+                failed.append((store_id, step))
+    return durations, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync products and blogs of several Shopify stores in parallel.")
+    parser.add_argument("--stores", nargs="+", help="store ids to sync (default: all configured stores)")
+    parser.add_argument("--steps", nargs="+", choices=sorted(STEPS), help="steps to run (default: all)")
+    parser.add_argument("--processes", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--profile", choices=PROFILE_MODES, help="profile each step (see modules.monitoring.profiling)")
+    args = parser.parse_args()
+    configure_logging()
+    if args.profile:
+        # Read by the spawned workers when they import the profiling module
+        os.environ["AUTOCONTENTIFY_PROFILE"] = args.profile
+
+    durations, failed = sync_stores(args.stores, args.steps, args.processes)
+    print(f"Store sync finished: {len(durations)} step(s) completed, {len(failed)} failed.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,148 @@
+"""
+Process-wide logging: JSON lines written by a background QueueListener.
+
+Call `configure_logging()` once from an entry point (main.py, app.py, or a
+module's `__main__` block). Every logger then only hands records to a
+QueueHandler; formatting and file/console I/O happen on the listener thread,
+off the sync loops. INFO/DEBUG records are rate-limited per source module so
+per-row messages (one per product, variant or keyword) cannot flood the log;
+the number of dropped records is attached to the next record that gets through.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+# Where main.py points its steps; falls back to stderr only
+LOG_FILE = os.environ.get("AUTOCONTENTIFY_LOG_FILE")
+LOG_LEVEL = os.environ.get("AUTOCONTENTIFY_LOG_LEVEL", "INFO").upper()
+# INFO/DEBUG records per second allowed from one module, e.g. "product_sync_db_with_shopify_module=5,*=50"
+LOG_RATE_LIMITS = os.environ.get("AUTOCONTENTIFY_LOG_RATE_LIMITS", "")
+DEFAULT_RATE_LIMIT = 50.0
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, module, message plus any `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def parse_rate_limits(spec):
+    """Parse "module=rate,..." into a dict; "*" sets the default."""
+    limits = {}
+    for part in filter(None, (item.strip() for item in spec.split(","))):
+        module, _, rate = part.partition("=")
+        limits[module.strip()] = float(rate)
+    return limits
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per source module for records below WARNING; warnings and errors always pass."""
+
+    def __init__(self, limits=None, default=DEFAULT_RATE_LIMIT):
+        super().__init__()
+        limits = dict(limits or {})
+        self.default = limits.pop("*", default)
+        self.limits = limits
+        self.buckets = {}  # module -> [tokens, updated_at, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.limits.get(record.module, self.default)
+        if rate <= 0:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.setdefault(record.module, [rate, now, 0])
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+def configure_logging(log_file=None, level=None, rate_limits=None, console=True):
+    """
+    Route all logging through a QueueHandler to a background QueueListener.
+
+    Idempotent: later calls in the same process are ignored. Handlers that
+    modules attached to their own loggers are removed and the loggers made to
+    propagate, so every record takes the same non-blocking path.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        log_file = log_file or LOG_FILE
+        limits = parse_rate_limits(LOG_RATE_LIMITS)
+        limits.update(rate_limits or {})
+
+        formatter = JsonFormatter()
+        handlers = []
+        if log_file:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            file_handler = logging.FileHandler(log_file, encoding="utf-8")
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        if console or not handlers:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(formatter)
+            handlers.append(console_handler)
+
+        records = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(records)
+        queue_handler.addFilter(RateLimitFilter(limits))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for logger in list(logging.Logger.manager.loggerDict.values()):
+            if isinstance(logger, logging.Logger) and logger.handlers:
+                for handler in list(logger.handlers):
+                    logger.removeHandler(handler)
+                logger.propagate = True
+        root.addHandler(queue_handler)
+        root.setLevel(level or LOG_LEVEL)
+
+        _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -0,0 +1,238 @@
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Latency histogram bucket upper bounds in seconds (Prometheus "le" labels)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+# Counters exported besides the latency histogram: name -> (label names, help text)
+COUNTERS = {
+    "calls_total": (("service", "operation", "outcome"), "External calls by outcome."),
+    "bytes_total": (("service", "direction"), "Bytes sent to and received from external services."),
+    "retries_total": (("service",), "Retried external calls."),
+    "tokens_total": (("service", "kind"), "LLM tokens used."),
+    "rows_written_total": (("table",), "Database rows written."),
+}
+
+METRIC_PREFIX = "autocontentify_"
+
+# When set (by main.py), each process writes its metrics here on exit
+METRICS_DIR = os.environ.get("AUTOCONTENTIFY_METRICS_DIR")
+STEP_NAME = os.environ.get("AUTOCONTENTIFY_STEP", "process")
+
+_lock = threading.Lock()
+_histograms = {}  # (service, operation) -> {"buckets": [...], "sum": float, "count": int}
+_counters = {name: {} for name in COUNTERS}  # name -> {label values tuple: value}
+
+
+def _observe(service, operation, seconds):
+    with _lock:
+        histogram = _histograms.setdefault(
+            (service, operation), {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+        )
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][index] += 1
+                break
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+
+
+def _increment(name, labels, value=1):
+    with _lock:
+        _counters[name][labels] = _counters[name].get(labels, 0) + value
+
+
+class timed(contextlib.ContextDecorator):
+    """
+    Record the latency and outcome of an external call.
+
+    Usable as a context manager (`with timed("shopify", "GET"):`) or a decorator
+    (`@timed("mysql", "connect")`).
+    """
+
+    def __init__(self, service, operation):
+        self.service = service
+        self.operation = operation
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _observe(self.service, self.operation, time.perf_counter() - self.started)
+        _increment("calls_total", (self.service, self.operation, "error" if exc_type else "ok"))
+        return False
+
+
+def record_bytes(service, sent=0, received=0):
+    if sent:
+        _increment("bytes_total", (service, "sent"), sent)
+    if received:
+        _increment("bytes_total", (service, "received"), received)
+
+
+def record_retry(service):
+    _increment("retries_total", (service,))
+
+
+def record_tokens(service, prompt_tokens=0, completion_tokens=0):
+    if prompt_tokens:
+        _increment("tokens_total", (service, "prompt"), prompt_tokens)
+    if completion_tokens:
+        _increment("tokens_total", (service, "completion"), completion_tokens)
+
+
+def record_rows(table, rows):
+    if rows:
+        _increment("rows_written_total", (table,), rows)
+
+
+def reset():
+    """Clear all metrics, e.g. between benchmark phases."""
+    with _lock:
+        _histograms.clear()
+        for values in _counters.values():
+            values.clear()
+
+
+def snapshot():
+    """Return a JSON-serializable, mergeable copy of all metrics."""
+    with _lock:
+        return {
+            "histograms": [
+                {"service": service, "operation": operation, "buckets": list(histogram["buckets"]),
+                 "sum": histogram["sum"], "count": histogram["count"]}
+                for (service, operation), histogram in _histograms.items()
+            ],
+            "counters": {
+                name: [{"labels": list(labels), "value": value} for labels, value in values.items()]
+                for name, values in _counters.items()
+            },
+        }
+
+
+def merge_snapshots(snapshots):
+    """Add up snapshots written by several processes."""
+    histograms, counters = {}, {name: {} for name in COUNTERS}
+    for snap in snapshots:
+        for histogram in snap["histograms"]:
+            key = (histogram["service"], histogram["operation"])
+            merged = histograms.setdefault(key, {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0})
+            merged["buckets"] = [a + b for a, b in zip(merged["buckets"], histogram["buckets"])]
+            merged["sum"] += histogram["sum"]
+            merged["count"] += histogram["count"]
+        for name, values in snap["counters"].items():
+            for entry in values:
+                labels = tuple(entry["labels"])
+                counters[name][labels] = counters[name].get(labels, 0) + entry["value"]
+    return {
+        "histograms": [
+            {"service": service, "operation": operation, **histogram}
+            for (service, operation), histogram in histograms.items()
+        ],
+        "counters": {
+            name: [{"labels": list(labels), "value": value} for labels, value in values.items()]
+            for name, values in counters.items()
+        },
+    }
+
+
+def _quantile(buckets, count, q):
+    """Estimate a quantile by linear interpolation inside the histogram bucket that holds it."""
+    if not count:
+        return None
+    rank = q * count
+    seen, lower = 0, 0.0
+    for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+        if bucket_count and seen + bucket_count >= rank:
+            if bound == float("inf"):
+                return lower
+            return lower + (bound - lower) * (rank - seen) / bucket_count
+        seen += bucket_count
+        lower = bound if bound != float("inf") else lower
+    return lower
+
+
+def summarize(snap=None):
+    """Condense a snapshot into per-call latency percentiles and counter totals."""
+    snap = snap or snapshot()
+    calls = []
+    for histogram in snap["histograms"]:
+        count = histogram["count"]
+        calls.append({
+            "service": histogram["service"],
+            "operation": histogram["operation"],
+            "count": count,
+            "total_seconds": round(histogram["sum"], 3),
+            "avg_ms": round(histogram["sum"] / count * 1000, 1) if count else None,
+            "p50_ms": round(_quantile(histogram["buckets"], count, 0.5) * 1000, 1) if count else None,
+            "p99_ms": round(_quantile(histogram["buckets"], count, 0.99) * 1000, 1) if count else None,
+        })
+    calls.sort(key=lambda call: call["total_seconds"], reverse=True)
+    totals = {
+        name: {"/".join(entry["labels"]): entry["value"] for entry in values}
+        for name, values in snap["counters"].items()
+    }
+    return {"calls": calls, "totals": totals}
+
+
+def _format_labels(names, values):
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+def render_prometheus(snap=None):
+    """Render metrics in the Prometheus text exposition format."""
+    snap = snap or snapshot()
+    lines = [
+        f"# HELP {METRIC_PREFIX}call_duration_seconds Latency of external calls.",
+        f"# TYPE {METRIC_PREFIX}call_duration_seconds histogram",
+    ]
+    for histogram in snap["histograms"]:
+        labels = _format_labels(("service", "operation"), (histogram["service"], histogram["operation"]))
+        cumulative = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{METRIC_PREFIX}call_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{METRIC_PREFIX}call_duration_seconds_sum{{{labels}}} {histogram['sum']}")
+        lines.append(f"{METRIC_PREFIX}call_duration_seconds_count{{{labels}}} {histogram['count']}")
+
+    for name, (label_names, help_text) in COUNTERS.items():
+        lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}{name} counter")
+        for entry in snap["counters"].get(name, []):
+            lines.append(f"{METRIC_PREFIX}{name}{{{_format_labels(label_names, entry['labels'])}}} {entry['value']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_snapshot(directory=None, step=None):
+    """Write this process's snapshot as `<step>-<pid>.json` for the pipeline summary."""
+    directory = directory or METRICS_DIR
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{step or STEP_NAME}-{os.getpid()}.json")
+    with open(path, "w") as f:
+        json.dump(snapshot(), f)
+    return path
+
+
+def write_run_summary(directory):
+    """Merge every snapshot in `directory` into `summary.json` and return the summary."""
+    snapshots = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json") and name != "summary.json":
+            with open(os.path.join(directory, name), "r") as f:
+                snapshots.append(json.load(f))
+    summary = summarize(merge_snapshots(snapshots))
+    with open(os.path.join(directory, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+if METRICS_DIR:
+    atexit.register(write_snapshot)
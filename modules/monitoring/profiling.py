@@ -0,0 +1,216 @@
+"""
+Opt-in profiling for pipeline steps.
+
+Set AUTOCONTENTIFY_PROFILE (or pass `--profile` to main.py / store_sync) to one of
+
+- `sample`: a background thread samples every thread's stack each
+  AUTOCONTENTIFY_PROFILE_INTERVAL seconds (default 5 ms); low overhead, wall-clock time,
+  so time spent waiting on Shopify, OpenAI or MySQL shows up too.
+- `cprofile`: the sampler plus cProfile on the step's main thread (exact call counts,
+  noticeably slower).
+
+Either mode also tracks peak memory with tracemalloc. Each profiled step writes to
+AUTOCONTENTIFY_PROFILE_DIR (default `logs/profiles`, per run under main.py):
+
+- `<step>-<pid>.collapsed`: collapsed stacks, for flamegraph.pl or speedscope
+- `<step>-<pid>.pstats`: cProfile stats, for `python -m pstats` or snakeviz (cprofile mode)
+- `<step>-<pid>.profile.json`: duration, peak memory, top hotspots and allocation sites
+
+    with profile_step("blog_sync"):
+        main()
+"""
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+PROFILE_MODES = ("sample", "cprofile")
+PROFILE_MODE = os.environ.get("AUTOCONTENTIFY_PROFILE", "").strip().lower()
+PROFILE_DIR = os.environ.get(
+    "AUTOCONTENTIFY_PROFILE_DIR",
+    os.path.join(PROJECT_ROOT, "logs", "profiles")
+)
+SAMPLE_INTERVAL = float(os.environ.get("AUTOCONTENTIFY_PROFILE_INTERVAL", 0.005))
+# Rows kept in each step's hotspot and allocation lists
+TOP_N = 15
+
+if PROFILE_MODE and PROFILE_MODE not in PROFILE_MODES:
+    raise ValueError(f"AUTOCONTENTIFY_PROFILE must be one of {PROFILE_MODES}, not {PROFILE_MODE!r}")
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    if filename.startswith(PROJECT_ROOT):
+        filename = os.path.relpath(filename, PROJECT_ROOT)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _is_project_file(filename):
+    return filename.startswith(PROJECT_ROOT) and "site-packages" not in filename
+
+
+class StackSampler:
+    """
+    Counts the collapsed stack of every other thread at a fixed interval.
+
+    Besides the full stacks, each sample is attributed to its innermost frame in this
+    project's code, which is what the hotspot list reports: idle threads that never enter
+    project code (log listener, HTTP pools) drop out, and time inside libraries counts
+    against the project function that called them.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.project_frames = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                project_frame = None
+                while frame is not None:
+                    label = _frame_label(frame.f_code)
+                    if project_frame is None and _is_project_file(frame.f_code.co_filename):
+                        project_frame = label
+                    stack.append(label)
+                    frame = frame.f_back
+                if project_frame is not None:
+                    self.project_frames[project_frame] += 1
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def hotspots(self, limit=TOP_N):
+        """Innermost project functions by share of samples (wall clock)."""
+        total = sum(self.project_frames.values()) or 1
+        return [{"function": function, "samples": count, "share": round(count / total, 4)}
+                for function, count in self.project_frames.most_common(limit)]
+
+
+def _cprofile_hotspots(profiler, limit=TOP_N):
+    stats = pstats.Stats(profiler)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [
+        {"function": f"{name} ({os.path.basename(filename)}:{line})", "calls": calls,
+         "tottime": round(tottime, 4), "cumtime": round(cumtime, 4)}
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in rows
+    ]
+
+
+@contextlib.contextmanager
+def profile_step(step=None, mode=None, directory=None):
+    """
+    Profile the enclosed block when profiling is enabled; otherwise a no-op.
+
+    `step` defaults to AUTOCONTENTIFY_STEP (set by main.py), `mode` to AUTOCONTENTIFY_PROFILE.
+    """
+    mode = mode or PROFILE_MODE
+    if not mode:
+        yield
+        return
+    step = step or os.environ.get("AUTOCONTENTIFY_STEP", "process")
+    directory = directory or PROFILE_DIR
+
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    sampler = StackSampler().start()
+    profiler = cProfile.Profile() if mode == "cprofile" else None
+    started = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        seconds = time.perf_counter() - started
+        sampler.stop()
+        _, peak = tracemalloc.get_traced_memory()
+        allocations = tracemalloc.take_snapshot().statistics("lineno")[:TOP_N]
+        if started_tracemalloc:
+            tracemalloc.stop()
+
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, f"{step}-{os.getpid()}")
+        sampler.write_collapsed(f"{prefix}.collapsed")
+        report = {
+            "step": step,
+            "mode": mode,
+            "seconds": round(seconds, 3),
+            "samples": sampler.samples,
+            "peak_memory_bytes": peak,
+            "sampled_hotspots": sampler.hotspots(),
+            "top_allocations": [
+                {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                 "bytes": stat.size, "count": stat.count}
+                for stat in allocations
+            ],
+        }
+        if profiler:
+            profiler.dump_stats(f"{prefix}.pstats")
+            report["cprofile_hotspots"] = _cprofile_hotspots(profiler)
+        with open(f"{prefix}.profile.json", "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Profile for {step}: {seconds:.1f}s, peak memory {peak / 2**20:.1f} MiB, written to {prefix}.*")
+
+
+def summarize_profiles(directory=None, limit=10):
+    """Merge the `.profile.json` reports in `directory` into per-step peaks and the run's top sampled hotspots."""
+    directory = directory or PROFILE_DIR
+    steps, samples = [], Counter()
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".profile.json"):
+            continue
+        with open(os.path.join(directory, name), "r") as f:
+            report = json.load(f)
+        steps.append({key: report[key] for key in ("step", "mode", "seconds", "peak_memory_bytes")})
+        for hotspot in report["sampled_hotspots"]:
+            samples[hotspot["function"]] += hotspot["samples"]
+    total = sum(samples.values()) or 1
+    return {
+        "steps": steps,
+        "hotspots": [{"function": function, "samples": count, "share": round(count / total, 4)}
+                     for function, count in samples.most_common(limit)],
+    }
+
+
+def format_profile_summary(summary):
+    lines = ["Profile summary:"]
+    for step in summary["steps"]:
+        lines.append(f"  {step['step']}: {step['seconds']:.1f}s, peak memory {step['peak_memory_bytes'] / 2**20:.1f} MiB")
+    lines.append("  Top hotspots (share of wall-clock samples):")
+    for hotspot in summary["hotspots"]:
+        lines.append(f"    {hotspot['share']:6.1%}  {hotspot['function']}")
+    return "\n".join(lines)
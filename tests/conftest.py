@@ -0,0 +1,25 @@
+"""
+Point the modules' config and state paths at a scratch directory before any of them is imported.
+
+Modules read the Shopify config and their data directories at import time, so this runs at
+collection; variables that are already set (e.g. by CI) are left alone.
+"""
+import json
+import os
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="autocontentify-tests-")
+_shopify_config = os.path.join(_scratch, "shopify_config.json")
+with open(_shopify_config, "w") as f:
+    json.dump({"SHOPIFY_STORE_URL": "https://test-store.myshopify.com", "ACCESS_TOKEN": "test", "BLOG_ID": 1}, f)
+
+for name, value in {
+    "SHOPIFY_CONFIG_PATH": _shopify_config,
+    "OPENAI_API_KEY": "test",
+    "RATE_LIMIT_STATE_DIR": os.path.join(_scratch, "ratelimits"),
+    "AUTOCONTENTIFY_LINK_INDEX_DIR": os.path.join(_scratch, "link_index"),
+    "AUTOCONTENTIFY_KEYWORD_INDEX_DIR": os.path.join(_scratch, "keyword_index"),
+    "AUTOCONTENTIFY_CACHE_VERSION_DIR": os.path.join(_scratch, "cache_versions"),
+    "AUTOCONTENTIFY_JOBS_DIR": os.path.join(_scratch, "jobs"),
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,124 @@
+import random
+
+import pytest
+
+from modules.ecommerce import blog_internal_links
+from modules.ecommerce.blog_internal_links import (
+    ProductLinker, _PythonAutomaton, load_product_linker, save_product_linker, update_product_links,
+)
+
+MAILER_URL = "https://shop.example/products/kraft-mailer"
+TAPE_URL = "https://shop.example/products/paper-tape"
+
+
+def all_matches(terms, text):
+    """Brute force reference: every term ending at each position, longest first."""
+    matches = []
+    for end in range(1, len(text) + 1):
+        lengths = sorted((len(term) for term in terms if text[:end].endswith(term)), reverse=True)
+        matches.extend((end - length, end) for length in lengths)
+    return matches
+
+
+@pytest.fixture(autouse=True)
+def python_automaton(monkeypatch, tmp_path):
+    # Exercise the pure Python automaton even when pyahocorasick is installed
+    monkeypatch.setattr(blog_internal_links, "AHOCORASICK_AVAILABLE", False)
+    monkeypatch.setattr(blog_internal_links, "LINK_INDEX_DIR", str(tmp_path))
+
+
+@pytest.fixture
+def linker():
+    linker = ProductLinker()
+    linker.update_product(1, MAILER_URL, ["Kraft Mailer", "KM-100"])
+    linker.update_product(2, TAPE_URL, ["Paper Tape"])
+    return linker
+
+
+def test_automaton_reports_every_match_longest_first():
+    automaton = _PythonAutomaton(["he", "she", "hers", "his"])
+    assert list(automaton.iter_matches("ushers")) == [(1, 4), (2, 4), (2, 6)]
+
+
+def test_automaton_matches_brute_force_on_random_terms():
+    rng = random.Random(7)
+    for _ in range(50):
+        terms = {"".join(rng.choice("ab") for _ in range(rng.randint(1, 4))) for _ in range(6)}
+        text = "".join(rng.choice("abc") for _ in range(40))
+        assert list(_PythonAutomaton(terms).iter_matches(text)) == all_matches(terms, text)
+
+
+def test_native_automaton_agrees_with_python_automaton():
+    pytest.importorskip("ahocorasick")
+    terms = ["kraft", "kraft mailer", "mailer", "tape"]
+    text = "a kraft mailer and kraft tape"
+    native = blog_internal_links._NativeAutomaton(terms)
+    assert list(native.iter_matches(text)) == list(_PythonAutomaton(terms).iter_matches(text))
+
+
+def test_inject_links_links_names_and_skus_once(linker):
+    html = "<p>Our Kraft Mailer (KM-100) ships flat. Another kraft mailer, with paper tape.</p>"
+    assert linker.inject_links(html) == (
+        f'<p>Our <a href="{MAILER_URL}">Kraft Mailer</a> (KM-100) ships flat. '
+        f'Another kraft mailer, with <a href="{TAPE_URL}">paper tape</a>.</p>'
+    )
+
+
+def test_inject_links_respects_word_boundaries(linker):
+    html = "<p>Kraft Mailers and paper taped boxes</p>"
+    assert linker.inject_links(html) == html
+
+
+def test_inject_links_skips_headings_and_existing_links(linker):
+    html = '<h2>Kraft Mailer</h2><p><a href="/x">Paper Tape</a> then Paper Tape</p>'
+    assert linker.inject_links(html) == (
+        f'<h2>Kraft Mailer</h2><p><a href="/x">Paper Tape</a> then <a href="{TAPE_URL}">Paper Tape</a></p>'
+    )
+
+
+def test_inject_links_falls_back_to_a_shorter_term_at_a_word_boundary():
+    linker = ProductLinker()
+    linker.update_product(1, "/kraft-mailer", ["Kraft Mailer"])
+    linker.update_product(2, "/mailer", ["Mailer"])
+    assert linker.inject_links("<p>Ecokraft Mailer</p>") == '<p>Ecokraft <a href="/mailer">Mailer</a></p>'
+
+
+def test_inject_links_prefers_the_longest_term():
+    linker = ProductLinker()
+    linker.update_product(1, "/kraft", ["Kraft"])
+    linker.update_product(2, "/kraft-mailer", ["Kraft Mailer"])
+    assert linker.inject_links("<p>kraft mailer</p>") == '<p><a href="/kraft-mailer">kraft mailer</a></p>'
+
+
+def test_inject_links_stops_at_max_links(linker):
+    assert linker.inject_links("<p>Kraft Mailer, Paper Tape</p>", max_links=1) == (
+        f'<p><a href="{MAILER_URL}">Kraft Mailer</a>, Paper Tape</p>'
+    )
+
+
+def test_update_product_keeps_terms_owned_by_other_products(linker):
+    linker.update_product(3, "/other", ["Paper Tape", "abc"])
+    assert linker.terms["paper tape"] == TAPE_URL
+    # Terms shorter than MIN_TERM_LENGTH are never indexed
+    assert 3 not in linker.products
+
+
+def test_remove_product_drops_its_terms(linker):
+    linker.remove_product(1)
+    assert set(linker.terms) == {"paper tape"}
+    assert linker.inject_links("<p>Kraft Mailer</p>") == "<p>Kraft Mailer</p>"
+
+
+def test_update_product_links_updates_the_saved_terms(linker):
+    save_product_linker(linker)
+    update_product_links(
+        products=[
+            {"id": 2, "title": "Paper Tape Roll", "handle": "paper-tape-roll", "status": "active",
+             "variants": [{"sku": "PT-200"}]},
+            {"id": 4, "title": "Draft Box", "handle": "draft-box", "status": "draft", "variants": []},
+        ],
+        deleted_ids=[1],
+    )
+    saved = load_product_linker()
+    assert set(saved.terms) == {"paper tape roll", "pt-200"}
+    assert saved.terms["pt-200"].endswith("/products/paper-tape-roll")
@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+from modules.database import keyword_index
+from modules.database.keyword_index import KeywordIndex, get_keyword_index, record_keywords, save_keyword_index
+
+KEYWORDS = [
+    ("eco friendly packaging", 900),
+    ("eco mailer bags", 400),
+    ("ecommerce boxes", 1200),
+    ("compostable mailer", 700),
+    ("kraft paper tape", 300),
+]
+
+
+def build(rows=KEYWORDS):
+    index = KeywordIndex()
+    index.apply(rows)
+    index.rebuild()
+    return index
+
+
+@pytest.fixture
+def index_dir(monkeypatch, tmp_path):
+    """An empty index saved to a fresh directory, with the process-wide index reset."""
+    monkeypatch.setattr(keyword_index, "KEYWORD_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(keyword_index, "_index", None)
+    monkeypatch.setattr(keyword_index, "_index_version", None)
+    save_keyword_index(build([]))
+    return tmp_path
+
+
+def test_prefix_is_case_insensitive_and_ranked_by_searches():
+    index = build()
+    assert index.prefix("ECO") == [("ecommerce boxes", 1200), ("eco friendly packaging", 900), ("eco mailer bags", 400)]
+    assert index.prefix("eco ", limit=1) == [("eco friendly packaging", 900)]
+    assert index.prefix("zzz") == []
+
+
+def test_contains_finds_substrings():
+    assert build().contains("mailer") == [("compostable mailer", 700), ("eco mailer bags", 400)]
+
+
+def test_fuzzy_tolerates_typos():
+    assert build().fuzzy("compostible mailr")[0] == ("compostable mailer", 700)
+    assert build().fuzzy("unrelated words") == []
+
+
+@pytest.mark.parametrize("mode", ["prefix", "contains", "fuzzy"])
+def test_delta_keywords_match_before_and_after_rebuild(mode):
+    index = build()
+    index.upsert("eco mailer boxes", 5000)
+    text = {"prefix": "eco mailer", "contains": "mailer b", "fuzzy": "eco mailer boxs"}[mode]
+    before = getattr(index, mode)(text)
+    assert before[0] == ("eco mailer boxes", 5000)
+    index.rebuild()
+    assert getattr(index, mode)(text) == before
+
+
+def test_search_volume_changes_reorder_results():
+    index = build()
+    index.upsert("eco mailer bags", 2000)
+    assert index.prefix("eco")[0] == ("eco mailer bags", 2000)
+    assert len(index) == len(KEYWORDS)
+
+
+def test_maybe_rebuild_runs_once_the_delta_is_too_large(monkeypatch):
+    monkeypatch.setattr(keyword_index, "MAX_DELTA", 2)
+    index = build()
+    index.apply([("new one", 1), ("new two", 2)])
+    assert len(index.delta) == 2
+    index.upsert("new three", 3)
+    assert index.delta == {}
+    assert index.prefix("new") == [("new three", 3), ("new two", 2), ("new one", 1)]
+
+
+def test_copy_is_independent_of_the_original():
+    index = build()
+    copy = index.copy()
+    copy.apply([("eco mailer bags", 5), ("eco tape", 50)])
+    copy.rebuild()
+    assert index.prefix("eco") == [("ecommerce boxes", 1200), ("eco friendly packaging", 900), ("eco mailer bags", 400)]
+    assert copy.prefix("eco") == [("ecommerce boxes", 1200), ("eco friendly packaging", 900), ("eco tape", 50),
+                                  ("eco mailer bags", 5)]
+
+
+def test_get_keyword_index_replays_new_journal_rows_into_a_new_object(index_dir):
+    first = get_keyword_index()
+    assert len(first) == 0
+    record_keywords([("eco mailer bags", 400)])
+    second = get_keyword_index()
+    assert second is not first
+    assert len(first) == 0
+    assert second.prefix("eco") == [("eco mailer bags", 400)]
+    # Nothing new in the journal: the same object is returned
+    assert get_keyword_index() is second
+
+
+def test_record_keywords_ignores_other_tables(index_dir):
+    record_keywords([("eco mailer bags", 400)], table_name="keywords_test")
+    assert len(get_keyword_index()) == 0
+
+
+def test_concurrent_replays_apply_every_row_once(index_dir):
+    get_keyword_index()
+    record_keywords([(f"keyword {i}", i) for i in range(500)])
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get_keyword_index())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(index) for index in results}) == 1
+    assert len(results[0]) == 500
+    assert results[0].prefix("keyword", limit=1) == [("keyword 499", 499)]
@@ -0,0 +1,135 @@
+import json
+
+import pytest
+
+from modules.api import openai_api
+from modules.api.openai_api import generate_rsa_text, repair_rsa_text, validate_rsa_text
+
+HEADLINES = ["Eco Friendly Packaging", "Compostable Mailers", "Free Shipping Over $50"]
+DESCRIPTIONS = ["Plastic-free shipping supplies for small brands.", "Order samples today and ship greener."]
+
+
+def rsa(headlines=HEADLINES, descriptions=DESCRIPTIONS, **pins):
+    return {"headlines": list(headlines), "descriptions": list(descriptions), **pins}
+
+
+def reply_with(*replies):
+    """Stand-in for chat_with_openai that returns `replies` in order and records the prompts."""
+    prompts = []
+    replies = iter(replies)
+
+    def chat(prompt, client=None, **kwargs):
+        prompts.append(prompt)
+        return json.dumps(next(replies))
+
+    chat.prompts = prompts
+    return chat
+
+
+def test_valid_text_has_no_issues():
+    assert validate_rsa_text(rsa()) == {"headlines": {}, "descriptions": {}}
+
+
+@pytest.mark.parametrize("headline, reason", [
+    ("   ", "empty"),
+    ("A" * 31, "longer than 30 characters"),
+    ("eco friendly packaging", "duplicate"),
+    ("Packaging ★ Deals", "contains a disallowed symbol"),
+    ("Ship greener..", "repeated punctuation"),
+    ("Ship Greener!", "exclamation mark in a headline"),
+])
+def test_invalid_headline_is_reported_with_its_reason(headline, reason):
+    issues = validate_rsa_text(rsa(headlines=HEADLINES + [headline]))
+    assert issues == {"headlines": {3: reason}, "descriptions": {}}
+
+
+def test_exclamation_mark_is_allowed_in_descriptions():
+    issues = validate_rsa_text(rsa(descriptions=DESCRIPTIONS + ["Order today!"]))
+    assert issues["descriptions"] == {}
+
+
+def test_missing_slots_up_to_the_minimum_are_invalid():
+    issues = validate_rsa_text({"headlines": HEADLINES[:1], "descriptions": []})
+    assert issues == {"headlines": {1: "missing", 2: "missing"}, "descriptions": {0: "missing", 1: "missing"}}
+
+
+def test_pins_are_checked_against_positions_and_per_position_limit():
+    issues = validate_rsa_text(rsa(
+        headlines=HEADLINES + ["Recycled Boxes"],
+        headline_pins=[1, 1, 1, 4],
+        description_pins=[None, 2],
+    ))
+    assert issues["headlines"] == {2: "more than 2 assets pinned to position 1", 3: "pinned to invalid position 4"}
+    assert issues["descriptions"] == {}
+
+
+def test_repair_requests_only_the_invalid_slots(monkeypatch):
+    chat = reply_with({"headlines": {"1": "Compostable Mailer Bags"}})
+    monkeypatch.setattr(openai_api, "chat_with_openai", chat)
+
+    repaired = repair_rsa_text(rsa(headlines=[HEADLINES[0], "Mailers!!", HEADLINES[2]]), keywords=["mailers"])
+
+    assert repaired["headlines"] == [HEADLINES[0], "Compostable Mailer Bags", HEADLINES[2]]
+    assert repaired["descriptions"] == DESCRIPTIONS
+    assert len(chat.prompts) == 1
+    assert "slot 1" in chat.prompts[0] and "slot 0" not in chat.prompts[0]
+
+
+def test_repair_skips_the_request_when_everything_is_valid(monkeypatch):
+    chat = reply_with()
+    monkeypatch.setattr(openai_api, "chat_with_openai", chat)
+    assert repair_rsa_text(rsa()) == rsa()
+    assert chat.prompts == []
+
+
+def test_repair_drops_assets_that_stay_invalid_together_with_their_pins(monkeypatch):
+    # Both rounds return another invalid headline for slot 1
+    chat = reply_with({"headlines": {"1": "Still Bad!"}}, {"headlines": {"1": "Nope!"}})
+    monkeypatch.setattr(openai_api, "chat_with_openai", chat)
+
+    repaired = repair_rsa_text(rsa(
+        headlines=[HEADLINES[0], "Bad!", HEADLINES[2], "Recycled Boxes"],
+        headline_pins=[1, 2, None, 3],
+    ))
+
+    assert repaired["headlines"] == [HEADLINES[0], HEADLINES[2], "Recycled Boxes"]
+    assert repaired["headline_pins"] == [1, None, 3]
+    assert len(chat.prompts) == 2
+
+
+def test_repair_truncates_to_the_maximum_count(monkeypatch):
+    monkeypatch.setattr(openai_api, "chat_with_openai", reply_with())
+    descriptions = [f"Sustainable packaging option number {i}." for i in range(6)]
+    assert repair_rsa_text(rsa(descriptions=descriptions))["descriptions"] == descriptions[:4]
+
+
+def test_repair_raises_when_too_few_assets_remain(monkeypatch):
+    monkeypatch.setattr(openai_api, "chat_with_openai", lambda *args, **kwargs: "not json")
+    with pytest.raises(ValueError, match="valid headlines"):
+        repair_rsa_text(rsa(headlines=[HEADLINES[0], "Bad!", "Worse!"]))
+
+
+def test_repair_treats_a_top_level_array_as_a_parse_failure(monkeypatch):
+    chat = reply_with(["Compostable Mailer Bags"])
+    monkeypatch.setattr(openai_api, "chat_with_openai", chat)
+    assert repair_rsa_text(rsa(headlines=HEADLINES + ["Mailers!!"]))["headlines"] == HEADLINES
+    assert len(chat.prompts) == 1
+
+
+def test_repair_ignores_a_field_that_is_not_a_slot_mapping(monkeypatch):
+    chat = reply_with({"headlines": ["Compostable Mailer Bags"]}, {"headlines": {"3": "Recycled Boxes"}})
+    monkeypatch.setattr(openai_api, "chat_with_openai", chat)
+    assert repair_rsa_text(rsa(headlines=HEADLINES + ["Mailers!!"]))["headlines"] == HEADLINES + ["Recycled Boxes"]
+    assert len(chat.prompts) == 2
+
+
+@pytest.mark.parametrize("reply", [HEADLINES, {"headlines": "Eco Friendly Packaging", "descriptions": []}])
+def test_generate_returns_empty_lists_for_a_reply_of_the_wrong_shape(monkeypatch, reply):
+    monkeypatch.setattr(openai_api, "chat_with_openai", reply_with(reply))
+    assert generate_rsa_text(keywords=["mailers"]) == {"headlines": [], "descriptions": []}
+
+
+def test_generate_repairs_the_parsed_text(monkeypatch):
+    chat = reply_with(rsa(headlines=HEADLINES + ["Mailers!!"]), {"headlines": {"3": "Recycled Boxes"}})
+    monkeypatch.setattr(openai_api, "chat_with_openai", chat)
+    assert generate_rsa_text(keywords=["mailers"]) == rsa(headlines=HEADLINES + ["Recycled Boxes"])